@@ -5,7 +5,160 @@ from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.urls import path
 from django import forms
-from .models import CustomUser, Poll, Option, Vote, Team, OTPLog
+from django.contrib.admin.utils import get_last_value_from_parameters
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from .models import CustomUser, Poll, Option, Vote, ArchivedVote, Ballot, Team, OTPLog, PollResultSnapshot
+
+
+# --- Changelists for large tables ---
+#
+# Vote, ArchivedVote, OTPLog and CustomUser grow with every election. Their
+# changelists join the displayed foreign keys up front, load only the listed
+# columns, filter on foreign keys through the admin's autocomplete instead of
+# rendering one link per poll, and skip the exact COUNT(*) of the whole table.
+
+# Below this many rows an exact count is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 10000
+# How long a table size estimate is reused
+ROW_COUNT_CACHE_SECONDS = 300
+
+
+def _table_statistics_count(connection, table):
+    """Rows in table as of SQLite's last ANALYZE, or None without statistics"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if not cursor.fetchone():
+            return None
+        # One row per index (or one for an unindexed table), each starting
+        # with the number of rows in the table
+        cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+        counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+    return max(counts, default=None)
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Approximate row count of model's table, kept in the default cache for
+    ROW_COUNT_CACHE_SECONDS.
+
+    On SQLite it is the count ANALYZE left in sqlite_stat1, when it has
+    run; otherwise an exact COUNT(*). Either is off by the rows added or
+    deleted since, which EstimatedCountPaginator corrects on the last page.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+
+    def count():
+        if connection.vendor == 'sqlite':
+            estimate = _table_statistics_count(connection, table)
+            if estimate is not None:
+                return estimate
+        return model._default_manager.using(using).count()
+
+    return caches['default'].get_or_set(f'voting.admin.row_count:{using}:{table}', count, ROW_COUNT_CACHE_SECONDS)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the table size estimate for an unfiltered changelist of a large table"""
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate > ESTIMATED_COUNT_THRESHOLD:
+                self.estimated = True
+                return estimate
+        return super().count
+
+    def page(self, number):
+        page = super().page(number)
+        # The estimate only shows on the last page, or a short page that
+        # ends the table early: count those exactly, and fetch the page again
+        # if the estimate cut it short or it lies past the end
+        if self.estimated and (page.number == self.num_pages or len(page) < self.per_page):
+            estimate = self.count
+            self.estimated = False
+            self.__dict__['count'] = self.object_list.count()
+            self.__dict__.pop('num_pages', None)
+            if self.count != estimate:
+                page = super().page(min(number, self.num_pages))
+        return page
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """Foreign key filter picked with the admin autocomplete instead of listing the whole related table"""
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.widget = AutocompleteSelect(field, model_admin.admin_site)
+        self.widget.choices = field.formfield().choices
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # Only the reset link; the related rows come from the autocomplete view
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': _('All'),
+        }
+
+    def widget_html(self):
+        return self.widget.render(
+            self.lookup_kwarg,
+            self.lookup_val,
+            attrs={'id': f'filter-{self.field_path}', 'data-filter-lookup': self.lookup_kwarg},
+        )
+
+
+class PrunedChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # The paginator may have corrected its estimated count on this page,
+        # and moved back to the last page if this one was past the end
+        self.result_count = self.paginator.count
+        self.multi_page = self.result_count > self.list_per_page
+        self.page_num = min(self.page_num, self.paginator.num_pages)
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if self.model_admin.list_only:
+            queryset = queryset.only(*self.model_admin.list_only)
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """ModelAdmin defaults for tables with up to millions of rows"""
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    paginator = EstimatedCountPaginator
+    # Columns the changelist loads (with list_select_related relations); None loads all
+    list_only = None
+
+    def get_changelist(self, request, **kwargs):
+        return PrunedChangeList
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, tuple) and issubclass(list_filter[1], AutocompleteFilter):
+                field = self.model._meta.get_field(list_filter[0])
+                return media + AutocompleteSelect(field, self.admin_site).media
+        return media
+
 
 class SetPasswordForm(forms.Form):
     """Simple form to set user password"""
@@ -30,11 +183,12 @@ class SetPasswordForm(forms.Form):
 
         return cleaned_data
 
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdmin, UserAdmin):
     """Custom admin for CustomUser model"""
     list_display = ['username', 'full_name', 'phone_number', 'user_type', 'is_phone_verified', 'created_at']
     list_filter = ['user_type', 'is_phone_verified', 'is_staff', 'created_at']
     search_fields = ['username', 'phone_number', 'full_name']
+    list_only = ['id', 'username', 'full_name', 'phone_number', 'user_type', 'is_phone_verified', 'created_at']
 
     fieldsets = UserAdmin.fieldsets + (
         ('Custom Fields', {
@@ -103,31 +257,83 @@ admin.site.register(CustomUser, CustomUserAdmin)
 # Optional: Register other models for admin viewing
 @admin.register(Poll)
 class PollAdmin(admin.ModelAdmin):
-    list_display = ['title', 'status', 'start_time', 'end_time', 'created_by', 'created_at']
-    list_filter = ['status', 'created_at']
+    list_display = ['title', 'status', 'ballot_type', 'start_time', 'end_time', 'created_by', 'created_at']
+    list_select_related = ['created_by']
+    list_filter = ['status', 'ballot_type', 'created_at']
     search_fields = ['title', 'description']
     date_hierarchy = 'created_at'
 
 @admin.register(Option)
 class OptionAdmin(admin.ModelAdmin):
     list_display = ['option_text', 'poll', 'order', 'created_at']
+    list_select_related = ['poll']
     list_filter = ['poll', 'created_at']
     search_fields = ['option_text', 'poll__title']
 
 @admin.register(Vote)
-class VoteAdmin(admin.ModelAdmin):
-    list_display = ['user', 'poll', 'option', 'voted_at']
-    list_filter = ['poll', 'voted_at']
+class VoteAdmin(LargeTableAdmin):
+    list_display = ['user', 'poll', 'option_text', 'voted_at']
+    list_select_related = ['user', 'poll', 'option']
+    list_only = [
+        'id', 'voted_at', 'user', 'poll', 'option',
+        'user__username', 'user__full_name', 'user__phone_number', 'user__user_type',
+        'poll__title', 'option__option_text',
+    ]
+    list_filter = [('poll', AutocompleteFilter), ('user', AutocompleteFilter), 'voted_at']
     search_fields = ['user__phone_number', 'user__username', 'poll__title']
-    date_hierarchy = 'voted_at'
+    autocomplete_fields = ['user', 'poll', 'option']
+
+    @admin.display(description='Option', ordering='option__option_text')
+    def option_text(self, obj):
+        # Option.__str__ would also fetch the option's poll
+        return obj.option.option_text
+
+@admin.register(ArchivedVote)
+class ArchivedVoteAdmin(VoteAdmin):
+    """Votes moved out of Vote by voting.archive; read-only"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Ballot)
+class BallotAdmin(LargeTableAdmin):
+    """Ranked and approval ballots; cast through voting.ballots, read-only here"""
+    list_display = ['user', 'poll', 'cast_at']
+    list_select_related = ['user', 'poll']
+    list_only = [
+        'id', 'cast_at', 'user', 'poll',
+        'user__username', 'user__full_name', 'user__phone_number', 'user__user_type', 'poll__title',
+    ]
+    list_filter = [('poll', AutocompleteFilter), ('user', AutocompleteFilter), 'cast_at']
+    search_fields = ['user__phone_number', 'user__username', 'poll__title']
+    readonly_fields = ['poll', 'user', 'choices', 'cast_at', 'ip_address']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
     pass
 
+@admin.register(PollResultSnapshot)
+class PollResultSnapshotAdmin(admin.ModelAdmin):
+    """Snapshots are written by voting.results when a poll closes, never by hand"""
+    list_display = ['poll', 'total_votes', 'eligible_voters', 'created_at']
+    list_select_related = ['poll']
+    readonly_fields = ['poll', 'total_votes', 'eligible_voters', 'tallies', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
 # In admin.py
 
-class OTPLogAdmin(admin.ModelAdmin):
+class OTPLogAdmin(LargeTableAdmin):
     list_display = ['phone_number', 'otp_code', 'created_at', 'is_used', 'attempts']
     list_filter = ['is_used', 'created_at']
     search_fields = ['phone_number', 'otp_code']
@@ -0,0 +1,164 @@
+# admission.py
+"""
+Admission control for election peaks.
+
+When a poll opens every member logs in and votes within minutes. Without
+a cap the WSGI worker takes on every request, all of them slow down
+together and clients time out before anything completes. Each worker
+therefore keeps a count of requests in flight and admits a request only
+while that count is below the limit of its priority class:
+
+    critical  vote submissions, logins and OTP checks   the whole capacity
+    normal    everything else                           NORMAL_SHARE of it
+    low       admin listings, exports and PDFs          LOW_SHARE of it
+
+so the last slots are always held back for votes and logins. A request
+that doesn't fit gets an immediate 503 with a jittered Retry-After and
+never touches the session store or the database. AdmissionControlMiddleware
+wires it in; ADMISSION_MAX_IN_FLIGHT = 0 turns it off.
+"""
+import json
+import math
+import random
+from threading import Lock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from .metrics import ADMISSION_SHED
+from .utils import wants_json
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+
+# (method, URL name) of the requests an election can't do without
+CRITICAL_VIEWS = {
+    ('POST', 'login'),
+    ('POST', 'verify_otp'),
+    ('POST', 'poll_detail'),
+}
+# Admin pages that can wait for the peak to pass
+LOW_VIEWS = {
+    'admin_dashboard',
+    'poll_management',
+    'registered_users',
+    'print_users_pdf',
+    'poll_vote_details',
+    'poll_votes_export',
+    'team_management',
+}
+
+
+def get_admission_settings():
+    voting_settings = settings.VOTING_SETTINGS
+    return {
+        'max_in_flight': voting_settings.get('ADMISSION_MAX_IN_FLIGHT', 32),
+        'normal_share': voting_settings.get('ADMISSION_NORMAL_SHARE', 0.75),
+        'low_share': voting_settings.get('ADMISSION_LOW_SHARE', 0.25),
+        'retry_after': voting_settings.get('ADMISSION_RETRY_AFTER_SECONDS', 2),
+    }
+
+
+def classify(request):
+    """Priority class of request, from its method and URL name"""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return NORMAL
+    if (request.method, match.url_name) in CRITICAL_VIEWS:
+        return CRITICAL
+    if match.url_name in LOW_VIEWS or 'admin' in match.namespaces:
+        return LOW
+    return NORMAL
+
+
+class AdmissionController:
+    """Per-process count of requests in flight, with a limit per priority"""
+
+    def __init__(self, max_in_flight, normal_share, low_share):
+        self.limits = {
+            CRITICAL: max_in_flight,
+            NORMAL: max(1, math.ceil(max_in_flight * normal_share)),
+            LOW: max(1, math.ceil(max_in_flight * low_share)),
+        }
+        self.in_flight = 0
+        self._lock = Lock()
+
+    def try_acquire(self, priority):
+        with self._lock:
+            if self.in_flight >= self.limits[priority]:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+class ReleasingIterator:
+    """
+    Streaming content that gives its admission slot back when closed.
+
+    A streamed export keeps working after the view returns, so its slot
+    is held until the server closes the response rather than released
+    with the view.
+    """
+
+    def __init__(self, iterator, release):
+        self.iterator = iterator
+        self._release = release
+
+    def __iter__(self):
+        return iter(self.iterator)
+
+    def close(self):
+        # The response has already registered the original iterator's close()
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+
+SHED_PAGE = """<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>الخادم مشغول</title></head>
+<body style="font-family: sans-serif; text-align: center; padding: 3rem 1rem;">
+<h1>الخادم مشغول حالياً</h1>
+<p>يصوّت عدد كبير من الأعضاء في هذه اللحظة، يرجى المحاولة بعد قليل.</p>
+<p><a href="javascript:history.back()">رجوع</a></p>
+{retry_script}
+</body>
+</html>
+"""
+
+# Reload with jittered exponential backoff; base.html clears the
+# attempt counter once the page loads normally
+RETRY_SCRIPT = """<p>ستتم إعادة المحاولة تلقائياً...</p>
+<script>
+    const key = 'retry:' + location.pathname;
+    const attempt = Number(sessionStorage.getItem(key) || 0);
+    sessionStorage.setItem(key, attempt + 1);
+    const delay = Math.min(60, {retry_after} * 2 ** attempt) * (0.5 + Math.random());
+    setTimeout(() => location.reload(), delay * 1000);
+</script>"""
+
+
+def shed_response(request, priority, retry_after):
+    """503 for a request turned away at admission"""
+    ADMISSION_SHED.inc(priority=priority)
+    # Spread the retries of everyone shed in the same second
+    retry_after = random.randint(retry_after, 2 * retry_after)
+
+    if wants_json(request):
+        body = json.dumps({'success': False, 'message': 'Server busy', 'retry_after': retry_after})
+        response = HttpResponse(body, status=503, content_type='application/json')
+    else:
+        # Only GETs retry on their own; resending a form is left to the user
+        script = RETRY_SCRIPT.format(retry_after=retry_after) if request.method == 'GET' else ''
+        response = HttpResponse(SHED_PAGE.format(retry_script=script), status=503)
+    response['Retry-After'] = str(retry_after)
+    response['Cache-Control'] = 'no-store'
+    return response
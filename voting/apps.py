@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class VotingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'voting'
+
+    def ready(self):
+        # Connect the query wrappers before any database connection is opened
+        from . import metrics, querylog  # noqa: F401
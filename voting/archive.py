@@ -0,0 +1,113 @@
+# archive.py
+"""
+Vote archival.
+
+Votes of polls closed for longer than VOTING_SETTINGS['ARCHIVE_AFTER_DAYS']
+are moved from Vote to ArchivedVote, a chunk per transaction, so the live
+table and its indexes only hold recent polls and an archive run never
+holds the write lock for long. The poll's PollResultSnapshot is taken
+before the first vote moves, so its results never need the votes again;
+the archived rows stay queryable through votes_for() and the admin.
+An interrupted run leaves archived_at unset and simply resumes.
+
+Ranked and approval polls keep their ballots in Ballot, one short row per
+voter, and are not archived.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ArchivedVote, Poll, PollResultSnapshot, Vote
+
+VOTE_FIELDS = ('id', 'poll_id', 'user_id', 'option_id', 'voted_at', 'ip_address')
+
+
+def _settings():
+    voting_settings = getattr(settings, 'VOTING_SETTINGS', {})
+    return voting_settings.get('ARCHIVE_AFTER_DAYS', 90), voting_settings.get('ARCHIVE_CHUNK_SIZE', 500)
+
+
+def votes_for(poll):
+    """The poll's votes, from whichever table holds them"""
+    model = ArchivedVote if poll.archived_at else Vote
+    return model.objects.filter(poll=poll)
+
+
+def archived_vote_total():
+    """Votes held in the archive, read from the snapshots rather than counted"""
+    return (
+        PollResultSnapshot.objects.filter(poll__archived_at__isnull=False)
+        .aggregate(total=Sum('total_votes'))['total'] or 0
+    )
+
+
+def archivable_polls(days=None):
+    """Closed polls whose end time is more than days ago and are not archived yet"""
+    if days is None:
+        days, _ = _settings()
+    return Poll.objects.filter(
+        status='closed',
+        end_time__lt=timezone.now() - timedelta(days=days),
+        archived_at__isnull=True,
+        ballot_type=Poll.BALLOT_SINGLE,
+    )
+
+
+def _move_chunk(source, target, poll, chunk_size):
+    with transaction.atomic():
+        rows = list(
+            source.objects.filter(poll=poll).order_by('pk').values(*VOTE_FIELDS)[:chunk_size]
+        )
+        if rows:
+            votes = target.objects.bulk_create([target(**row) for row in rows])
+            if target._meta.get_field('voted_at').auto_now_add:
+                # bulk_create stamped the restored votes with the current
+                # time; put back when they were cast
+                for vote, row in zip(votes, rows):
+                    vote.voted_at = row['voted_at']
+                target.objects.bulk_update(votes, ['voted_at'])
+            source.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+    return len(rows)
+
+
+def _move_all(source, target, poll, chunk_size, pause):
+    moved = 0
+    while chunk := _move_chunk(source, target, poll, chunk_size):
+        moved += chunk
+        if pause:
+            # Let request threads get at the database between chunks
+            time.sleep(pause)
+    return moved
+
+
+def archive_poll(poll, chunk_size=None, pause=0):
+    """Move a closed poll's votes to the archive; returns the number moved"""
+    from .results import take_snapshot
+
+    if poll.status != 'closed':
+        raise ValueError(f'Poll {poll.pk} is not closed')
+    if poll.uses_ballots():
+        raise ValueError(f'Poll {poll.pk} keeps ranked or approval ballots, which are not archived')
+    if chunk_size is None:
+        _, chunk_size = _settings()
+
+    take_snapshot(poll)
+    moved = _move_all(Vote, ArchivedVote, poll, chunk_size, pause)
+    poll.archived_at = timezone.now()
+    Poll.objects.filter(pk=poll.pk).update(archived_at=poll.archived_at)
+    return moved
+
+
+def restore_poll(poll, chunk_size=None, pause=0):
+    """Move an archived poll's votes back to Vote, e.g. before reopening it"""
+    if chunk_size is None:
+        _, chunk_size = _settings()
+
+    moved = _move_all(ArchivedVote, Vote, poll, chunk_size, pause)
+    poll.archived_at = None
+    Poll.objects.filter(pk=poll.pk).update(archived_at=None)
+    return moved
@@ -0,0 +1,176 @@
+# async_views.py
+"""
+Native async versions of the read-heavy views.
+
+They are routed instead of their counterparts in views.py when
+VOTING_SETTINGS['ASYNC_VIEWS'] is set (the default under votingapp/asgi.py),
+so ASGI workers serve these pages without a thread hop per request.
+Everything the templates need is fetched with the async ORM before
+rendering, since templates must not hit the database from the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.templatetags.static import static
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from datetime import timedelta
+
+from .conditional import (
+    conditional_page, poll_results_etag, team_detail_etag, team_detail_last_modified,
+    teams_list_etag, teams_list_last_modified, dashboard_etag,
+)
+from .ballots import ballot_count_subquery
+from .models import Ballot, CustomUser, Poll, Vote, OTPLog, Team
+from .otp import astore_otp
+from .results import aget_results
+from .rollups import ateam_poll_breakdown
+from .utils import phone_key, send_sms_otp
+
+
+async def _get_user(request):
+    """Resolve the user once and make it visible to the template context processors"""
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+@login_required
+@conditional_page(etag_func=teams_list_etag, last_modified_func=teams_list_last_modified)
+async def teams_view(request):
+    """View all registered teams - Public view"""
+    user = await _get_user(request)
+    teams = [team async for team in Team.objects.filter(is_active=True).order_by('created_at')]
+
+    context = {
+        'teams': teams,
+        'can_manage_teams': user.is_admin(),
+    }
+
+    return render(request, 'teams/teams_list.html', context)
+
+
+@login_required
+@conditional_page(etag_func=team_detail_etag, last_modified_func=team_detail_last_modified)
+async def team_detail_view(request, team_id):
+    """View team details"""
+    user = await _get_user(request)
+    team = await aget_object_or_404(Team.objects.prefetch_related('options__poll'), id=team_id)
+    poll_tallies = await ateam_poll_breakdown(team)
+
+    context = {
+        'team': team,
+        'team_vote_count': sum(tally.vote_count for tally in poll_tallies),
+        'poll_tallies': poll_tallies,
+        'can_edit': user.can_create_polls(),
+    }
+
+    return render(request, 'teams/team_detail.html', context)
+
+
+@login_required
+@conditional_page(etag_func=dashboard_etag)
+async def dashboard_view(request):
+    """User dashboard - redirect admins to their appropriate pages"""
+    user = await _get_user(request)
+
+    # Super admins go to admin dashboard
+    if user.user_type == 'super_admin':
+        return redirect('admin_dashboard')
+
+    # View admins should go to poll management, not user dashboard
+    if user.user_type == 'view_admin':
+        return redirect('poll_management')
+
+    now = timezone.now()
+    active_polls = [
+        poll async for poll in Poll.objects.filter(
+            start_time__lte=now,
+            end_time__gte=now,
+            status='active'
+        ).annotate(
+            total_votes=Count('votes') + Coalesce(ballot_count_subquery(), 0)
+        ).order_by('-created_at')
+    ]
+
+    upcoming_polls = [
+        poll async for poll in Poll.objects.filter(
+            start_time__gt=now,
+            status='scheduled'
+        ).order_by('start_time')
+    ]
+
+    voted_poll_ids = [
+        poll_id async for poll_id in
+        Vote.objects.filter(user=user).order_by().values_list('poll_id', flat=True)
+        .union(Ballot.objects.filter(user=user).order_by().values_list('poll_id', flat=True))
+    ]
+
+    context = {
+        'active_polls': active_polls,
+        'upcoming_polls': upcoming_polls,
+        'voted_poll_ids': voted_poll_ids,
+    }
+
+    return render(request, 'dashboard/user_dashboard.html', context)
+
+
+@login_required
+@conditional_page(etag_func=poll_results_etag)
+async def poll_results_view(request, poll_id):
+    """Poll results view - ONLY for admins"""
+    user = await _get_user(request)
+    poll = await aget_object_or_404(Poll, id=poll_id)
+
+    if not user.is_admin():
+        messages.error(request, 'فقط المسؤولون يمكنهم عرض النتائج')
+        return redirect('dashboard')
+
+    context = {
+        'poll': poll,
+        'user_vote': None,
+        'logo_url': request.build_absolute_uri(static('club-logo.png')),
+        **await aget_results(poll),
+    }
+
+    return render(request, 'polls/poll_results.html', context)
+
+
+# ==================== AJAX Views ====================
+
+@csrf_exempt
+async def resend_otp_view(request):
+    """Resend OTP"""
+    if request.method == 'POST':
+        phone_number = await request.session.aget('registration_phone')
+
+        if not phone_number:
+            return JsonResponse({'success': False, 'message': 'Session expired'})
+
+        # Check rate limiting (max 3 OTPs per 10 minutes)
+        recent_otps = await OTPLog.objects.filter(
+            phone_number=phone_number,
+            created_at__gte=timezone.now() - timedelta(minutes=10)
+        ).acount()
+
+        if recent_otps >= 3:
+            return JsonResponse({'success': False, 'message': 'Too many OTP requests. Please wait.'})
+
+        if not await CustomUser.objects.filter(phone_key=phone_key(phone_number)).aexists():
+            return JsonResponse({'success': False, 'message': 'User not found'})
+
+        # The SMS API call blocks on the network, keep it off the event loop
+        # and out of the shared sync thread
+        success, otp_or_error = await sync_to_async(send_sms_otp, thread_sensitive=False)(phone_number)
+
+        if success:
+            await astore_otp(phone_number, otp_or_error)
+            return JsonResponse({'success': True, 'message': 'OTP sent successfully'})
+        else:
+            return JsonResponse({'success': False, 'message': f'Failed to send OTP: {otp_or_error}'})
+
+    return JsonResponse({'success': False, 'message': 'Invalid request'})
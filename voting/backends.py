@@ -0,0 +1,72 @@
+# backends.py
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+
+from .models import CustomUser
+from .utils import phone_key
+
+# Reasons stored on request.login_failure when a known account is refused
+LOGIN_INVALID_PHONE = 'invalid_phone'
+LOGIN_PHONE_NOT_VERIFIED = 'phone_not_verified'
+LOGIN_USE_PHONE = 'use_phone'
+
+# Columns needed to check the password, run the verified/admin checks and log in
+LOGIN_FIELDS = (
+    'id', 'username', 'phone_number', 'phone_key', 'password', 'user_type', 'is_phone_verified', 'is_active',
+)
+
+
+def _reject(request, reason):
+    """Record why the login was refused and stop trying other backends"""
+    if request is not None:
+        request.login_failure = reason
+    raise PermissionDenied(reason)
+
+
+def _is_phone_identifier(identifier):
+    return identifier.replace(' ', '').replace('-', '').lstrip('+').isdigit()
+
+
+class PhoneOrUsernameBackend(ModelBackend):
+    """
+    Authenticate regular users by phone number and admins by username.
+
+    The account is fetched once with only the columns needed, and the
+    phone-verified / admin checks run on that same row. A phone number
+    also matches an admin's username, since create_admin_user stores the
+    admin's phone number as their username.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get('login_identifier')
+        if not username or password is None:
+            return None
+
+        is_phone = _is_phone_identifier(username)
+        key = phone_key(username) if is_phone else None
+        lookup = Q(username=username)
+        if key is not None:
+            lookup |= Q(phone_key=key)
+
+        candidates = list(CustomUser.objects.only(*LOGIN_FIELDS).filter(lookup)[:2])
+        if not candidates:
+            if is_phone and key is None:
+                _reject(request, LOGIN_INVALID_PHONE)
+            # Run the default password hasher once to reduce the timing
+            # difference between an existing and a nonexistent user
+            CustomUser().set_password(password)
+            return None
+        # The number's owner wins over an account that only has it as username
+        user = next((candidate for candidate in candidates if key is not None and candidate.phone_key == key), candidates[0])
+
+        if not user.is_admin():
+            if key is None or user.phone_key != key:
+                _reject(request, LOGIN_USE_PHONE)
+            if not user.is_phone_verified:
+                _reject(request, LOGIN_PHONE_NOT_VERIFIED)
+
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
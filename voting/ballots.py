@@ -0,0 +1,93 @@
+# ballots.py
+"""
+Ranked-choice and approval ballots.
+
+A Ballot stores a voter's choices as bytes, one per chosen option: the
+option's position in the poll's option order. A ranked ballot lists them
+most preferred first, an approval ballot in ascending order. Twenty
+options fit in at most twenty bytes, and voting.tally turns a poll's
+ballots into a NumPy matrix straight from those bytes.
+
+Options are fixed once a poll is created, so positions stay valid for
+the poll's lifetime.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from .ingest import VOTE_CREATED, VOTE_DUPLICATE
+from .models import Ballot, Poll
+from .participation import record_voters
+
+# Marks an unused rank in the tally matrix, so positions stop at 254
+PAD = 0xFF
+
+
+class BallotError(Exception):
+    """The submitted choices don't form a valid ballot; the message is shown to the voter"""
+
+
+def ballot_options(poll):
+    """poll's options in ballot position order"""
+    return list(poll.options.order_by('order', 'created_at', 'id'))
+
+
+def encode_choices(ballot_type, option_ids, options):
+    """
+    Ballot bytes for the submitted option ids.
+
+    option_ids is in the voter's order of preference for ranked ballots;
+    blank entries (unused ranks) are skipped.
+    """
+    positions = {str(option.id): position for position, option in enumerate(options)}
+    chosen = []
+    for option_id in option_ids:
+        if not option_id:
+            continue
+        if option_id not in positions:
+            raise BallotError('الخيار المحدد غير صحيح')
+        chosen.append(positions[option_id])
+
+    if not chosen:
+        raise BallotError('الرجاء اختيار خيار واحد على الأقل')
+    if len(set(chosen)) != len(chosen):
+        raise BallotError('لا يمكن اختيار الخيار نفسه أكثر من مرة')
+    if max(chosen) >= PAD:
+        raise BallotError('Too many options for a ranked or approval ballot')
+
+    if ballot_type == Poll.BALLOT_APPROVAL:
+        chosen.sort()
+    return bytes(chosen)
+
+
+def decode_choices(choices, options):
+    """The options chosen on a ballot, in ballot order"""
+    return [options[position] for position in bytes(choices) if position < len(options)]
+
+
+def describe_choices(ballot_type, choices, options):
+    """A ballot's choices as one line of text: ranked ones as 'A > B', approvals as 'A, B'"""
+    separator = ' > ' if ballot_type == Poll.BALLOT_RANKED else ', '
+    return separator.join(option.option_text for option in decode_choices(choices, options))
+
+
+def cast_ballot(poll, user, choices, ip_address=None):
+    """Store a ballot and return VOTE_CREATED or VOTE_DUPLICATE"""
+    ballot = Ballot(poll=poll, user=user, choices=choices, ip_address=ip_address)
+    try:
+        with transaction.atomic():
+            ballot.save(force_insert=True)
+            record_voters([ballot])
+    except IntegrityError:
+        return VOTE_DUPLICATE
+    return VOTE_CREATED
+
+
+def ballot_count_subquery():
+    """Ballots of the outer Poll, for annotating polls next to Count('votes')"""
+    return Subquery(
+        Ballot.objects.filter(poll=OuterRef('pk'))
+        .order_by()
+        .values('poll')
+        .annotate(n=Count('id'))
+        .values('n')[:1]
+    )
@@ -0,0 +1,272 @@
+# conditional.py
+"""
+Conditional GET (ETag / Last-Modified) support for the read-heavy pages.
+
+Each page gets a version stamp computed with a single aggregate query
+(poll/team ``updated_at``, vote count, last vote time) so that a timed
+refresh of an unchanged page costs one small query and a 304 instead of
+a full render.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib import messages
+from django.db.models import CharField, Count, Max, OuterRef, Subquery, Sum, Value
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .ballots import ballot_count_subquery
+from .models import Ballot, CustomUser, Poll, Team, TeamPollTally, Vote
+
+
+def _make_etag(request, *parts):
+    """Hash the version parts together with who is looking at the page"""
+    user = request.user
+    parts = (
+        user.pk,
+        user.user_type,
+        # Forms on the page embed the CSRF token, so a rotated token must
+        # invalidate the cached copy
+        request.META.get('CSRF_COOKIE', ''),
+        request.GET.urlencode(),
+    ) + parts
+    return hashlib.md5('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def _is_cacheable(request):
+    """Pages with pending flash messages must be rendered to show them"""
+    if not request.user.is_authenticated:
+        return False
+    return len(messages.get_messages(request)) == 0
+
+
+def _minute_bucket():
+    """Pages that depend on the clock (timeuntil, is_active) change every minute"""
+    return timezone.now().strftime('%Y%m%d%H%M')
+
+
+def _verified_users_subquery():
+    return Subquery(
+        CustomUser.objects.filter(user_type='user', is_phone_verified=True)
+        .order_by()
+        .values('user_type')
+        .annotate(n=Count('id'))
+        .values('n')[:1]
+    )
+
+
+def _memoize_on_request(func):
+    """Both ETag and Last-Modified are derived from the same row, query it once"""
+    attr = f'_version_{func.__name__}'
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        key = (attr, args, tuple(sorted(kwargs.items())))
+        cache = request.__dict__.setdefault('_conditional_versions', {})
+        if key not in cache:
+            cache[key] = func(request, *args, **kwargs)
+        return cache[key]
+    return wrapper
+
+
+# ==================== Version stamps ====================
+
+@_memoize_on_request
+def poll_version(request, poll_id):
+    """
+    (status, updated_at, vote_count, last_vote_at, ballot_count, last_ballot_at,
+    eligible_voters) for one poll.
+
+    A closed poll with a results snapshot cannot change until it is reopened,
+    which bumps updated_at, so (status, updated_at, snapshot time) is enough.
+    """
+    header = Poll.objects.filter(id=poll_id).values_list(
+        'status', 'updated_at', 'result_snapshot__created_at'
+    ).first()
+    if header is None:
+        return None
+    if header[0] == 'closed' and header[2] is not None:
+        return header
+
+    return (
+        Poll.objects.filter(id=poll_id)
+        .annotate(
+            vote_count=Count('votes'),
+            last_vote_at=Max('votes__voted_at'),
+            ballot_count=ballot_count_subquery(),
+            last_ballot_at=Subquery(
+                Ballot.objects.filter(poll=OuterRef('pk')).order_by('-cast_at').values('cast_at')[:1]
+            ),
+            eligible_voters=_verified_users_subquery(),
+        )
+        .values_list(
+            'status', 'updated_at', 'vote_count', 'last_vote_at',
+            'ballot_count', 'last_ballot_at', 'eligible_voters',
+        )
+        .first()
+    )
+
+
+@_memoize_on_request
+def team_version(request, team_id):
+    """(is_active, updated_at, option_count, vote_count, polls_updated_at) for one team"""
+    return (
+        Team.objects.filter(id=team_id)
+        .annotate(
+            option_count=Count('options', distinct=True),
+            vote_count=Subquery(
+                TeamPollTally.objects.filter(team=OuterRef('pk'))
+                .values('team')
+                .annotate(total=Sum('vote_count'))
+                .values('total')
+            ),
+            polls_updated_at=Max('options__poll__updated_at'),
+        )
+        .values_list('is_active', 'updated_at', 'option_count', 'vote_count', 'polls_updated_at')
+        .first()
+    )
+
+
+@_memoize_on_request
+def teams_list_version(request):
+    """(team_count, last_updated_at) for the active teams listing"""
+    return tuple(
+        Team.objects.filter(is_active=True)
+        .aggregate(count=Count('id'), last_updated=Max('updated_at'))
+        .values()
+    )
+
+
+def _counts_and_latest(*parts):
+    """
+    (row count, latest value of field) of each (queryset, field) part,
+    flattened, from one UNION ALL query of per-part aggregates.
+    """
+    queries = [
+        queryset.order_by()
+        .annotate(part=Value(str(index), output_field=CharField()))
+        .values('part')
+        .annotate(n=Count('pk'), latest=Max(field))
+        .values_list('part', 'n', 'latest')
+        for index, (queryset, field) in enumerate(parts)
+    ]
+    # The constant part label adds no GROUP BY, so every part yields one row
+    rows = {int(part): (n, latest) for part, n, latest in queries[0].union(*queries[1:], all=True)}
+    return tuple(value for index in range(len(parts)) for value in rows.get(index, (0, None)))
+
+
+def _polls_list_parts():
+    return [(Poll.objects.all(), 'updated_at'), (Vote.objects.all(), 'voted_at'), (Ballot.objects.all(), 'cast_at')]
+
+
+@_memoize_on_request
+def polls_list_version(request):
+    """(poll_count, last_updated_at, vote_count, last_vote_at, ballot_count, last_ballot_at) across all polls"""
+    return _counts_and_latest(*_polls_list_parts())
+
+
+@_memoize_on_request
+def dashboard_version(request):
+    """polls_list_version() followed by the user's (vote_count, last_vote_at, ballot_count, last_ballot_at)"""
+    return _counts_and_latest(
+        *_polls_list_parts(),
+        (Vote.objects.filter(user=request.user), 'voted_at'),
+        (Ballot.objects.filter(user=request.user), 'cast_at'),
+    )
+
+
+# ==================== ETag / Last-Modified functions ====================
+
+def poll_results_etag(request, poll_id):
+    if not _is_cacheable(request) or not request.user.is_admin():
+        return None
+    version = poll_version(request, poll_id)
+    if version is None:
+        return None
+    # poll.is_active() flips when end_time passes without a status change
+    return _make_etag(request, 'poll_results', poll_id, *version, _minute_bucket())
+
+
+def team_detail_etag(request, team_id):
+    if not _is_cacheable(request):
+        return None
+    version = team_version(request, team_id)
+    if version is None:
+        return None
+    return _make_etag(request, 'team_detail', team_id, *version)
+
+
+def team_detail_last_modified(request, team_id):
+    if not _is_cacheable(request):
+        return None
+    version = team_version(request, team_id)
+    if version is None:
+        return None
+    return max(filter(None, (version[1], version[4])))
+
+
+def teams_list_etag(request):
+    if not _is_cacheable(request):
+        return None
+    return _make_etag(request, 'teams_list', *teams_list_version(request))
+
+
+def teams_list_last_modified(request):
+    if not _is_cacheable(request):
+        return None
+    return teams_list_version(request)[1]
+
+
+def poll_management_etag(request):
+    if not _is_cacheable(request) or not request.user.is_admin():
+        return None
+    return _make_etag(request, 'poll_management', *polls_list_version(request), _minute_bucket())
+
+
+def dashboard_etag(request):
+    if not _is_cacheable(request) or request.user.user_type != 'user':
+        return None
+    return _make_etag(request, 'dashboard', *dashboard_version(request), _minute_bucket())
+
+
+def _force_revalidation(request, response):
+    if request.method in ('GET', 'HEAD') and response.has_header('ETag'):
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_page(etag_func=None, last_modified_func=None):
+    """
+    Answer conditional GETs with 304 and force clients to revalidate
+    instead of serving a heuristically cached copy.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            def compute_versions(request, *args, **kwargs):
+                return (
+                    etag_func(request, *args, **kwargs) if etag_func else None,
+                    last_modified_func(request, *args, **kwargs) if last_modified_func else None,
+                )
+
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # The version stamps are ordinary ORM queries: compute them in
+                # the sync thread once and hand the results to condition()
+                etag, last_modified = await sync_to_async(compute_versions)(request, *args, **kwargs)
+                conditional_view = condition(
+                    etag_func=(lambda *a, **kw: etag) if etag_func else None,
+                    last_modified_func=(lambda *a, **kw: last_modified) if last_modified_func else None,
+                )(view_func)
+                response = await conditional_view(request, *args, **kwargs)
+                return _force_revalidation(request, response)
+            return async_wrapper
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            return _force_revalidation(request, conditional_view(request, *args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,158 @@
+# exports.py
+"""
+Exports.
+
+ReportLab takes longer to import than the rest of the app, so it is only
+imported inside build_users_pdf(), never at worker start-up.
+
+Vote exports stream: rows come from values_list().iterator(), which reads
+the cursor chunk by chunk, and are encoded a chunk at a time into a
+StreamingHttpResponse, so the first bytes go out at once and memory stays
+flat however many votes the poll has.
+"""
+import csv
+import json
+from io import BytesIO, StringIO
+
+from .ballots import ballot_options, describe_choices
+from .models import Ballot, Poll
+
+VOTE_EXPORT_COLUMNS = ['full_name', 'phone_number', 'option', 'voted_at', 'ip_address']
+VOTE_EXPORT_FIELDS = ('user__full_name', 'user__phone_number', 'option__option_text', 'voted_at', 'ip_address')
+BALLOT_EXPORT_FIELDS = ('user__full_name', 'user__phone_number', 'choices', 'cast_at', 'ip_address')
+VOTE_EXPORT_CHUNK_SIZE = 2000
+
+
+def iter_vote_rows(votes, chunk_size=VOTE_EXPORT_CHUNK_SIZE):
+    """
+    Tuples of VOTE_EXPORT_FIELDS for votes, oldest first, without building
+    model instances. votes may also be a poll's Ballots, whose option
+    column lists every choice (see voting.ballots.describe_choices).
+    """
+    if votes.model is Ballot:
+        return _iter_ballot_rows(votes, chunk_size)
+    return (
+        votes.order_by('voted_at', 'pk')
+        .values_list(*VOTE_EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _iter_ballot_rows(ballots, chunk_size):
+    polls = {}
+    rows = (
+        ballots.order_by('cast_at', 'pk')
+        .values_list('poll_id', *BALLOT_EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    for poll_id, full_name, phone_number, choices, cast_at, ip_address in rows:
+        if poll_id not in polls:
+            poll = Poll.objects.get(pk=poll_id)
+            polls[poll_id] = poll.ballot_type, ballot_options(poll)
+        ballot_type, options = polls[poll_id]
+        yield full_name, phone_number, describe_choices(ballot_type, choices, options), cast_at, ip_address
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_votes_csv(votes, chunk_size=VOTE_EXPORT_CHUNK_SIZE):
+    """Yield the votes as CSV text, one piece per chunk of rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Arabic names as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(VOTE_EXPORT_COLUMNS)
+    yield buffer.getvalue()
+
+    for chunk in _chunks(iter_vote_rows(votes, chunk_size), chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (full_name or '', phone_number or '', option, voted_at.isoformat(), ip_address or '')
+            for full_name, phone_number, option, voted_at, ip_address in chunk
+        )
+        yield buffer.getvalue()
+
+
+def stream_votes_ndjson(votes, chunk_size=VOTE_EXPORT_CHUNK_SIZE):
+    """Yield the votes as newline-delimited JSON, one piece per chunk of rows"""
+    for chunk in _chunks(iter_vote_rows(votes, chunk_size), chunk_size):
+        yield ''.join(
+            json.dumps(
+                dict(zip(VOTE_EXPORT_COLUMNS, (full_name, phone_number, option, voted_at.isoformat(), ip_address))),
+                ensure_ascii=False,
+            ) + '\n'
+            for full_name, phone_number, option, voted_at, ip_address in chunk
+        )
+
+
+def build_users_pdf(users):
+    """Render the registered users table as PDF bytes"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+
+    # Container for 'story' elements
+    story = []
+
+    # Define styles
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=30,
+        alignment=1,  # Center alignment
+    )
+
+    # Add title
+    title = Paragraph("قائمة المستخدمين المسجلين - النادي الثقافي لشباب لبير", title_style)
+    story.append(title)
+    story.append(Spacer(1, 12))
+
+    # Create table data
+    data = [['#', 'الاسم الكامل', 'رقم الهاتف', 'تاريخ التسجيل', 'مؤكد']]
+
+    for i, user in enumerate(users, 1):
+        data.append([
+            str(i),
+            user.full_name or 'غير محدد',
+            user.phone_number or 'غير محدد',
+            user.created_at.strftime('%Y-%m-%d'),
+            'نعم' if user.is_phone_verified else 'لا'
+        ])
+
+    # Create table
+    table = Table(data)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 14),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    story.append(table)
+
+    # Build PDF
+    doc.build(story)
+
+    pdf = buffer.getvalue()
+    buffer.close()
+    return pdf
@@ -0,0 +1,116 @@
+# idempotency.py
+"""
+Idempotent vote submission.
+
+A vote form carries a key that is fixed when the page is rendered (the
+`idempotency_key` field); scripts may send an Idempotency-Key header
+instead. When a dropped response makes the voter, or their browser,
+submit the same form again, the retry carries the same key and is
+answered from the shared cache with the outcome of the first submission,
+without reading or writing any vote.
+
+The first request with a key claims it with cache add() and holds it
+while it runs (IDEMPOTENCY_PENDING_SECONDS, so a crashed worker can't
+hold it for good). It stores the outcome for IDEMPOTENCY_TTL_SECONDS
+once the vote is recorded or found to be a duplicate. Outcomes that a
+retry could change, such as an invalid form or an ingestion timeout,
+release the key instead. Keys are scoped to the user and the poll, and
+one reused for a different choice is refused.
+
+The claim only saves work; it doesn't guarantee a single vote. add() is
+atomic on Redis, Memcached and LocMemCache, but the default 'shared'
+cache is a FileBasedCache, whose add() checks for the file and then
+writes it, so two copies of a submission that arrive together can both
+claim the key. Both then try to insert the vote, the (poll, user) unique
+constraint lets one through, and the other is answered as a duplicate.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import VOTE_REPLAYS
+
+KEY_PREFIX = 'voting.idempotency:'
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+PENDING = 'pending'
+DONE = 'done'
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a submission with different choices"""
+
+
+def _cache():
+    return caches['shared']
+
+
+def _digest(*parts):
+    return hashlib.sha256('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def idempotency_key(request, data):
+    """The key request was sent with, in its header or the submitted data, or None"""
+    key = request.headers.get(HEADER) or data.get(FIELD) or ''
+    return key.strip() or None
+
+
+class Submission:
+    """One keyed vote submission of a user in a poll"""
+    __slots__ = ('cache_key', 'fingerprint', 'finished')
+
+    def __init__(self, user, poll, key, choices):
+        self.cache_key = KEY_PREFIX + _digest(user.pk, poll.pk, key)
+        self.fingerprint = _digest(*choices)
+        self.finished = False
+
+    def claim(self):
+        """
+        Claim the key for this request; returns None if it was free,
+        otherwise the stored record, whose 'state' is PENDING while the
+        first request is still running. Raises IdempotencyKeyReused if
+        the key was used for other choices.
+        """
+        cache = _cache()
+        pending = {'state': PENDING, 'fingerprint': self.fingerprint}
+        timeout = settings.VOTING_SETTINGS.get('IDEMPOTENCY_PENDING_SECONDS', 30)
+        for _ in range(2):
+            if cache.add(self.cache_key, pending, timeout):
+                return None
+            record = cache.get(self.cache_key)
+            if record is not None:
+                break
+            # Expired between add() and get(); try to claim it again
+        else:
+            return None
+
+        if record['fingerprint'] != self.fingerprint:
+            raise IdempotencyKeyReused()
+        VOTE_REPLAYS.inc(state=record['state'])
+        return record
+
+    def finish(self, outcome, level, message):
+        """Store the outcome that every replay of the key gets"""
+        record = {
+            'state': DONE,
+            'fingerprint': self.fingerprint,
+            'outcome': outcome,
+            'level': level,
+            'message': message,
+        }
+        _cache().set(self.cache_key, record, settings.VOTING_SETTINGS.get('IDEMPOTENCY_TTL_SECONDS', 86400))
+        self.finished = True
+
+    def release(self):
+        """Give the key back unless an outcome was stored, so it can be retried"""
+        if not self.finished:
+            _cache().delete(self.cache_key)
+
+
+def submission_for(request, poll, data, choices):
+    """A Submission for request's vote in poll, or None if it carries no key"""
+    key = idempotency_key(request, data)
+    if key is None:
+        return None
+    return Submission(request.user, poll, key, choices)
@@ -0,0 +1,227 @@
+# ingest.py
+"""
+Vote ingestion.
+
+In 'direct' mode (the default) every vote is its own INSERT and commit.
+In 'batched' mode votes are put on an in-process queue and a single writer
+thread inserts them with bulk_create, one transaction per short window
+(VOTING_SETTINGS['VOTE_BATCH_WINDOW_MS']), so a burst of votes shares one
+commit and one fsync. A request is only answered once the transaction
+holding its vote has committed, or with VoteIngestionTimeout after
+VOTE_BATCH_TIMEOUT_SECONDS (see VoteBatcher for what happens to the vote
+then). Either way the rollups in voting.rollups
+are updated in the same transaction as the votes.
+"""
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import Vote
+from .rollups import record_votes
+
+logger = logging.getLogger(__name__)
+
+VOTE_CREATED = 'created'
+VOTE_DUPLICATE = 'duplicate'
+
+
+class VoteIngestionTimeout(Exception):
+    """The batch holding the vote did not commit in time"""
+
+
+def write_votes(votes):
+    """
+    Insert votes in a single transaction and return one outcome per vote.
+
+    Duplicates are resolved per batch: the first vote of a (poll, user)
+    pair in the batch wins, and pairs that already have a row are skipped.
+    """
+    outcomes = [VOTE_DUPLICATE] * len(votes)
+    seen = set()
+    candidates = []
+    for index, vote in enumerate(votes):
+        pair = (vote.poll_id, vote.user_id)
+        if pair not in seen:
+            seen.add(pair)
+            candidates.append(index)
+
+    try:
+        with transaction.atomic():
+            existing = set(
+                Vote.objects.filter(
+                    poll_id__in={vote.poll_id for vote in votes},
+                    user_id__in={vote.user_id for vote in votes},
+                ).values_list('poll_id', 'user_id')
+            )
+            inserted = [
+                index for index in candidates
+                if (votes[index].poll_id, votes[index].user_id) not in existing
+            ]
+            created = [votes[index] for index in inserted]
+            Vote.objects.bulk_create(created)
+            record_votes(created)
+    except IntegrityError:
+        # Another process inserted one of the pairs after our check, fall
+        # back to one savepoint per vote for this batch
+        inserted = []
+        with transaction.atomic():
+            for index in candidates:
+                try:
+                    with transaction.atomic():
+                        votes[index].save(force_insert=True)
+                        record_votes([votes[index]])
+                    inserted.append(index)
+                except IntegrityError:
+                    pass
+
+    for index in inserted:
+        outcomes[index] = VOTE_CREATED
+    return outcomes
+
+
+class PendingVote:
+    """A queued vote and the slot its outcome is reported in"""
+    __slots__ = ('vote', 'done', 'outcome', 'error', 'state')
+
+    QUEUED = 'queued'
+    CLAIMED = 'claimed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, vote):
+        self.vote = vote
+        self.done = threading.Event()
+        self.outcome = None
+        self.error = None
+        self.state = self.QUEUED
+
+
+class VoteBatcher:
+    """
+    Single writer thread that commits queued votes in micro-batches.
+
+    A vote whose submitter gave up waiting is cancelled if the writer has
+    not picked it up yet, so a request answered with a timeout never has
+    its vote committed behind its back. A vote already in a batch that is
+    being written can't be taken back: it commits or fails with the batch,
+    and a retry is answered as a duplicate if it committed.
+    """
+
+    def __init__(self, window_ms=10, max_batch=500, timeout=10):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+
+    def submit(self, vote):
+        """Queue the vote and block until its batch has committed"""
+        self._ensure_started()
+        pending = PendingVote(vote)
+        self._queue.put(pending)
+
+        if not pending.done.wait(self.timeout):
+            with self._claim_lock:
+                if pending.state == PendingVote.QUEUED:
+                    pending.state = PendingVote.CANCELLED
+            if pending.state == PendingVote.CANCELLED:
+                raise VoteIngestionTimeout('Vote was not written in time and has been dropped')
+            raise VoteIngestionTimeout('Vote batch did not commit in time')
+        if pending.error is not None:
+            raise pending.error
+        return pending.outcome
+
+    def _ensure_started(self):
+        # Started lazily so every worker process gets its own writer thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='vote-batcher', daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _claim(self, batch):
+        # Drops the votes whose submitters timed out before the batch began
+        with self._claim_lock:
+            claimed = [pending for pending in batch if pending.state == PendingVote.QUEUED]
+            for pending in claimed:
+                pending.state = PendingVote.CLAIMED
+        return claimed
+
+    def _run(self):
+        while True:
+            batch = self._claim(self._collect())
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                outcomes = write_votes([pending.vote for pending in batch])
+            except Exception as exc:
+                logger.exception("Failed to write a batch of %d votes", len(batch))
+                for pending in batch:
+                    pending.error = exc
+                    pending.done.set()
+                continue
+
+            for pending, outcome in zip(batch, outcomes):
+                pending.outcome = outcome
+                pending.done.set()
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                voting_settings = settings.VOTING_SETTINGS
+                _batcher = VoteBatcher(
+                    window_ms=voting_settings.get('VOTE_BATCH_WINDOW_MS', 10),
+                    max_batch=voting_settings.get('VOTE_BATCH_MAX_SIZE', 500),
+                    timeout=voting_settings.get('VOTE_BATCH_TIMEOUT_SECONDS', 10),
+                )
+    return _batcher
+
+
+def record_vote(poll, user, option, ip_address=None, mode=None):
+    """
+    Store a vote and return VOTE_CREATED or VOTE_DUPLICATE.
+
+    mode defaults to VOTING_SETTINGS['VOTE_INGESTION_MODE'].
+    """
+    vote = Vote(poll=poll, user=user, option=option, ip_address=ip_address)
+    mode = mode or settings.VOTING_SETTINGS.get('VOTE_INGESTION_MODE', 'direct')
+
+    if mode == 'batched':
+        return get_batcher().submit(vote)
+
+    try:
+        with transaction.atomic():
+            vote.save(force_insert=True)
+            record_votes([vote])
+    except IntegrityError:
+        return VOTE_DUPLICATE
+    return VOTE_CREATED
@@ -0,0 +1,160 @@
+# log.py
+"""
+Non-blocking log pipeline.
+
+QueueLogHandler only puts records on a bounded in-memory queue; a
+QueueListener thread formats them and writes them to a size-rotated file.
+A slow disk therefore never stalls a request. When the queue fills up,
+records below WARNING are sampled, and once it is full new records are
+dropped. The listener writes a warning with the number of dropped records.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, extras and exc"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Listener(QueueListener):
+    """QueueListener that reports, at most once a second, records the handler had to drop"""
+    report_interval = 1.0
+
+    def __init__(self, source, *handlers):
+        super().__init__(source.queue, *handlers, respect_handler_level=True)
+        self.source = source
+        self._last_report = time.monotonic()
+
+    def handle(self, record):
+        super().handle(record)
+        now = time.monotonic()
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            self.report_losses()
+
+    def report_losses(self):
+        dropped, sampled = self.source.take_losses()
+        if dropped or sampled:
+            super().handle(logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': 'WARNING',
+                'msg': 'Log queue under pressure: dropped %d records, sampled out %d',
+                'args': (dropped, sampled),
+            }))
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Enqueue records for a background thread that writes them to filename.
+
+    Configured from settings.LOGGING with '()' (not 'class', which Python
+    3.12+ handles as a stdlib QueueHandler); `formatter` applies to the
+    file writer, so formatting happens off the request thread too.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 queue_size=10000, sample_above=0.5, sample_every=10):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.queue_size = queue_size
+        self.sample_threshold = int(queue_size * sample_above)
+        self.sample_every = sample_every
+        self.file_handler = RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True
+        )
+        self.file_handler.setFormatter(JsonFormatter())
+        self._dropped = 0
+        self._sampled = 0
+        self._seen_under_pressure = 0
+        self._loss_lock = threading.Lock()
+        self._pid = None
+        self.listener = None
+        atexit.register(self.close)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._loss_lock = threading.Lock()
+        self._dropped = self._sampled = 0
+
+    def _start_listener(self):
+        # Started on first use, and again in each forked worker since the
+        # thread does not survive a fork
+        with self._loss_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.queue_size)
+                self.listener = _Listener(self, self.file_handler)
+                self.listener.start()
+                self._pid = os.getpid()
+
+    def setFormatter(self, fmt):
+        self.file_handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only merge args and render the traceback here; the formatter runs
+        # in the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._start_listener()
+        if record.levelno < logging.WARNING and self.queue.qsize() >= self.sample_threshold:
+            with self._loss_lock:
+                self._seen_under_pressure += 1
+                if self._seen_under_pressure % self.sample_every:
+                    self._sampled += 1
+                    return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._loss_lock:
+                self._dropped += 1
+
+    def take_losses(self):
+        """Return and reset (dropped, sampled out) counts"""
+        if not (self._dropped or self._sampled):
+            return 0, 0
+        with self._loss_lock:
+            losses = self._dropped, self._sampled
+            self._dropped = self._sampled = 0
+        return losses
+
+    def close(self):
+        if self.listener is not None and self._pid == os.getpid() and self.listener._thread is not None:
+            self.listener.stop()
+            self.listener.report_losses()
+        self.file_handler.close()
+        super().close()
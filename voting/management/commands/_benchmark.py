@@ -0,0 +1,157 @@
+# management/commands/_benchmark.py
+"""
+Shared helpers for the benchmark_* management commands.
+
+Benchmarks never touch the real db.sqlite3: they run against a throwaway
+test database, on disk when fsync cost matters.
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@contextmanager
+def isolated_database(on_disk=False):
+    """Create a scratch database with the full schema and drop it afterwards"""
+    tmpdir = None
+    if on_disk:
+        tmpdir = tempfile.mkdtemp(prefix='voting-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        if tmpdir:
+            os.rmdir(tmpdir)
+
+
+def count_writes(captured_queries):
+    """Number of INSERT/UPDATE/DELETE statements in a CaptureQueriesContext"""
+    return sum(
+        1 for query in captured_queries
+        if query['sql'].lstrip().upper().startswith(WRITE_PREFIXES)
+    )
+
+
+class Timer:
+    """Wall-clock timer usable as a context manager"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+# Boots a fresh interpreter the way a WSGI worker does, then serves one
+# request; reports timings and which heavy modules ended up imported
+STARTUP_PROBE = """
+import io, json, os, sys, time
+os.environ['DJANGO_SETTINGS_MODULE'] = 'votingapp.settings'
+os.environ.setdefault('VOTING_THROTTLE_LOCAL_MEMORY', '1')
+start = time.perf_counter()
+from votingapp.wsgi import application
+booted = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '443', 'HTTP_HOST': 'localhost',
+    'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.url_scheme': 'https',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+}
+status = []
+b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+served = time.perf_counter()
+print(json.dumps({
+    'boot_ms': (booted - start) * 1000,
+    'first_request_ms': (served - booted) * 1000,
+    'status': status[0],
+    'modules': sorted(sys.modules),
+}))
+"""
+
+# Imports that must stay out of worker start-up and the first request
+HEAVY_MODULES = ('reportlab', 'requests', 'PIL')
+
+
+def probe_startup(path='/', importtime=False):
+    """
+    Run STARTUP_PROBE in a new interpreter.
+
+    Returns the probe's JSON report. With importtime, the report also has
+    'imports': (module, self us, cumulative us) tuples from -X importtime.
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    result = subprocess.run(
+        command + ['-c', STARTUP_PROBE, path],
+        cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    if importtime:
+        report['imports'] = []
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if line.startswith('import time:') and fields[1].strip().isdigit():
+                report['imports'].append((fields[2].strip(), int(fields[0].split(':')[1]), int(fields[1])))
+    return report
+
+
+# A threaded wsgiref server for the HTTP load benchmarks, run as a script
+# with the port as its argument
+WSGI_SERVER = """
+import sys
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from votingapp.wsgi import application
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+make_server('127.0.0.1', int(sys.argv[1]), application,
+            server_class=ThreadingWSGIServer, handler_class=QuietHandler).serve_forever()
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    """Block until a server accepts connections on port"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'Server on port {port} did not start')
@@ -0,0 +1,66 @@
+# management/commands/archive_votes.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.archive import archivable_polls, archive_poll
+from voting.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Move votes of long-closed polls from the live Vote table to ArchivedVote'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help="Archive polls closed more than this many days ago (default: VOTING_SETTINGS['ARCHIVE_AFTER_DAYS'])",
+        )
+        parser.add_argument(
+            '--poll',
+            type=str,
+            help='Archive this closed poll now, whatever its age',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help="Votes moved per transaction (default: VOTING_SETTINGS['ARCHIVE_CHUNK_SIZE'])",
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.05,
+            help='Seconds to sleep between chunks (default: 0.05)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the polls that would be archived',
+        )
+
+    def handle(self, *args, **options):
+        if options['poll']:
+            polls = Poll.objects.filter(id=options['poll'], archived_at__isnull=True)
+            if not polls.exists():
+                raise CommandError(f"Poll with ID {options['poll']} not found or already archived")
+            if polls.exclude(status='closed').exists():
+                raise CommandError('Only closed polls can be archived')
+            if polls.exclude(ballot_type=Poll.BALLOT_SINGLE).exists():
+                raise CommandError('Ranked-choice and approval polls keep their ballots and are not archived')
+        else:
+            polls = archivable_polls(options['days'])
+
+        total = 0
+        start = time.perf_counter()
+        for poll in polls.order_by('end_time'):
+            if options['dry_run']:
+                self.stdout.write(f"Would archive '{poll.title}' (closed {poll.end_time:%Y-%m-%d})")
+                continue
+            moved = archive_poll(poll, chunk_size=options['chunk_size'], pause=options['pause'])
+            total += moved
+            self.stdout.write(f"Archived '{poll.title}': {moved} votes")
+
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Moved {total} votes in {time.perf_counter() - start:.2f}s'
+            ))
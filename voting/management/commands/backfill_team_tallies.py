@@ -0,0 +1,26 @@
+# management/commands/backfill_team_tallies.py
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.models import Team
+from voting.rollups import rebuild_team_tallies
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-team vote tallies from the votes table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--team',
+            type=str,
+            help='Only rebuild this team (default: every team)',
+        )
+
+    def handle(self, *args, **options):
+        teams = None
+        if options['team']:
+            teams = Team.objects.filter(id=options['team'])
+            if not teams.exists():
+                raise CommandError(f"Team with ID {options['team']} not found")
+
+        rows = rebuild_team_tallies(teams)
+        self.stdout.write(self.style.SUCCESS(f'Team tallies rebuilt: {rows} team/poll rows'))
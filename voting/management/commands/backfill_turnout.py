@@ -0,0 +1,29 @@
+# management/commands/backfill_turnout.py
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.models import Poll
+from voting.rollups import rebuild_turnout
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-minute turnout rollup from the votes table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll',
+            type=str,
+            help='Only rebuild this poll (default: every poll)',
+        )
+
+    def handle(self, *args, **options):
+        polls = Poll.objects.all()
+        if options['poll']:
+            polls = polls.filter(id=options['poll'])
+            if not polls.exists():
+                raise CommandError(f"Poll with ID {options['poll']} not found")
+
+        for poll in polls.iterator():
+            buckets = rebuild_turnout(poll)
+            self.stdout.write(f"Poll '{poll.title}': {buckets} minute buckets")
+
+        self.stdout.write(self.style.SUCCESS('Turnout rollup rebuilt'))
@@ -0,0 +1,33 @@
+# management/commands/backfill_voter_bitmaps.py
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.models import CustomUser, Poll
+from voting.participation import assign_missing_ordinals, rebuild_voter_bitmap
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-poll voter bitmaps from the votes table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll',
+            type=str,
+            help='Only rebuild this poll (default: every poll)',
+        )
+
+    def handle(self, *args, **options):
+        polls = Poll.objects.all()
+        if options['poll']:
+            polls = polls.filter(id=options['poll'])
+            if not polls.exists():
+                raise CommandError(f"Poll with ID {options['poll']} not found")
+
+        assigned = assign_missing_ordinals(CustomUser.objects.all())
+        if assigned:
+            self.stdout.write(f'Assigned ordinals to {assigned} users')
+
+        for poll in polls.iterator():
+            voters = rebuild_voter_bitmap(poll)
+            self.stdout.write(f"Poll '{poll.title}': {voters} voters")
+
+        self.stdout.write(self.style.SUCCESS('Voter bitmaps rebuilt'))
@@ -0,0 +1,270 @@
+# management/commands/benchmark_admission.py
+import http.client
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from voting.models import CustomUser, Option, Poll, Team, Vote
+from ._benchmark import WSGI_SERVER, free_port, isolated_database, wait_for_port
+
+SETTINGS_TEMPLATE = """
+from votingapp.settings import *
+
+DATABASES['default']['NAME'] = {db_name!r}
+CACHES['shared']['LOCATION'] = {cache_dir!r}
+SECURE_SSL_REDIRECT = False
+SESSION_COOKIE_SECURE = False
+CSRF_COOKIE_SECURE = False
+VOTING_SETTINGS = {{**VOTING_SETTINGS, 'ADMISSION_MAX_IN_FLIGHT': {max_in_flight!r}, 'THROTTLE_RATES': {{}}}}
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Overload the WSGI server with votes mixed with admin PDFs and listings, '
+        'with and without admission control, and report the vote goodput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients',
+            type=str,
+            default='8,32,96',
+            help='Comma-separated numbers of concurrent clients to try (default: 8,32,96)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10.0,
+            help='Seconds to run each load level (default: 10)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=5.0,
+            help='Seconds a client waits before giving up on a request (default: 5)',
+        )
+        parser.add_argument(
+            '--slo',
+            type=float,
+            default=1.0,
+            help='A vote counts towards goodput only if answered within this many seconds (default: 1)',
+        )
+        parser.add_argument(
+            '--vote-share',
+            type=float,
+            default=0.3,
+            help='Fraction of requests that are vote submissions (default: 0.3)',
+        )
+        parser.add_argument(
+            '--max-in-flight',
+            type=int,
+            help="Admission cap for the controlled run (default: VOTING_SETTINGS['ADMISSION_MAX_IN_FLIGHT'])",
+        )
+        parser.add_argument(
+            '--voters',
+            type=int,
+            default=200,
+            help='Logged-in voters to spread the votes over (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['clients'].split(',')]
+        except ValueError:
+            raise CommandError('--clients must be a comma-separated list of integers')
+        max_in_flight = options['max_in_flight'] or settings.VOTING_SETTINGS.get('ADMISSION_MAX_IN_FLIGHT', 32)
+
+        with isolated_database(on_disk=True), tempfile.TemporaryDirectory() as workdir:
+            cache_dir = os.path.join(workdir, 'cache')
+            caches = {
+                **settings.CACHES,
+                'shared': {**settings.CACHES['shared'], 'LOCATION': cache_dir},
+            }
+            with override_settings(CACHES=caches):
+                workload = self._populate(options['voters'])
+
+            Path(workdir, 'wsgi_server.py').write_text(WSGI_SERVER)
+            runs = [('no admission', 0), (f'admission={max_in_flight}', max_in_flight)]
+
+            self.stdout.write(
+                f'{"mode":16} {"clients":>7}  {"goodput/s":>10}  {"vote p95":>9}  '
+                f'{"admin ok/s":>10}  {"shed":>6}  {"timeouts":>8}'
+            )
+            for label, cap in runs:
+                settings_module = f'bench_settings_admission_{cap}'
+                Path(workdir, f'{settings_module}.py').write_text(SETTINGS_TEMPLATE.format(
+                    db_name=str(connection.settings_dict['NAME']),
+                    cache_dir=cache_dir,
+                    max_in_flight=cap,
+                ))
+                port = free_port()
+                env = {
+                    **os.environ,
+                    'DJANGO_SETTINGS_MODULE': settings_module,
+                    'PYTHONPATH': os.pathsep.join([workdir, str(settings.BASE_DIR)]),
+                }
+                server = subprocess.Popen(
+                    [sys.executable, os.path.join(workdir, 'wsgi_server.py'), str(port)],
+                    env=env, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL,
+                )
+                try:
+                    wait_for_port(port)
+                    for clients in levels:
+                        result = self._load(port, workload, clients, options)
+                        self.stdout.write(
+                            f'{label:16} {clients:>7}  {result["goodput"]:>10.1f}  '
+                            f'{result["vote_p95"]:>7.0f}ms  {result["admin"]:>10.1f}  '
+                            f'{result["shed"]:>6}  {result["timeouts"]:>8}'
+                        )
+                        # Let requests abandoned by timed-out clients finish
+                        time.sleep(options['timeout'])
+                finally:
+                    server.terminate()
+                    server.wait()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _populate(self, voter_count):
+        """Create an active poll, voters and an admin; return what the clients request"""
+        admin = CustomUser.objects.create_user(
+            username='bench_admin', password='bench-pass', user_type='super_admin'
+        )
+        voters = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench{i}', phone_number=f'+2222{i:07d}',
+                       password='!', is_phone_verified=True)
+            for i in range(voter_count)
+        ])
+        now = timezone.now()
+        poll = Poll.objects.create(
+            title='Benchmark poll', start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(hours=1), created_by=admin, status='active',
+        )
+        options = [
+            Option.objects.create(
+                poll=poll, option_text=f'Team {i}', order=i,
+                team=Team.objects.create(name=f'Team {i}', created_by=admin),
+            )
+            for i in range(5)
+        ]
+        # Half the voters have already voted, so the admin pages have rows
+        Vote.objects.bulk_create([
+            Vote(poll=poll, user=user, option=options[i % len(options)])
+            for i, user in enumerate(voters[::2])
+        ])
+
+        def session_cookie(user):
+            client = Client()
+            client.force_login(user)
+            return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+        # An unmasked CSRF secret is accepted both as cookie and form token
+        csrf_token = get_random_string(32)
+        return {
+            'csrf_token': csrf_token,
+            'voter_cookies': [
+                f'{settings.SESSION_COOKIE_NAME}={session_cookie(user)}; '
+                f'{settings.CSRF_COOKIE_NAME}={csrf_token}'
+                for user in voters
+            ],
+            'admin_cookie': f'{settings.SESSION_COOKIE_NAME}={session_cookie(admin)}',
+            'vote_path': f'/poll/{poll.id}/',
+            'option_ids': [str(option.id) for option in options],
+            'admin_paths': [
+                '/vote-admin/users/print/',
+                '/vote-admin/users/',
+                f'/vote-admin/poll/{poll.id}/vote-details/',
+                '/vote-admin/dashboard/',
+            ],
+        }
+
+    def _request(self, port, timeout, method, path, cookie, body=None):
+        """Return (status, Retry-After or None); status is None on timeout/error"""
+        headers = {'Cookie': cookie, 'Host': '127.0.0.1'}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+        except OSError:
+            return None, None
+        return response.status, response.getheader('Retry-After')
+
+    def _load(self, port, workload, clients, options):
+        """Run `clients` closed-loop clients for the duration and summarize what completed"""
+        vote_latencies = []
+        counts = {'admin': 0, 'shed': 0, 'timeouts': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+
+        def client(seed):
+            rng = random.Random(seed)
+            while time.monotonic() < deadline:
+                is_vote = rng.random() < options['vote_share']
+                start = time.perf_counter()
+                if is_vote:
+                    body = urlencode({
+                        'csrfmiddlewaretoken': workload['csrf_token'],
+                        'option_id': rng.choice(workload['option_ids']),
+                    })
+                    status, retry_after = self._request(
+                        port, options['timeout'], 'POST', workload['vote_path'],
+                        rng.choice(workload['voter_cookies']), body,
+                    )
+                else:
+                    status, retry_after = self._request(
+                        port, options['timeout'], 'GET', rng.choice(workload['admin_paths']),
+                        workload['admin_cookie'],
+                    )
+                elapsed = (time.perf_counter() - start) * 1000
+
+                with lock:
+                    if status is None:
+                        counts['timeouts'] += 1
+                    elif status == 503:
+                        counts['shed'] += 1
+                    elif is_vote and status in (200, 302):
+                        vote_latencies.append(elapsed)
+                    elif status == 200:
+                        counts['admin'] += 1
+
+                if status == 503:
+                    # Back off the way the dashboard does
+                    time.sleep(int(retry_after or 2) * (0.5 + rng.random()))
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        slo_ms = options['slo'] * 1000
+        goodput = sum(1 for latency in vote_latencies if latency <= slo_ms)
+        vote_latencies.sort()
+        vote_p95 = vote_latencies[min(len(vote_latencies) - 1, int(len(vote_latencies) * 0.95))] if vote_latencies else 0.0
+        return {
+            'goodput': goodput / wall,
+            'vote_p95': vote_p95,
+            'admin': counts['admin'] / wall,
+            'shed': counts['shed'],
+            'timeouts': counts['timeouts'],
+        }
@@ -0,0 +1,184 @@
+# management/commands/benchmark_asgi.py
+import http.client
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from voting.models import CustomUser, Option, Poll, Team, Vote
+from ._benchmark import WSGI_SERVER, free_port, isolated_database, wait_for_port
+
+SETTINGS_TEMPLATE = """
+from votingapp.settings import *
+
+DATABASES['default']['NAME'] = {db_name!r}
+CACHES['shared']['LOCATION'] = {cache_dir!r}
+SECURE_SSL_REDIRECT = False
+SESSION_COOKIE_SECURE = False
+CSRF_COOKIE_SECURE = False
+VOTING_SETTINGS = {{**VOTING_SETTINGS, 'ASYNC_VIEWS': {async_views!r},
+                                     'ADMISSION_MAX_IN_FLIGHT': 0, 'THROTTLE_RATES': {{}}}}
+"""
+
+class Command(BaseCommand):
+    help = 'Compare concurrent throughput of the async views under uvicorn with the WSGI path'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Concurrent client connections (default: 50)',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=5.0,
+            help='Seconds to load each page (default: 5)',
+        )
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('uvicorn') is None:
+            raise CommandError('uvicorn is required for this benchmark (pip install uvicorn)')
+
+        with isolated_database(on_disk=True), tempfile.TemporaryDirectory() as workdir:
+            cache_dir = os.path.join(workdir, 'cache')
+            caches = {
+                **settings.CACHES,
+                'shared': {**settings.CACHES['shared'], 'LOCATION': cache_dir},
+            }
+            with override_settings(CACHES=caches):
+                pages = self._populate()
+
+            servers = [
+                ('WSGI (threaded)', False, [sys.executable, os.path.join(workdir, 'wsgi_server.py')]),
+                ('ASGI (uvicorn)', True, [
+                    sys.executable, '-m', 'uvicorn', 'votingapp.asgi:application',
+                    '--log-level', 'warning', '--port',
+                ]),
+            ]
+            Path(workdir, 'wsgi_server.py').write_text(WSGI_SERVER)
+
+            for label, async_views, command in servers:
+                settings_module = f'bench_settings_{"asgi" if async_views else "wsgi"}'
+                Path(workdir, f'{settings_module}.py').write_text(SETTINGS_TEMPLATE.format(
+                    db_name=str(connection.settings_dict['NAME']),
+                    cache_dir=cache_dir,
+                    async_views=async_views,
+                ))
+                port = free_port()
+                env = {
+                    **os.environ,
+                    'DJANGO_SETTINGS_MODULE': settings_module,
+                    'VOTING_ASYNC_VIEWS': '1' if async_views else '0',
+                    'PYTHONPATH': os.pathsep.join([workdir, str(settings.BASE_DIR)]),
+                }
+                server = subprocess.Popen(
+                    command + [str(port)], env=env, cwd=settings.BASE_DIR,
+                    stdout=subprocess.DEVNULL,
+                )
+                try:
+                    wait_for_port(port)
+                    for name, path, cookie in pages:
+                        rps, p50, p95, errors = self._load(
+                            port, path, cookie, options['concurrency'], options['duration']
+                        )
+                        self.stdout.write(
+                            f'{label:16} {name:14} req/s: {rps:8.1f}  '
+                            f'p50: {p50:7.1f}ms  p95: {p95:7.1f}ms  errors: {errors}'
+                        )
+                finally:
+                    server.terminate()
+                    server.wait()
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _populate(self):
+        """Create a poll with votes and a few teams, return (name, path, cookie) per page"""
+        admin = CustomUser.objects.create_user(
+            username='bench_admin', password='bench-pass', user_type='super_admin'
+        )
+        voters = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench{i}', phone_number=f'+2222{i:07d}',
+                       password='!', is_phone_verified=True)
+            for i in range(500)
+        ])
+        now = timezone.now()
+        poll = Poll.objects.create(
+            title='Benchmark poll', start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(hours=1), created_by=admin, status='active',
+        )
+        teams = [Team.objects.create(name=f'Team {i}', created_by=admin) for i in range(5)]
+        options = [
+            Option.objects.create(poll=poll, option_text=team.name, team=team, order=i)
+            for i, team in enumerate(teams)
+        ]
+        Vote.objects.bulk_create([
+            Vote(poll=poll, user=user, option=options[i % len(options)])
+            for i, user in enumerate(voters[1:])
+        ])
+
+        cookies = {}
+        for key, user in (('admin', admin), ('voter', voters[0])):
+            client = Client()
+            client.force_login(user)
+            cookies[key] = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        return [
+            ('poll results', f'/poll/{poll.id}/results/', cookies['admin']),
+            ('teams list', '/teams/', cookies['voter']),
+            ('dashboard', '/dashboard/', cookies['voter']),
+        ]
+
+    def _load(self, port, path, cookie, concurrency, duration):
+        """Hammer one page from `concurrency` threads, return (req/s, p50 ms, p95 ms, errors)"""
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    conn.request('GET', path, headers={'Cookie': cookie, 'Host': '127.0.0.1'})
+                    response = conn.getresponse()
+                    response.read()
+                    conn.close()
+                    ok = response.status == 200
+                except OSError:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        if not latencies:
+            return 0.0, 0.0, 0.0, errors[0]
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return len(latencies) / wall, statistics.median(latencies), p95, errors[0]
@@ -0,0 +1,69 @@
+# management/commands/benchmark_sessions.py
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from voting.models import CustomUser, Team
+from ._benchmark import Timer, count_writes, isolated_database
+
+
+ENGINES = [
+    ('database, save every request', 'django.contrib.sessions.backends.db', True),
+    ('voting.sessions (cache-first)', 'voting.sessions', False),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare database writes per request for the old and new session engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Page views to issue per engine (default: 200)',
+        )
+
+    def handle(self, *args, **options):
+        n_requests = options['requests']
+
+        with isolated_database(on_disk=True), tempfile.TemporaryDirectory() as cache_dir:
+            caches = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'shared': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': cache_dir,
+                },
+                'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            }
+            admin = CustomUser.objects.create_user(
+                username='bench_admin', password='bench-pass', user_type='super_admin'
+            )
+            Team.objects.create(name='Bench Team', created_by=admin)
+            url = reverse('teams_list')
+
+            for label, engine, save_every_request in ENGINES:
+                with override_settings(
+                    SESSION_ENGINE=engine,
+                    SESSION_SAVE_EVERY_REQUEST=save_every_request,
+                    CACHES=caches,
+                ):
+                    client = Client()
+                    client.force_login(admin)
+
+                    with CaptureQueriesContext(connection) as queries, Timer() as timer:
+                        for _ in range(n_requests):
+                            client.get(url, secure=True)
+
+                    writes = count_writes(queries.captured_queries)
+                    self.stdout.write(
+                        f'{label:32} writes/request: {writes / n_requests:.2f}  '
+                        f'queries/request: {len(queries) / n_requests:.2f}  '
+                        f'ms/request: {timer.elapsed * 1000 / n_requests:.2f}'
+                    )
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {n_requests} requests per engine'))
@@ -0,0 +1,52 @@
+# management/commands/benchmark_startup.py
+import statistics
+
+from django.core.management.base import BaseCommand
+
+from ._benchmark import HEAVY_MODULES, probe_startup
+
+
+class Command(BaseCommand):
+    help = 'Measure worker boot time, the cold first request and the slowest imports'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Fresh interpreters to average over (default: 5)',
+        )
+        parser.add_argument(
+            '--path',
+            default='/',
+            help='URL of the cold request (default: the login page)',
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=15,
+            help='Slowest imports to list (default: 15)',
+        )
+
+    def handle(self, *args, **options):
+        reports = [probe_startup(options['path']) for _ in range(options['runs'])]
+        boot = statistics.median(report['boot_ms'] for report in reports)
+        first_request = statistics.median(report['first_request_ms'] for report in reports)
+
+        self.stdout.write(f'boot (import votingapp.wsgi): {boot:7.1f}ms median of {len(reports)}')
+        self.stdout.write(f'cold request {options["path"]} ({reports[0]["status"]}): {first_request:7.1f}ms')
+
+        loaded = [
+            name for name in HEAVY_MODULES
+            if name in reports[0]['modules']
+        ]
+        if loaded:
+            self.stdout.write(self.style.WARNING(f'Heavy modules loaded at start-up: {", ".join(loaded)}'))
+
+        profile = probe_startup(options['path'], importtime=True)
+        top_level = [entry for entry in profile['imports'] if '.' not in entry[0] or entry[0].startswith('voting')]
+        self.stdout.write('\nSlowest imports (-X importtime, cumulative):')
+        for name, self_us, cumulative_us in sorted(top_level, key=lambda entry: entry[2], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}ms  {name}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
@@ -0,0 +1,141 @@
+# management/commands/benchmark_tally.py
+import time
+from datetime import timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from voting.models import Ballot, CustomUser, Option, Poll
+from voting.tally import _numpy, approval_counts, ballot_matrix, instant_runoff, tally_ballots
+from ._benchmark import isolated_database
+
+
+def _random_ballots(np, n_ballots, n_options, seed):
+    """
+    Ranked ballots as bytes, drawn from a Plackett-Luce model with uneven
+    option popularity so the runoff goes several rounds, and of random
+    length so some ballots exhaust.
+    """
+    rng = np.random.default_rng(seed)
+    popularity = np.log(rng.uniform(0.5, 2.0, n_options))
+    rankings = np.argsort(-(rng.gumbel(size=(n_ballots, n_options)) + popularity), axis=1).astype(np.uint8)
+    lengths = rng.integers(1, n_options + 1, n_ballots)
+    return [row[:length].tobytes() for row, length in zip(rankings, lengths)]
+
+
+def _python_runoff(ballots, n_options):
+    """The same count as voting.tally.instant_runoff, one ballot at a time"""
+    eliminated = set()
+    history = []
+    while True:
+        counts = [0] * n_options
+        history.append(counts)
+        continuing = 0
+        for ballot in ballots:
+            for position in ballot:
+                if position not in eliminated:
+                    counts[position] += 1
+                    continuing += 1
+                    break
+        live = [position for position in range(n_options) if position not in eliminated]
+        leader = max(live, key=counts.__getitem__)
+        if not continuing or counts[leader] * 2 > continuing or len(live) == 1:
+            return leader, len(history)
+        # Last place, ties broken by earlier rounds, then the later option
+        eliminated.add(min(reversed(live), key=lambda position: [past[position] for past in reversed(history)]))
+
+
+class Command(BaseCommand):
+    help = 'Time the NumPy tally engine on random ranked ballots (default: 100,000 ballots x 20 options)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ballots', type=int, default=100_000, help='Number of ballots (default: 100000)')
+        parser.add_argument('--options', type=int, default=20, help='Options per poll (default: 20)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument(
+            '--baseline',
+            action='store_true',
+            help='Also run the count ballot by ballot in pure Python for comparison',
+        )
+        parser.add_argument(
+            '--db',
+            action='store_true',
+            help='Also store the ballots in a scratch database and time tally_ballots() end to end',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            np = _numpy()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        n_ballots, n_options = options['ballots'], options['options']
+        if not 2 <= n_options < 255:
+            raise CommandError('--options must be between 2 and 254')
+
+        ballots = _random_ballots(np, n_ballots, n_options, options['seed'])
+        self.stdout.write(f'{n_ballots} ballots x {n_options} options')
+
+        started = time.perf_counter()
+        matrix = ballot_matrix(ballots, n_options)
+        self.stdout.write(f'  build matrix:     {(time.perf_counter() - started) * 1000:8.1f}ms')
+
+        started = time.perf_counter()
+        result = instant_runoff(matrix, n_options)
+        runoff_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(
+            f'  instant runoff:   {runoff_ms:8.1f}ms  '
+            f'({len(result.rounds)} rounds, winner option {result.winner}, '
+            f'{result.exhausted[-1]} ballots exhausted)'
+        )
+
+        started = time.perf_counter()
+        approval_counts(matrix, n_options)
+        self.stdout.write(f'  approval counts:  {(time.perf_counter() - started) * 1000:8.1f}ms')
+
+        if options['baseline']:
+            started = time.perf_counter()
+            winner, rounds = _python_runoff(ballots, n_options)
+            baseline_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(
+                f'  pure Python IRV:  {baseline_ms:8.1f}ms  ({rounds} rounds, winner option {winner}, '
+                f'{baseline_ms / runoff_ms:.0f}x slower)'
+            )
+            if winner != result.winner:
+                raise CommandError('The pure Python count picked a different winner')
+
+        if options['db']:
+            with isolated_database():
+                self._time_database(ballots, n_options)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
+
+    def _time_database(self, ballots, n_options):
+        self.stdout.write('Storing the ballots...')
+        creator = CustomUser.objects.create_user(username='bench-admin', password='x', user_type='super_admin')
+        now = timezone.now()
+        poll = Poll.objects.create(
+            title='Tally benchmark',
+            start_time=now,
+            end_time=now + timedelta(days=1),
+            created_by=creator,
+            status='active',
+            ballot_type=Poll.BALLOT_RANKED,
+        )
+        Option.objects.bulk_create([Option(poll=poll, option_text=f'Option {i}', order=i) for i in range(n_options)])
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'bench-{i}', phone_number=f'+2224{i:07d}') for i in range(len(ballots))],
+            batch_size=2000,
+        )
+        Ballot.objects.bulk_create(
+            [Ballot(poll=poll, user=user, choices=choices) for user, choices in zip(users, ballots)],
+            batch_size=2000,
+        )
+
+        started = time.perf_counter()
+        tallies, count = tally_ballots(poll)
+        self.stdout.write(
+            f'  tally_ballots():  {(time.perf_counter() - started) * 1000:8.1f}ms  '
+            f'({count} ballots read, winner {tallies[0]["option_text"]})'
+        )
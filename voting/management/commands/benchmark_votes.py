@@ -0,0 +1,114 @@
+# management/commands/benchmark_votes.py
+import threading
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from voting.ingest import VOTE_CREATED, VoteBatcher, record_vote
+from voting.models import CustomUser, Option, Poll, Vote
+from ._benchmark import Timer, isolated_database
+
+
+class Command(BaseCommand):
+    help = 'Compare votes per second for one-transaction-per-vote and batched ingestion'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--votes',
+            type=int,
+            default=2000,
+            help='Votes to cast per mode (default: 2000)',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=32,
+            help='Concurrent voters (default: 32)',
+        )
+        parser.add_argument(
+            '--window-ms',
+            type=int,
+            default=10,
+            help='Batch window for the batched mode (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        n_votes = options['votes']
+        n_threads = options['threads']
+
+        with isolated_database(on_disk=True):
+            users = CustomUser.objects.bulk_create([
+                CustomUser(
+                    username=f'bench{i}',
+                    phone_number=f'+2222{i:07d}',
+                    password='!',
+                    is_phone_verified=True,
+                )
+                for i in range(n_votes)
+            ])
+            admin = CustomUser.objects.create_user(
+                username='bench_admin', password='bench-pass', user_type='super_admin'
+            )
+
+            batcher = VoteBatcher(window_ms=options['window_ms'])
+
+            for mode in ('direct', 'batched'):
+                now = timezone.now()
+                poll = Poll.objects.create(
+                    title=f'Benchmark ({mode})',
+                    start_time=now,
+                    end_time=now + timedelta(hours=1),
+                    created_by=admin,
+                    status='active',
+                )
+                options_list = [
+                    Option.objects.create(poll=poll, option_text=f'Option {i}', order=i)
+                    for i in range(4)
+                ]
+
+                created, failed, elapsed = self._cast(
+                    mode, batcher, poll, options_list, users, n_threads
+                )
+
+                self.stdout.write(
+                    f'{mode:8} votes/s: {created / elapsed:8.1f}  '
+                    f'stored: {Vote.objects.filter(poll=poll).count()}  failed: {failed}'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Benchmarked {n_votes} votes per mode with {n_threads} threads'
+        ))
+
+    def _cast(self, mode, batcher, poll, options_list, users, n_threads):
+        """Cast one vote per user from n_threads threads, return (created, failed, seconds)"""
+        counts = {'created': 0, 'failed': 0}
+        counter_lock = threading.Lock()
+
+        def voter(chunk):
+            for index, user in chunk:
+                option = options_list[index % len(options_list)]
+                try:
+                    if mode == 'batched':
+                        outcome = batcher.submit(Vote(poll=poll, user=user, option=option))
+                    else:
+                        outcome = record_vote(poll, user, option, mode='direct')
+                    ok = outcome == VOTE_CREATED
+                except Exception:
+                    ok = False
+                with counter_lock:
+                    counts['created' if ok else 'failed'] += 1
+            connection.close()
+
+        indexed = list(enumerate(users))
+        threads = [
+            threading.Thread(target=voter, args=(indexed[i::n_threads],))
+            for i in range(n_threads)
+        ]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return counts['created'], counts['failed'], timer.elapsed
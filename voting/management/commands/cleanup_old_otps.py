@@ -0,0 +1,37 @@
+# management/commands/cleanup_old_otps.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from voting.models import OTPLog
+from voting.retention import get_retention_settings, purge
+
+
+class Command(BaseCommand):
+    help = 'Clean up old OTP logs (older than 24 hours); see purge_expired for sessions too'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Delete OTP logs older than this many hours (default: 24)',
+        )
+    
+    def handle(self, *args, **options):
+        hours = options['hours']
+        cutoff_time = timezone.now() - timedelta(hours=hours)
+        retention = get_retention_settings()
+        
+        report = purge(
+            'otp_logs',
+            OTPLog.objects.filter(created_at__lt=cutoff_time),
+            retention['batch_size'],
+            retention['pause'],
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully deleted {report.rows} old OTP logs (older than {hours} hours); '
+                f'lock held {report.lock_seconds * 1000:.1f} ms'
+            )
+        )
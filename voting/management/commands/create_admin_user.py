@@ -0,0 +1,44 @@
+# management/commands/create_admin_user.py
+from django.core.management.base import BaseCommand
+from django.core.management import CommandError
+from voting.models import CustomUser  # Replace with your app name
+
+
+class Command(BaseCommand):
+    help = 'Create admin users (view_admin or super_admin)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('phone_number', type=str, help='Phone number for the admin')
+        parser.add_argument('password', type=str, help='Password for the admin')
+        parser.add_argument(
+            '--type',
+            type=str,
+            choices=['view_admin', 'super_admin'],
+            default='view_admin',
+            help='Type of admin to create'
+        )
+    
+    def handle(self, *args, **options):
+        phone_number = options['phone_number']
+        password = options['password']
+        admin_type = options['type']
+        
+        # Check if user already exists
+        if CustomUser.objects.filter(phone_number=phone_number).exists():
+            raise CommandError(f'User with phone number {phone_number} already exists')
+        
+        # Create admin user
+        admin_user = CustomUser.objects.create_user(
+            phone_number=phone_number,
+            username=phone_number,
+            password=password,
+            user_type=admin_type,
+            is_phone_verified=True,
+            is_staff=True if admin_type == 'super_admin' else False
+        )
+        
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully created {admin_type} with phone number {phone_number}'
+            )
+        )
@@ -0,0 +1,90 @@
+# management/commands/create_poll.py
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from voting.models import CustomUser, Poll, Team
+from voting.polls import PollBuildError, build_poll
+
+
+def _parse_time(value, name):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise CommandError(f'{name} must be an ISO date and time, got {value!r}')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Create a poll from a JSON template'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'template',
+            type=str,
+            help=(
+                'JSON file with title, description, status, duration_hours or end_time, and '
+                'either "teams" (a list of team IDs, or "active" for every active team) or "options"; '
+                'optional "ballot_type": single, ranked or approval'
+            ),
+        )
+        parser.add_argument(
+            '--created-by',
+            required=True,
+            help='Username of the super admin the poll is created for',
+        )
+        parser.add_argument('--title', help='Override the template title')
+        parser.add_argument(
+            '--start',
+            help='Start time, ISO format (default: the template start_time, else now)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['template'], encoding='utf-8') as handle:
+                template = json.load(handle)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read template: {e}')
+
+        try:
+            creator = CustomUser.objects.get(username=options['created_by'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"User {options['created_by']} not found")
+        if not creator.can_create_polls():
+            raise CommandError(f'{creator.username} is not allowed to create polls')
+
+        start = options['start'] or template.get('start_time')
+        start_time = _parse_time(start, 'start') if start else timezone.now()
+        if template.get('end_time'):
+            end_time = _parse_time(template['end_time'], 'end_time')
+        elif template.get('duration_hours'):
+            end_time = start_time + timedelta(hours=float(template['duration_hours']))
+        else:
+            raise CommandError('The template needs end_time or duration_hours')
+
+        team_ids = template.get('teams')
+        if team_ids == 'active':
+            team_ids = list(Team.objects.filter(is_active=True).order_by('created_at').values_list('id', flat=True))
+
+        try:
+            poll = build_poll(
+                title=options['title'] or template.get('title'),
+                description=template.get('description', ''),
+                start_time=start_time,
+                end_time=end_time,
+                created_by=creator,
+                status=template.get('status', 'draft'),
+                team_ids=team_ids,
+                option_texts=template.get('options'),
+                ballot_type=template.get('ballot_type', Poll.BALLOT_SINGLE),
+            )
+        except PollBuildError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created poll '{poll.title}' ({poll.id}) with {poll.options.count()} options, status {poll.status}"
+        ))
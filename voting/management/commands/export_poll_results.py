@@ -0,0 +1,62 @@
+# management/commands/export_poll_results.py
+import csv
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from voting.models import Poll
+from voting.results import get_results
+
+
+class Command(BaseCommand):
+    help = 'Export poll results to CSV'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('poll_id', type=str, help='Poll ID to export')
+        parser.add_argument(
+            '--output',
+            type=str,
+            default='poll_results.csv',
+            help='Output filename (default: poll_results.csv)'
+        )
+    
+    def handle(self, *args, **options):
+        poll_id = options['poll_id']
+        output_file = options['output']
+        
+        try:
+            poll = Poll.objects.get(id=poll_id)
+        except Poll.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'Poll with ID {poll_id} not found'))
+            return
+        
+        # Create CSV file
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            
+            # Header
+            writer.writerow([
+                'Poll Title',
+                'Option',
+                'Vote Count',
+                'Percentage'
+            ])
+            
+            # From the snapshot for closed polls, so archived polls export too
+            results = get_results(poll)
+            total_votes = results['total_votes']
+            
+            # Data rows
+            for row in results['options_with_results']:
+                writer.writerow([
+                    poll.title,
+                    row['option']['option_text'],
+                    row['vote_count'],
+                    f"{row['percentage']:.2f}%"
+                ])
+            
+            # Summary row
+            writer.writerow([])
+            writer.writerow(['Total Votes', '', total_votes, '100.00%'])
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Poll results exported to {output_file}')
+        )
@@ -0,0 +1,192 @@
+# management/commands/import_members.py
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from voting.models import CustomUser
+from voting.participation import assign_missing_ordinals
+from voting.utils import canonical_phone_number, phone_key
+
+
+def _init_worker():
+    # Spawned workers (macOS, Windows) start without configured settings
+    django.setup()
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        yield from csv.DictReader(handle)
+
+
+def _read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise CommandError('Reading .xlsx files requires openpyxl (pip install openpyxl)')
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for values in rows:
+            yield {
+                column: '' if value is None else str(value)
+                for column, value in zip(header, values)
+            }
+    finally:
+        workbook.close()
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Import club members from a CSV or XLSX roster'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Roster file (.csv or .xlsx), first row is the header')
+        parser.add_argument(
+            '--phone-column',
+            default='phone_number',
+            help='Header of the phone number column (default: phone_number)',
+        )
+        parser.add_argument(
+            '--name-column',
+            default='full_name',
+            help='Header of the full name column (default: full_name)',
+        )
+        parser.add_argument(
+            '--password-column',
+            default='password',
+            help='Header of the initial password column, if any (default: password)',
+        )
+        parser.add_argument(
+            '--default-password',
+            help='Initial password for rows without one; without it those members get an unusable password',
+        )
+        parser.add_argument(
+            '--verified',
+            action='store_true',
+            help='Mark imported phone numbers as verified, so members can log in without an OTP',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows hashed and inserted per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Password hashing processes (default: one per CPU)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the roster and report without creating users',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'File not found: {path}')
+
+        suffix = path.suffix.lower()
+        if suffix == '.csv':
+            rows = _read_csv(path)
+        elif suffix == '.xlsx':
+            rows = _read_xlsx(path)
+        else:
+            raise CommandError('Only .csv and .xlsx rosters are supported')
+
+        self.phone_column = options['phone_column']
+        self.name_column = options['name_column']
+        self.password_column = options['password_column']
+        self.default_password = options['default_password']
+        self.verified = options['verified']
+        self.workers = max(1, options['workers'])
+        self.stats = {'read': 0, 'invalid': 0, 'duplicate': 0, 'created': 0}
+
+        # One query for every phone key already registered; the set also
+        # catches repeats within the roster
+        self.seen = set(
+            CustomUser.objects.filter(phone_key__isnull=False).values_list('phone_key', flat=True)
+        )
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            for batch in _batches(self.parse(rows), options['batch_size']):
+                if not options['dry_run']:
+                    users = self.build_users(batch, pool)
+                    with transaction.atomic():
+                        CustomUser.objects.bulk_create(users, batch_size=options['batch_size'])
+                        # bulk_create skips save(), which hands out ordinals
+                        assign_missing_ordinals(CustomUser.objects.filter(id__in=[user.id for user in users]))
+                self.stats['created'] += len(batch)
+        elapsed = time.perf_counter() - start
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(
+            f"Read {self.stats['read']} rows: {self.stats['invalid']} invalid, "
+            f"{self.stats['duplicate']} already registered or repeated"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {self.stats['created']} members in {elapsed:.2f}s "
+            f"({self.stats['read'] / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+
+    def parse(self, rows):
+        """Yield (phone_key, full_name, password) for new, valid members"""
+        for line, row in enumerate(rows, start=2):
+            self.stats['read'] += 1
+            if self.phone_column not in row:
+                raise CommandError(f"Column '{self.phone_column}' not found in the header")
+
+            raw_phone = (row.get(self.phone_column) or '').strip()
+            key = phone_key(raw_phone)
+            if key is None:
+                self.stats['invalid'] += 1
+                self.stderr.write(f'Line {line}: invalid phone number {raw_phone!r}')
+                continue
+
+            if key in self.seen:
+                self.stats['duplicate'] += 1
+                continue
+            self.seen.add(key)
+
+            full_name = (row.get(self.name_column) or '').strip() or None
+            password = (row.get(self.password_column) or '').strip() or self.default_password
+            yield key, full_name, password
+
+    def build_users(self, batch, pool):
+        """Hash the batch's passwords across the pool and build unsaved users"""
+        # make_password(None) is an unusable password and needs no hashing
+        to_hash = [password for _, _, password in batch if password]
+        chunksize = max(1, len(to_hash) // (self.workers * 4))
+        hashes = iter(pool.map(make_password, to_hash, chunksize=chunksize))
+
+        return [
+            CustomUser(
+                username=canonical_phone_number(key),
+                phone_number=canonical_phone_number(key),
+                # bulk_create skips save(), which keeps phone_key in sync
+                phone_key=key,
+                full_name=full_name,
+                password=next(hashes) if password else make_password(None),
+                user_type='user',
+                is_phone_verified=self.verified,
+            )
+            for key, full_name, password in batch
+        ]
@@ -0,0 +1,61 @@
+# management/commands/purge_expired.py
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from voting.retention import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Purge old OTP logs and expired sessions in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            help="Delete OTP logs older than this many hours (default: VOTING_SETTINGS['OTP_LOG_RETENTION_HOURS'])",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help="Rows deleted per transaction (default: VOTING_SETTINGS['PURGE_BATCH_SIZE'])",
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            help="Minimum seconds between batches (default: VOTING_SETTINGS['PURGE_PAUSE_SECONDS'])",
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running, purging every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Seconds between passes with --loop (default: 300)',
+        )
+        parser.add_argument(
+            '--nice',
+            type=int,
+            default=10,
+            help='Lower the process CPU priority by this much (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        if options['nice'] and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+
+        while True:
+            for report in purge_expired(options['hours'], options['batch_size'], options['pause']):
+                self.stdout.write(str(report))
+            if not options['loop']:
+                break
+            # Don't sit on a connection the database may have dropped meanwhile
+            close_old_connections()
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Purge complete'))
@@ -0,0 +1,77 @@
+# management/commands/query_report.py
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+class Command(BaseCommand):
+    help = 'Summarize the worst slow and repeated queries from the query log'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=str(settings.BASE_DIR / 'logs' / 'queries.jsonl'),
+            help='Query log to read (default: logs/queries.jsonl)',
+        )
+        parser.add_argument(
+            '--kind',
+            choices=['slow', 'repeated'],
+            help='Only report one kind of finding',
+        )
+        parser.add_argument(
+            '--hours',
+            type=float,
+            help='Only consider findings from the last N hours',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10,
+            help='Number of offenders to show (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        offenders = {}
+        skipped = 0
+
+        try:
+            log = open(options['file'], encoding='utf-8')
+        except FileNotFoundError:
+            raise CommandError(f"No query log at {options['file']}")
+
+        with log:
+            for line in log:
+                try:
+                    finding = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if options['kind'] and finding['kind'] != options['kind']:
+                    continue
+                if since and parse_datetime(finding['ts']) < since:
+                    continue
+
+                key = (finding['kind'], finding['view'], finding['template'] or finding['code'], finding['sql'])
+                offender = offenders.setdefault(key, {'requests': 0, 'queries': 0, 'total_ms': 0.0, 'worst': 0})
+                offender['requests'] += 1
+                offender['queries'] += finding['count']
+                offender['total_ms'] += finding['total_ms']
+                offender['worst'] = max(offender['worst'], finding['count'] if finding['kind'] == 'repeated' else finding['total_ms'])
+
+        ranked = sorted(offenders.items(), key=lambda item: item[1]['total_ms'], reverse=True)
+        for (kind, view, origin, sql), offender in ranked[:options['limit']]:
+            worst = f"{offender['worst']} per request" if kind == 'repeated' else f"{offender['worst']:.1f}ms max"
+            self.stdout.write(
+                f"{offender['total_ms']:10.1f}ms  {kind:8}  {view}  ({origin or 'unknown origin'})\n"
+                f"            seen in {offender['requests']} requests, {offender['queries']} queries, {worst}\n"
+                f"            {sql[:200]}"
+            )
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {skipped} unreadable lines'))
+        self.stdout.write(self.style.SUCCESS(f'{len(offenders)} distinct offenders, showing {min(len(ranked), options["limit"])}'))
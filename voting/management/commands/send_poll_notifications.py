@@ -0,0 +1,74 @@
+# management/commands/send_poll_notifications.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from voting.models import Poll, CustomUser
+from voting.participation import non_voters
+from voting.utils import send_sms_notification
+
+
+class Command(BaseCommand):
+    help = 'Send notifications about upcoming or active polls'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--upcoming',
+            action='store_true',
+            help='Send notifications for upcoming polls (starting in 1 hour)',
+        )
+        parser.add_argument(
+            '--closing',
+            action='store_true',
+            help='Send notifications for polls closing in 1 hour',
+        )
+    
+    def handle(self, *args, **options):
+        now = timezone.now()
+        sent_count = 0
+        
+        if options['upcoming']:
+            # Notify about polls starting in 1 hour
+            upcoming_polls = Poll.objects.filter(
+                status='scheduled',
+                start_time__gte=now,
+                start_time__lte=now + timedelta(hours=1)
+            )
+            
+            users = CustomUser.objects.filter(
+                user_type='user',
+                is_phone_verified=True
+            )
+            
+            for poll in upcoming_polls:
+                message = f"Voting will start soon for: {poll.title}. Be ready to vote!"
+                
+                for user in users:
+                    if send_sms_notification(user.phone_number, message):
+                        sent_count += 1
+        
+        if options['closing']:
+            # Notify about polls closing in 1 hour
+            closing_polls = Poll.objects.filter(
+                status='active',
+                end_time__gte=now,
+                end_time__lte=now + timedelta(hours=1)
+            )
+            
+            # Get users who haven't voted yet, from the poll's voter bitmap
+            members = CustomUser.objects.filter(
+                user_type='user',
+                is_phone_verified=True
+            ).only('id', 'ordinal', 'phone_number')
+            
+            for poll in closing_polls:
+                users_not_voted = non_voters(poll, members)
+                
+                message = f"Last chance to vote! '{poll.title}' closes in 1 hour."
+                
+                for user in users_not_voted:
+                    if send_sms_notification(user.phone_number, message):
+                        sent_count += 1
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully sent {sent_count} notifications')
+        )
@@ -0,0 +1,229 @@
+# metrics.py
+"""
+In-process request metrics exposed in the Prometheus text format.
+
+Each worker process keeps its own registry; scrape every worker (or sum
+them in Prometheus) for totals. Recording is a dict lookup, a bisect and
+a few additions under a lock, so it is cheap enough to leave on.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    """Monotonic counter with labels"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last one is +Inf), sum, count]
+        self._values = {}
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        names = self.labelnames + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', _format_labels(names, key + (bound,)), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+REQUESTS = Counter(
+    'voting_http_requests_total', 'HTTP requests by view, method and status code',
+    ('view', 'method', 'status'),
+)
+REQUEST_LATENCY = Histogram(
+    'voting_http_request_duration_seconds', 'Request latency by view', ('view',),
+)
+DB_QUERIES = Histogram(
+    'voting_db_queries_per_request', 'Database queries issued per request by view', ('view',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_TIME = Histogram(
+    'voting_db_time_per_request_seconds', 'Time spent in database queries per request by view', ('view',),
+)
+TEMPLATE_RENDER = Histogram(
+    'voting_template_render_seconds', 'Template render time by view and template', ('view', 'template'),
+)
+SMS_LATENCY = Histogram(
+    'voting_sms_request_duration_seconds', 'SMS provider call latency by provider and outcome',
+    ('provider', 'outcome'),
+)
+
+ADMISSION_SHED = Counter(
+    'voting_admission_shed_total', 'Requests turned away with 503 by admission control, by priority',
+    ('priority',),
+)
+
+THROTTLED = Counter(
+    'voting_throttled_total', 'Requests refused with 429 by the throttle, by view and scope',
+    ('view', 'scope'),
+)
+
+VOTE_REPLAYS = Counter(
+    'voting_vote_replays_total', 'Vote submissions answered from their idempotency key, by state of the first one',
+    ('state',),
+)
+
+REGISTRY = [
+    REQUESTS, REQUEST_LATENCY, DB_QUERIES, DB_TIME, TEMPLATE_RENDER, SMS_LATENCY,
+    ADMISSION_SHED, THROTTLED, VOTE_REPLAYS,
+]
+
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format (0.0.4)"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== Per-request state ====================
+
+class RequestStats:
+    """What one request spent in the database and templates"""
+    __slots__ = ('queries', 'db_time', 'templates')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        # (template name, seconds); the view name is only known at the end
+        self.templates = []
+
+
+# A ContextVar rather than a thread-local: asgiref copies the context into
+# sync_to_async threads, so queries from async views are counted too
+current_stats = ContextVar('voting_request_stats', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - start
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install_query_counter, dispatch_uid='voting.metrics.query_counter')
+
+
+def view_label(request):
+    """URL name of the view that served request, or 'unresolved'"""
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unresolved'
+
+
+def record_request(request, response, stats, elapsed):
+    """Fold one finished request into the registry"""
+    view = view_label(request)
+
+    REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+    REQUEST_LATENCY.observe(elapsed, view=view)
+    DB_QUERIES.observe(stats.queries, view=view)
+    DB_TIME.observe(stats.db_time, view=view)
+    for template_name, seconds in stats.templates:
+        TEMPLATE_RENDER.observe(seconds, view=view, template=template_name)
+
+
+# ==================== Template timing ====================
+
+class _TimedTemplate:
+    """Wrap a backend template and record its render time on the request"""
+
+    def __init__(self, template):
+        self.template = template
+        self.origin = template.origin
+
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.templates.append((self.origin.template_name, time.perf_counter() - start))
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that times top-level template renders"""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,213 @@
+# middleware.py
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from .admission import AdmissionController, ReleasingIterator, classify, get_admission_settings, shed_response
+from .metrics import RequestStats, current_stats, record_request
+from .querylog import QueryTrace, current_trace, get_inspector_settings, report
+from .throttle import check, check_cache_backend, get_throttle_rules, set_rate_limit_headers, throttled_response
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count/time and template render time per view.
+
+    Place it right after SecurityMiddleware so the latency covers the rest
+    of the stack. Views are labelled by URL name, falling back to
+    'unresolved' for requests that never reached a view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        record_request(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        record_request(request, response, stats, time.perf_counter() - start)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Cap requests in flight per worker, keeping room for votes and logins.
+
+    See voting/admission.py. Place it after MetricsMiddleware, so shed
+    requests are still counted, and before SessionMiddleware, so they
+    cost no session or database work.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = get_admission_settings()
+        if not options['max_in_flight']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.retry_after = options['retry_after']
+        self.controller = AdmissionController(
+            options['max_in_flight'], options['normal_share'], options['low_share']
+        )
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _hold_until_streamed(self, response):
+        # A streamed body is produced after the view returns; keep the slot
+        # until the server closes the response
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = ReleasingIterator(response.streaming_content, self.controller.release)
+            return True
+        return False
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        priority = classify(request)
+        if not self.controller.try_acquire(priority):
+            return shed_response(request, priority, self.retry_after)
+
+        held = False
+        try:
+            response = self.get_response(request)
+            held = self._hold_until_streamed(response)
+        finally:
+            if not held:
+                self.controller.release()
+        return response
+
+    async def __acall__(self, request):
+        priority = classify(request)
+        if not self.controller.try_acquire(priority):
+            return shed_response(request, priority, self.retry_after)
+
+        held = False
+        try:
+            response = await self.get_response(request)
+            held = self._hold_until_streamed(response)
+        finally:
+            if not held:
+                self.controller.release()
+        return response
+
+
+class QueryInspectorMiddleware:
+    """
+    Trace a sample of requests for slow and repeated queries.
+
+    See voting/querylog.py. Untraced requests cost one random() call.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate, self.slow_ms, self.repeat_threshold = get_inspector_settings()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        trace = QueryTrace(self.slow_ms, self.repeat_threshold)
+        token = current_trace.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_trace.reset(token)
+        report(request, trace)
+        return response
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+
+        trace = QueryTrace(self.slow_ms, self.repeat_threshold)
+        token = current_trace.set(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_trace.reset(token)
+        report(request, trace)
+        return response
+
+
+class ThrottleMiddleware:
+    """
+    Enforce VOTING_SETTINGS['THROTTLE_RATES'] per view.
+
+    See voting/throttle.py. Place it after AuthenticationMiddleware so
+    logged-in requests count against their account. Throttled views get
+    X-RateLimit-* headers; refused requests a 429 with Retry-After.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.rules = get_throttle_rules()
+        if not self.rules:
+            raise MiddlewareNotUsed
+        check_cache_backend()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        self._add_headers(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self._add_headers(request, response)
+        return response
+
+    def _add_headers(self, request, response):
+        state = getattr(request, 'throttle_state', None)
+        if state is not None:
+            set_rate_limit_headers(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        rule = self.rules.get(request.resolver_match.url_name)
+        if rule is None or not rule.applies_to(request):
+            return None
+
+        result = check(rule, request)
+        if result is None:
+            return None
+        scope, request.throttle_state = result
+        if not request.throttle_state.allowed:
+            return throttled_response(request, rule, scope, request.throttle_state)
+        return None
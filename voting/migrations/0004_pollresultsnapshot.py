@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0003_remove_customuser_otp_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollResultSnapshot',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='result_snapshot', serialize=False, to='voting.poll')),
+                ('total_votes', models.PositiveIntegerField()),
+                ('eligible_voters', models.PositiveIntegerField(help_text='Verified users when the poll closed')),
+                ('tallies', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Poll result snapshot',
+                'verbose_name_plural': 'Poll result snapshots',
+            },
+        ),
+    ]
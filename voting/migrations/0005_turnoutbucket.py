@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+
+
+def backfill_turnout(apps, schema_editor):
+    # Same buckets as voting.rollups.rebuild_turnout
+    Vote = apps.get_model('voting', 'Vote')
+    TurnoutBucket = apps.get_model('voting', 'TurnoutBucket')
+    rows = (
+        Vote.objects.annotate(minute=TruncMinute('voted_at'))
+        .values('poll_id', 'option_id', 'minute')
+        .annotate(vote_count=Count('id'))
+        .order_by()
+    )
+    TurnoutBucket.objects.bulk_create(
+        (
+            TurnoutBucket(
+                poll_id=row['poll_id'], option_id=row['option_id'], minute=row['minute'], vote_count=row['vote_count']
+            )
+            for row in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0004_pollresultsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoutBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField(help_text='Start of the minute the votes were cast in')),
+                ('vote_count', models.PositiveIntegerField(default=0)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnout_buckets', to='voting.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnout_buckets', to='voting.poll')),
+            ],
+            options={
+                'ordering': ['minute'],
+                'indexes': [models.Index(fields=['poll', 'minute'], name='voting_turn_poll_id_8bfe83_idx')],
+                'unique_together': {('poll', 'option', 'minute')},
+            },
+        ),
+        migrations.RunPython(backfill_turnout, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_team_tallies(apps, schema_editor):
+    # Same rows as voting.rollups.rebuild_team_tallies
+    Vote = apps.get_model('voting', 'Vote')
+    TeamPollTally = apps.get_model('voting', 'TeamPollTally')
+    rows = (
+        Vote.objects.filter(option__team__isnull=False)
+        .values('option__team_id', 'poll_id')
+        .annotate(vote_count=Count('id'))
+        .order_by()
+        .values_list('option__team_id', 'poll_id', 'vote_count')
+    )
+    TeamPollTally.objects.bulk_create(
+        [TeamPollTally(team_id=team_id, poll_id=poll_id, vote_count=vote_count) for team_id, poll_id, vote_count in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_turnoutbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamPollTally',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vote_count', models.PositiveIntegerField(default=0)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='team_tallies', to='voting.poll')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='poll_tallies', to='voting.team')),
+            ],
+            options={
+                'unique_together': {('team', 'poll')},
+            },
+        ),
+        migrations.RunPython(backfill_team_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0006_teampolltally'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text="When this poll's votes were moved to ArchivedVote (see voting.archive)", null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedVote',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('voted_at', models.DateTimeField()),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_votes', to='voting.option')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_votes', to='voting.poll')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_votes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-voted_at'],
+                'unique_together': {('poll', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0007_archivedvote'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedvote',
+            index=models.Index(fields=['poll', 'voted_at'], name='voting_arch_poll_id_f09a5a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['poll', 'voted_at'], name='voting_vote_poll_id_a6ddb8_idx'),
+        ),
+    ]
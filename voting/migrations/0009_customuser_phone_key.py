@@ -0,0 +1,68 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:47
+
+from django.db import migrations, models
+
+
+def _phone_key(phone_number):
+    # Frozen copy of voting.utils.format_mauritanian_phone, so this
+    # migration keeps giving the same keys if the helper changes
+    digits_only = ''.join(filter(str.isdigit, phone_number or ''))
+    if digits_only.startswith('222') and len(digits_only) == 11:
+        digits_only = digits_only[3:]
+    elif digits_only.startswith('00222') and len(digits_only) == 13:
+        digits_only = digits_only[5:]
+    if len(digits_only) == 8 and digits_only[0] in '234':
+        return int(digits_only)
+    for i in range(len(digits_only) - 7):
+        candidate = digits_only[i:i + 8]
+        if candidate[0] in '234':
+            return int(candidate)
+    return None
+
+
+def backfill_phone_key(apps, schema_editor):
+    CustomUser = apps.get_model('voting', 'CustomUser')
+    users = (
+        CustomUser.objects.filter(phone_number__isnull=False)
+        .exclude(phone_number='')
+        .only('id', 'phone_number')
+        # When legacy rows normalize to the same number, the verified and
+        # oldest account keeps the key; the others can't log in by phone
+        .order_by('-is_phone_verified', 'created_at')
+    )
+
+    taken = set()
+    batch = []
+    for user in users.iterator(chunk_size=1000):
+        key = _phone_key(user.phone_number)
+        if key is None or key in taken:
+            continue
+        taken.add(key)
+        user.phone_key = key
+        batch.append(user)
+        if len(batch) == 1000:
+            CustomUser.objects.bulk_update(batch, ['phone_key'])
+            batch = []
+    if batch:
+        CustomUser.objects.bulk_update(batch, ['phone_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0008_vote_poll_voted_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='phone_key',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='8-digit national number of phone_number, used for phone lookups', null=True),
+        ),
+        migrations.RunPython(backfill_phone_key, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='phone_key',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='8-digit national number of phone_number, used for phone lookups', null=True, unique=True),
+        ),
+    ]
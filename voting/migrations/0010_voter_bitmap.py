@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-19 19:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_ordinals(apps, schema_editor):
+    CustomUser = apps.get_model('voting', 'CustomUser')
+    users = CustomUser.objects.only('id').order_by('created_at', 'id')
+
+    batch = []
+    for ordinal, user in enumerate(users.iterator(chunk_size=1000), start=1):
+        user.ordinal = ordinal
+        batch.append(user)
+        if len(batch) == 1000:
+            CustomUser.objects.bulk_update(batch, ['ordinal'])
+            batch = []
+    if batch:
+        CustomUser.objects.bulk_update(batch, ['ordinal'])
+
+
+def backfill_bitmaps(apps, schema_editor):
+    # Same bit layout as voting.participation.set_bits
+    PollVoterBitmap = apps.get_model('voting', 'PollVoterBitmap')
+    bitmaps = {}
+    for model_name in ('Vote', 'ArchivedVote'):
+        votes = apps.get_model('voting', model_name).objects.values_list('poll_id', 'user__ordinal')
+        for poll_id, ordinal in votes.iterator(chunk_size=2000):
+            bits, count = bitmaps.get(poll_id, (bytearray(), 0))
+            index, mask = ordinal >> 3, 1 << (ordinal & 7)
+            if index >= len(bits):
+                bits.extend(bytes(index + 1 - len(bits)))
+            if not bits[index] & mask:
+                bits[index] |= mask
+                count += 1
+            bitmaps[poll_id] = bits, count
+
+    PollVoterBitmap.objects.bulk_create(
+        [
+            PollVoterBitmap(poll_id=poll_id, bits=bytes(bits), voter_count=count)
+            for poll_id, (bits, count) in bitmaps.items()
+        ],
+        batch_size=100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0009_customuser_phone_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='ordinal',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text="Dense user number, the user's bit in the per-poll voter bitmaps", null=True),
+        ),
+        migrations.RunPython(backfill_ordinals, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='customuser',
+            name='ordinal',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text="Dense user number, the user's bit in the per-poll voter bitmaps", null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='PollVoterBitmap',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='voter_bitmap', serialize=False, to='voting.poll')),
+                ('bits', models.BinaryField(default=bytes)),
+                ('voter_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_bitmaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 19:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0010_voter_bitmap'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poll',
+            name='ballot_type',
+            field=models.CharField(choices=[('single', 'Single choice'), ('ranked', 'Ranked choice (instant runoff)'), ('approval', 'Approval (any number of options)')], default='single', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Ballot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('choices', models.BinaryField(max_length=255)),
+                ('cast_at', models.DateTimeField(auto_now_add=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ballots', to='voting.poll')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ballots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('poll', 'user')},
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Same as voting.participation.SEGMENT_BYTES
+SEGMENT_BYTES = 64
+
+
+def split_bitmaps(apps, schema_editor):
+    PollVoterBitmap = apps.get_model('voting', 'PollVoterBitmap')
+    VoterBitmapSegment = apps.get_model('voting', 'VoterBitmapSegment')
+
+    segments = []
+    for poll_id, bits in PollVoterBitmap.objects.values_list('poll_id', 'bits').iterator(chunk_size=100):
+        bits = bytes(bits)
+        for segment, start in enumerate(range(0, len(bits), SEGMENT_BYTES)):
+            segment_bits = bits[start:start + SEGMENT_BYTES]
+            if any(segment_bits):
+                segments.append(VoterBitmapSegment(
+                    poll_id=poll_id,
+                    segment=segment,
+                    bits=segment_bits,
+                    voter_count=int.from_bytes(segment_bits, 'little').bit_count(),
+                ))
+    VoterBitmapSegment.objects.bulk_create(segments, batch_size=500)
+
+
+def join_segments(apps, schema_editor):
+    PollVoterBitmap = apps.get_model('voting', 'PollVoterBitmap')
+    VoterBitmapSegment = apps.get_model('voting', 'VoterBitmapSegment')
+
+    bitmaps = {}
+    segments = VoterBitmapSegment.objects.order_by('poll_id', 'segment').values_list(
+        'poll_id', 'segment', 'bits', 'voter_count'
+    )
+    for poll_id, segment, segment_bits, count in segments.iterator(chunk_size=1000):
+        bits, total = bitmaps.get(poll_id, (bytearray(), 0))
+        bits.extend(bytes(segment * SEGMENT_BYTES - len(bits)))
+        bits += segment_bits
+        bitmaps[poll_id] = bits, total + count
+
+    PollVoterBitmap.objects.bulk_create(
+        [
+            PollVoterBitmap(poll_id=poll_id, bits=bytes(bits), voter_count=count)
+            for poll_id, (bits, count) in bitmaps.items()
+        ],
+        batch_size=100,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0011_ballots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterBitmapSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.PositiveIntegerField()),
+                ('bits', models.BinaryField(default=bytes)),
+                ('voter_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='voter_segments', to='voting.poll')),
+            ],
+            options={
+                'unique_together': {('poll', 'segment')},
+            },
+        ),
+        migrations.RunPython(split_bitmaps, join_segments),
+        migrations.DeleteModel(
+            name='PollVoterBitmap',
+        ),
+    ]
@@ -1,10 +1,14 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import DEFERRED, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
 import uuid
 
+from .utils import phone_key
+
 
 class CustomUserManager(BaseUserManager):
     """Custom user manager to handle both username and phone-based users"""
@@ -86,23 +90,28 @@ class CustomUser(AbstractUser):
         null=True,
         help_text="Phone number for regular users"
     )
+    # Canonical lookup key for phone_number, kept in sync by save()
+    phone_key = models.PositiveIntegerField(
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="8-digit national number of phone_number, used for phone lookups"
+    )
+    # Dense 1-based number, assigned by save(); the user's bit in the voter bitmaps
+    ordinal = models.PositiveIntegerField(
+        unique=True,
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="Dense user number, the user's bit in the per-poll voter bitmaps"
+    )
     
-    # OTP verification fields
+    # OTP verification (pending codes live in voting.otp, not on this row)
     is_phone_verified = models.BooleanField(
         default=False,
         help_text="Whether the phone number has been verified via OTP"
     )
-    otp_code = models.CharField(
-        max_length=6, 
-        blank=True, 
-        null=True,
-        help_text="Current OTP code for verification"
-    )
-    otp_created_at = models.DateTimeField(
-        blank=True, 
-        null=True,
-        help_text="When the current OTP was generated"
-    )
     
     # User type field
     user_type = models.CharField(
@@ -130,6 +139,33 @@ class CustomUser(AbstractUser):
         verbose_name_plural = 'Users'
         ordering = ['-created_at']
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # Remember the stored number, so save() only recomputes phone_key
+        # when it changes
+        user._loaded_phone_number = user.__dict__.get('phone_number', DEFERRED)
+        return user
+    
+    def _phone_number_changed(self):
+        if self._state.adding:
+            return True
+        if 'phone_number' not in self.__dict__:
+            # Deferred and never touched
+            return False
+        return self.phone_number != getattr(self, '_loaded_phone_number', DEFERRED)
+    
+    def _free_phone_key(self):
+        """
+        phone_key of phone_number, or None if another account already has
+        it: migration 0009 left legacy duplicates without a key, and saving
+        one of them must not trip the unique index.
+        """
+        key = phone_key(self.phone_number)
+        if key is not None and CustomUser.objects.filter(phone_key=key).exclude(pk=self.pk).exists():
+            return None
+        return key
+    
     def save(self, *args, **kwargs):
         # For regular users, set username to phone_number if not set
         if self.user_type == 'user' and self.phone_number and not self.username:
@@ -150,8 +186,38 @@ class CustomUser(AbstractUser):
         # Auto-verify admin users
         if self.user_type in ['view_admin', 'super_admin']:
             self.is_phone_verified = True
+        
+        if self._phone_number_changed():
+            self.phone_key = self._free_phone_key()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'phone_number' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'phone_key'}
             
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        self._loaded_phone_number = self.__dict__.get('phone_number')
+        if adding and self.ordinal is None:
+            self.assign_ordinal()
+    
+    def assign_ordinal(self):
+        """Give the saved user the next free ordinal, if they have none yet"""
+        last = (
+            CustomUser.objects.filter(ordinal__isnull=False)
+            .order_by('-ordinal')
+            .values('ordinal')[:1]
+        )
+        # One UPDATE reads the current maximum and claims the next number;
+        # retry if a concurrent registration claimed it first
+        for _ in range(3):
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.filter(pk=self.pk, ordinal__isnull=True).update(
+                        ordinal=Coalesce(Subquery(last), 0) + 1
+                    )
+                break
+            except IntegrityError:
+                continue
+        self.ordinal = CustomUser.objects.values_list('ordinal', flat=True).get(pk=self.pk)
     
     def clean(self):
         """Validate user data"""
@@ -243,8 +309,8 @@ class Team(models.Model):
         return self.name
     
     def get_vote_count(self):
-        """Get total votes for this team across all polls"""
-        return Vote.objects.filter(option__team=self).count()
+        """Get total votes for this team across all polls (from the TeamPollTally rollup)"""
+        return self.poll_tallies.aggregate(total=models.Sum('vote_count'))['total'] or 0
 
 
 class Poll(models.Model):
@@ -256,6 +322,15 @@ class Poll(models.Model):
         ('closed', 'Closed'),
     ]
     
+    BALLOT_SINGLE = 'single'
+    BALLOT_RANKED = 'ranked'
+    BALLOT_APPROVAL = 'approval'
+    BALLOT_CHOICES = [
+        (BALLOT_SINGLE, 'Single choice'),
+        (BALLOT_RANKED, 'Ranked choice (instant runoff)'),
+        (BALLOT_APPROVAL, 'Approval (any number of options)'),
+    ]
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, null=True)
@@ -263,8 +338,15 @@ class Poll(models.Model):
     end_time = models.DateTimeField()
     created_by = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='created_polls')
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='draft')
+    # Single-choice votes are Vote rows; ranked and approval ballots are Ballot rows
+    ballot_type = models.CharField(max_length=10, choices=BALLOT_CHOICES, default=BALLOT_SINGLE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    archived_at = models.DateTimeField(
+        blank=True,
+        null=True,
+        help_text="When this poll's votes were moved to ArchivedVote (see voting.archive)"
+    )
     
     class Meta:
         ordering = ['-created_at']
@@ -282,16 +364,30 @@ class Poll(models.Model):
     def is_expired(self):
         return timezone.now() > self.end_time or self.status == 'closed'
     
+    def uses_ballots(self):
+        return self.ballot_type != self.BALLOT_SINGLE
+    
     def get_total_votes(self):
+        # Closed polls read the frozen total; select_related('result_snapshot')
+        # makes this free on listings
+        if self.status == 'closed':
+            try:
+                return self.result_snapshot.total_votes
+            except PollResultSnapshot.DoesNotExist:
+                pass
+        if self.uses_ballots():
+            return Ballot.objects.filter(poll=self).count()
         return Vote.objects.filter(poll=self).count()
     
     def update_status(self):
         """Auto update poll status based on time"""
         now = timezone.now()
+        if self.status == 'active' and now > self.end_time:
+            from .results import close_poll
+            close_poll(self)
+            return
         if self.status == 'scheduled' and now >= self.start_time:
             self.status = 'active'
-        elif self.status == 'active' and now > self.end_time:
-            self.status = 'closed'
         self.save()
 
 
@@ -342,12 +438,123 @@ class Vote(models.Model):
     class Meta:
         unique_together = ['poll', 'user']  # Ensures one vote per user per poll
         ordering = ['-voted_at']
+        # Per-poll listings and exports in time order read this index instead of sorting
+        indexes = [models.Index(fields=['poll', 'voted_at'])]
+    
+    def __str__(self):
+        user_display = self.user.full_name or self.user.phone_number
+        return f"{user_display} voted for {self.option.option_text} in {self.poll.title}"
+
+
+class ArchivedVote(models.Model):
+    """Votes of long-closed polls, moved out of Vote by voting.archive"""
+    id = models.UUIDField(primary_key=True, editable=False)
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='archived_votes')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_votes')
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='archived_votes')
+    voted_at = models.DateTimeField()
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    
+    class Meta:
+        unique_together = ['poll', 'user']
+        ordering = ['-voted_at']
+        indexes = [models.Index(fields=['poll', 'voted_at'])]
     
     def __str__(self):
         user_display = self.user.full_name or self.user.phone_number
         return f"{user_display} voted for {self.option.option_text} in {self.poll.title}"
 
 
+class Ballot(models.Model):
+    """A ranked or approval ballot, one row per voter (see voting.ballots)"""
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='ballots')
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='ballots')
+    # One byte per chosen option: its position in the poll's option order.
+    # Most preferred first on ranked ballots, ascending on approval ballots
+    choices = models.BinaryField(max_length=255)
+    cast_at = models.DateTimeField(auto_now_add=True)
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    
+    class Meta:
+        unique_together = ['poll', 'user']
+    
+    def __str__(self):
+        return f"Ballot of {self.user_id} in {self.poll_id}"
+
+
+class TurnoutBucket(models.Model):
+    """Votes per poll, option and minute, maintained as votes arrive (see voting.rollups)"""
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='turnout_buckets')
+    option = models.ForeignKey(Option, on_delete=models.CASCADE, related_name='turnout_buckets')
+    minute = models.DateTimeField(help_text="Start of the minute the votes were cast in")
+    vote_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['poll', 'option', 'minute']
+        indexes = [models.Index(fields=['poll', 'minute'])]
+        ordering = ['minute']
+    
+    def __str__(self):
+        return f"{self.poll_id} {self.minute:%Y-%m-%d %H:%M}: {self.vote_count}"
+
+
+class TeamPollTally(models.Model):
+    """Votes a team received in one poll, maintained as votes arrive (see voting.rollups)"""
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='poll_tallies')
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='team_tallies')
+    vote_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['team', 'poll']
+    
+    def __str__(self):
+        return f"{self.team_id} in {self.poll_id}: {self.vote_count}"
+
+
+class PollResultSnapshot(models.Model):
+    """Final results of a closed poll, written once when it closes (see voting.results)"""
+    poll = models.OneToOneField(
+        Poll,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='result_snapshot'
+    )
+    total_votes = models.PositiveIntegerField()
+    eligible_voters = models.PositiveIntegerField(
+        help_text="Verified users when the poll closed"
+    )
+    # [{"option_id", "option_text", "vote_count"}, ...], most votes first
+    tallies = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Poll result snapshot'
+        verbose_name_plural = 'Poll result snapshots'
+    
+    def __str__(self):
+        return f"Results of poll {self.poll_id} ({self.total_votes} votes)"
+
+
+class VoterBitmapSegment(models.Model):
+    """
+    One segment of who has voted in a poll: bit CustomUser.ordinal is set
+    per voter (see voting.participation)
+    """
+    poll = models.ForeignKey(Poll, on_delete=models.CASCADE, related_name='voter_segments')
+    # Segment n holds the bits of ordinals n * SEGMENT_BITS and up; bit k of
+    # byte k // 8 (least significant first) is the user with the k-th of them
+    segment = models.PositiveIntegerField()
+    bits = models.BinaryField(default=bytes)
+    voter_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['poll', 'segment']
+    
+    def __str__(self):
+        return f"Voters of poll {self.poll_id}, segment {self.segment}: {self.voter_count}"
+
+
 class OTPLog(models.Model):
     """Track OTP requests for rate limiting"""
     phone_number = models.CharField(max_length=17)
@@ -0,0 +1,68 @@
+# otp.py
+"""
+Pending OTP codes.
+
+Codes live in the shared cache with a native TTL instead of on the
+CustomUser row, so sending a code never writes to the users table.
+OTPLog still records each send for rate limiting and auditing.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+from .models import OTPLog
+
+OTP_VALID = 'valid'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+
+KEY_PREFIX = 'voting.otp:'
+
+
+def _cache():
+    return caches['shared']
+
+
+def _key(phone_number):
+    return f'{KEY_PREFIX}{phone_number}'
+
+
+def get_otp_ttl():
+    """OTP lifetime in seconds"""
+    return settings.VOTING_SETTINGS.get('OTP_EXPIRY_MINUTES', 5) * 60
+
+
+def store_otp(phone_number, otp_code):
+    """Remember the code just sent to phone_number, replacing any earlier one"""
+    _cache().set(_key(phone_number), otp_code, get_otp_ttl())
+    OTPLog.objects.create(phone_number=phone_number, otp_code=otp_code)
+
+
+async def astore_otp(phone_number, otp_code):
+    """See store_otp()"""
+    await _cache().aset(_key(phone_number), otp_code, get_otp_ttl())
+    await OTPLog.objects.acreate(phone_number=phone_number, otp_code=otp_code)
+
+
+def consume_otp(phone_number, otp_code):
+    """
+    Check otp_code against the pending code and consume it.
+
+    Returns OTP_VALID, OTP_INVALID or OTP_EXPIRED. This doesn't rely on an
+    atomic add() or get-and-delete, which FileBasedCache lacks: delete()
+    reports whether this call removed the key (on FileBasedCache, whether
+    its unlink won), so when two requests race with the right code only
+    one of them gets OTP_VALID. A code resent between the get() and the
+    delete() is consumed along with the old one and has to be sent again.
+    """
+    cache = _cache()
+    key = _key(phone_number)
+    pending = cache.get(key)
+
+    if pending is None:
+        return OTP_EXPIRED
+    if not constant_time_compare(pending, otp_code):
+        return OTP_INVALID
+    if not cache.delete(key):
+        return OTP_EXPIRED
+    return OTP_VALID
@@ -0,0 +1,83 @@
+# polls.py
+"""
+Poll creation.
+
+build_poll() validates the ballot and creates the poll and all of its
+options in one transaction: the selected teams are checked with a single
+in_bulk() query and the options are inserted with one bulk_create(), so
+a 20-team ballot costs three queries instead of forty separate ones.
+Used by create_poll_view and the create_poll management command.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Option, Poll, Team
+
+
+class PollBuildError(Exception):
+    """The poll definition is invalid; the message is shown to the admin"""
+
+
+def _team_options(team_ids):
+    # Keep the admin's order, ignore a team selected twice
+    team_ids = list(dict.fromkeys(str(team_id) for team_id in team_ids))
+    if len(team_ids) < 2:
+        raise PollBuildError('يجب اختيار فريقين على الأقل للتصويت')
+
+    try:
+        teams = Team.objects.filter(is_active=True).in_bulk(team_ids)
+    except ValidationError:
+        # Malformed UUIDs from a tampered form
+        raise PollBuildError('Invalid team selection')
+    teams = {str(pk): team for pk, team in teams.items()}
+
+    missing = [team_id for team_id in team_ids if team_id not in teams]
+    if missing:
+        raise PollBuildError(f'{len(missing)} selected team(s) no longer exist or are inactive')
+
+    return [
+        Option(option_text=teams[team_id].name, team=teams[team_id], order=i)
+        for i, team_id in enumerate(team_ids)
+    ]
+
+
+def _custom_options(option_texts):
+    texts = [text.strip() for text in option_texts if text and text.strip()]
+    if len(texts) < 2:
+        raise PollBuildError('At least 2 options are required')
+
+    return [Option(option_text=text, order=i) for i, text in enumerate(texts)]
+
+
+def build_poll(*, title, start_time, end_time, created_by, description='', status='draft',
+               team_ids=None, option_texts=None, ballot_type=Poll.BALLOT_SINGLE):
+    """
+    Create a poll with one option per team (team_ids) or per text (option_texts).
+    ballot_type is one of Poll.BALLOT_CHOICES.
+
+    Raises PollBuildError without writing anything if the definition is invalid.
+    """
+    if not all([title, start_time, end_time]):
+        raise PollBuildError('Title, start/end times are required')
+    if (team_ids is None) == (option_texts is None):
+        raise PollBuildError('Give either teams or custom options')
+    if ballot_type not in dict(Poll.BALLOT_CHOICES):
+        raise PollBuildError(f'Unknown ballot type {ballot_type!r}')
+
+    options = _team_options(team_ids) if team_ids is not None else _custom_options(option_texts)
+
+    with transaction.atomic():
+        poll = Poll.objects.create(
+            title=title,
+            description=description,
+            start_time=start_time,
+            end_time=end_time,
+            created_by=created_by,
+            status=status,
+            ballot_type=ballot_type,
+        )
+        for option in options:
+            option.poll = poll
+        Option.objects.bulk_create(options)
+
+    return poll
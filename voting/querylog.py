@@ -0,0 +1,154 @@
+# querylog.py
+"""
+Slow-query and N+1 detection.
+
+QueryInspectorMiddleware traces a sample of requests (every request when
+DEBUG is on). Within a traced request each query is timed and grouped by
+its SQL shape; queries slower than SLOW_QUERY_MS and shapes repeated at
+least N_PLUS_ONE_THRESHOLD times are written as JSON lines to the
+'voting.queries' logger, with the view name and the template line or
+code line that issued them. `manage.py query_report` summarizes the log.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+from django.utils import timezone
+
+from .metrics import view_label
+
+logger = logging.getLogger('voting.queries')
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Instrumentation frames sit between the caller and the query, skip them
+_SKIPPED_FILES = tuple(os.path.join(APP_DIR, name) for name in ('querylog.py', 'metrics.py', 'middleware.py'))
+_IN_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+def normalize_sql(sql):
+    """Collapse IN (%s, %s, ...) lists so batches of any size share one shape"""
+    return _IN_LIST.sub('(%s, ...)', sql)
+
+
+def get_inspector_settings():
+    """(sample rate, slow threshold in ms, repeat threshold)"""
+    voting_settings = settings.VOTING_SETTINGS
+    return (
+        voting_settings.get('QUERY_INSPECTOR_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.01),
+        voting_settings.get('SLOW_QUERY_MS', 100),
+        voting_settings.get('N_PLUS_ONE_THRESHOLD', 5),
+    )
+
+
+def find_origin():
+    """
+    Return (template, code) for the current query.
+
+    template is "name:line" of the innermost template node being rendered,
+    code is "file:line" of the innermost frame inside this app; either may
+    be None. Only called for queries that are about to be reported.
+    """
+    template = code = None
+    frame = sys._getframe(1)
+    while frame is not None and (template is None or code is None):
+        if template is None:
+            node = frame.f_locals.get('self')
+            if isinstance(node, Node) and node.origin is not None:
+                lineno = node.token.lineno if node.token else '?'
+                template = f'{node.origin.template_name}:{lineno}'
+        if code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_DIR) and filename not in _SKIPPED_FILES:
+                code = f'{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno}'
+        frame = frame.f_back
+    return template, code
+
+
+class QueryTrace:
+    """Queries seen during one traced request"""
+    __slots__ = ('slow_ms', 'repeat_threshold', 'origin_at', 'shapes', 'slow')
+
+    def __init__(self, slow_ms, repeat_threshold):
+        self.slow_ms = slow_ms
+        self.repeat_threshold = repeat_threshold
+        # Walking the stack is the costly part, so a shape's origin is taken
+        # at its first repeat, or at once when a single run is reported
+        self.origin_at = max(1, min(2, repeat_threshold))
+        # shape -> [count, total seconds, (template, code) of the first repeat]
+        self.shapes = {}
+        # (shape, seconds, (template, code))
+        self.slow = []
+
+    def record(self, sql, elapsed):
+        shape = normalize_sql(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = [0, 0.0, None]
+        entry[0] += 1
+        entry[1] += elapsed
+        if entry[0] == self.origin_at:
+            entry[2] = find_origin()
+        if elapsed * 1000 >= self.slow_ms:
+            self.slow.append((shape, elapsed, find_origin()))
+
+    def findings(self):
+        """Yield one dict per slow query and per repeated shape"""
+        for shape, elapsed, (template, code) in self.slow:
+            yield {
+                'kind': 'slow',
+                'sql': shape,
+                'count': 1,
+                'total_ms': round(elapsed * 1000, 3),
+                'template': template,
+                'code': code,
+            }
+        for shape, (count, total, origin) in self.shapes.items():
+            if count >= self.repeat_threshold:
+                template, code = origin
+                yield {
+                    'kind': 'repeated',
+                    'sql': shape,
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'template': template,
+                    'code': code,
+                }
+
+
+current_trace = ContextVar('voting_query_trace', default=None)
+
+
+def _trace_query(execute, sql, params, many, context):
+    trace = current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.record(sql, time.perf_counter() - start)
+
+
+def _install_query_tracer(sender, connection, **kwargs):
+    if _trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_trace_query)
+
+
+connection_created.connect(_install_query_tracer, dispatch_uid='voting.querylog.query_tracer')
+
+
+def report(request, trace):
+    """Write the findings of one traced request to the query log"""
+    view = view_label(request)
+    timestamp = timezone.now().isoformat()
+
+    for finding in trace.findings():
+        finding.update(ts=timestamp, view=view, path=request.path)
+        logger.warning(json.dumps(finding, ensure_ascii=False))
@@ -0,0 +1,154 @@
+# results.py
+"""
+Poll results.
+
+Open polls are counted live with one grouped query. When a poll closes,
+its final tallies, turnout and eligible-voter count are frozen in a
+PollResultSnapshot in the same transaction as the status change. Every
+later read of the closed poll is a single primary-key lookup, and the
+participation rate no longer drifts as new users register.
+
+Ranked-choice and approval polls are tallied by voting.tally from their
+Ballot rows; their vote total is the number of ballots, and ranked
+tallies carry the votes of every runoff round.
+"""
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Count
+
+from .models import CustomUser, Option, PollResultSnapshot
+
+NEUTRAL_OPTION_TEXT = 'حيادي'
+
+
+def _eligible_voters():
+    return CustomUser.objects.filter(user_type='user', is_phone_verified=True)
+
+
+def _live_options(poll):
+    return Option.objects.filter(poll=poll).annotate(vote_count=Count('votes'))
+
+
+def _tallies(options):
+    """Most votes first; ties keep the options' display order"""
+    return sorted(
+        (
+            {'option_id': str(option.id), 'option_text': option.option_text, 'vote_count': option.vote_count}
+            for option in options
+        ),
+        key=lambda tally: tally['vote_count'],
+        reverse=True
+    )
+
+
+def _live_tallies(poll):
+    """(tallies, total votes) of a poll that is still open"""
+    if poll.uses_ballots():
+        from .tally import tally_ballots
+        return tally_ballots(poll)
+    tallies = _tallies(_live_options(poll))
+    return tallies, sum(tally['vote_count'] for tally in tallies)
+
+
+def summarize(tallies, eligible_voters, total_votes=None):
+    """
+    Build the poll_results.html context from tallies and the eligible-voter
+    count. total_votes defaults to the sum of the tallies, which is wrong
+    for approval ballots (one ballot approves several options).
+    """
+    if total_votes is None:
+        total_votes = sum(tally['vote_count'] for tally in tallies)
+    # Vote has unique_together (poll, user), so every vote is a distinct voter
+    unique_voters = total_votes
+
+    return {
+        'total_votes': total_votes,
+        'options_with_results': [
+            {
+                'option': {'id': tally['option_id'], 'option_text': tally['option_text']},
+                'vote_count': tally['vote_count'],
+                'percentage': (tally['vote_count'] / total_votes) * 100 if total_votes else 0,
+                'rounds': tally.get('rounds', []),
+            }
+            for tally in tallies
+        ],
+        'round_numbers': list(range(1, len(tallies[0].get('rounds', [])) + 1)) if tallies else [],
+        'total_registered_users': eligible_voters,
+        'unique_voters': unique_voters,
+        'participation_rate': round((unique_voters / eligible_voters * 100) if eligible_voters > 0 else 0, 1),
+        'valid_votes': total_votes,
+        'invalid_votes': 0,
+        'neutral_votes': sum(
+            tally['vote_count'] for tally in tallies if tally['option_text'] == NEUTRAL_OPTION_TEXT
+        ),
+    }
+
+
+def take_snapshot(poll):
+    """Freeze poll's current results; returns the existing snapshot if there is one"""
+    with transaction.atomic():
+        snapshot = PollResultSnapshot.objects.filter(poll=poll).first()
+        if snapshot is not None:
+            return snapshot
+
+        tallies, total_votes = _live_tallies(poll)
+        return PollResultSnapshot.objects.create(
+            poll=poll,
+            tallies=tallies,
+            total_votes=total_votes,
+            eligible_voters=_eligible_voters().count(),
+        )
+
+
+def close_poll(poll, end_time=None):
+    """Close poll and snapshot its results atomically"""
+    with transaction.atomic():
+        poll.status = 'closed'
+        update_fields = ['status', 'updated_at']
+        if end_time is not None:
+            poll.end_time = end_time
+            update_fields.append('end_time')
+        poll.save(update_fields=update_fields)
+        return take_snapshot(poll)
+
+
+def reopen_poll(poll, end_time):
+    """Put a closed poll back to active; its snapshot no longer holds"""
+    if poll.archived_at:
+        from .archive import restore_poll
+        restore_poll(poll)
+    with transaction.atomic():
+        poll.status = 'active'
+        poll.end_time = end_time
+        poll.save(update_fields=['status', 'end_time', 'updated_at'])
+        PollResultSnapshot.objects.filter(poll=poll).delete()
+
+
+def get_results(poll):
+    """Results context for poll, from the snapshot once it is closed"""
+    if poll.status == 'closed':
+        try:
+            snapshot = poll.result_snapshot
+        except PollResultSnapshot.DoesNotExist:
+            # Closed before snapshots existed, or closed by a direct status edit
+            snapshot = take_snapshot(poll)
+        return summarize(snapshot.tallies, snapshot.eligible_voters, snapshot.total_votes)
+
+    tallies, total_votes = _live_tallies(poll)
+    return summarize(tallies, _eligible_voters().count(), total_votes)
+
+
+async def aget_results(poll):
+    """See get_results()"""
+    if poll.status == 'closed':
+        snapshot = await PollResultSnapshot.objects.filter(poll=poll).afirst()
+        if snapshot is None:
+            snapshot = await sync_to_async(take_snapshot)(poll)
+        return summarize(snapshot.tallies, snapshot.eligible_voters, snapshot.total_votes)
+
+    if poll.uses_ballots():
+        tallies, total_votes = await sync_to_async(_live_tallies)(poll)
+        return summarize(tallies, await _eligible_voters().acount(), total_votes)
+
+    options = [option async for option in _live_options(poll)]
+    return summarize(_tallies(options), await _eligible_voters().acount())
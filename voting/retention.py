@@ -0,0 +1,104 @@
+# retention.py
+"""
+Chunked purge of expired rows.
+
+A plain queryset.delete() over weeks of OTPLog rows is one long DELETE
+that holds the SQLite writer lock, and with it every login and vote, for
+the whole purge. purge() instead walks the expired rows in primary-key
+order: it reads the next batch of keys without locking, then deletes just
+that key range in its own short transaction, and sleeps between batches
+for at least PURGE_DUTY_RATIO times as long as it held the lock. The walk
+works the same for integer ids (OTPLog) and string keys (django_session).
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OTPLog
+
+logger = logging.getLogger(__name__)
+
+# Sleep at least this many times the lock hold time between batches, so
+# the purge keeps the writer lock for a small fraction of the time
+PURGE_DUTY_RATIO = 4
+
+
+def get_retention_settings():
+    voting_settings = settings.VOTING_SETTINGS
+    return {
+        'otp_hours': voting_settings.get('OTP_LOG_RETENTION_HOURS', 24),
+        'batch_size': voting_settings.get('PURGE_BATCH_SIZE', 500),
+        'pause': voting_settings.get('PURGE_PAUSE_SECONDS', 0.1),
+    }
+
+
+class PurgeReport:
+    """Rows removed from one table and how long the deletes held the lock"""
+    __slots__ = ('name', 'rows', 'batches', 'lock_seconds', 'max_lock_seconds')
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.lock_seconds = 0.0
+        self.max_lock_seconds = 0.0
+
+    def __str__(self):
+        return (
+            f'{self.name}: {self.rows} rows in {self.batches} batches, '
+            f'lock held {self.lock_seconds * 1000:.1f} ms total, '
+            f'{self.max_lock_seconds * 1000:.1f} ms max'
+        )
+
+
+def purge(name, queryset, batch_size, pause):
+    """Delete every row of queryset, batch_size primary keys at a time"""
+    report = PurgeReport(name)
+    keys = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+
+    while True:
+        batch_keys = keys.filter(pk__gt=last) if last is not None else keys
+        batch = list(batch_keys[:batch_size])
+        if not batch:
+            break
+        first, last = batch[0], batch[-1]
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            # The range is re-filtered so rows that stopped qualifying
+            # since the read are left alone
+            deleted, _ = queryset.filter(pk__gte=first, pk__lte=last).delete()
+        held = time.perf_counter() - start
+
+        report.rows += deleted
+        report.batches += 1
+        report.lock_seconds += held
+        report.max_lock_seconds = max(report.max_lock_seconds, held)
+
+        if len(batch) < batch_size:
+            break
+        time.sleep(max(pause, held * PURGE_DUTY_RATIO))
+
+    if report.rows:
+        logger.info('Purged %s', report)
+    return report
+
+
+def purge_expired(otp_hours=None, batch_size=None, pause=None):
+    """Purge OTP logs past retention and expired database sessions"""
+    defaults = get_retention_settings()
+    otp_hours = defaults['otp_hours'] if otp_hours is None else otp_hours
+    batch_size = batch_size or defaults['batch_size']
+    pause = defaults['pause'] if pause is None else pause
+
+    now = timezone.now()
+    return [
+        purge('otp_logs', OTPLog.objects.filter(created_at__lt=now - timedelta(hours=otp_hours)), batch_size, pause),
+        purge('sessions', Session.objects.filter(expire_date__lt=now), batch_size, pause),
+    ]
@@ -0,0 +1,232 @@
+# rollups.py
+"""
+Incrementally maintained vote aggregates.
+
+record_votes() is called by voting.ingest inside the transaction that
+inserts the votes, so an aggregate never counts a vote that was rolled
+back. Each aggregate row a batch touches costs one UPDATE (plus an
+INSERT the first time), whatever the number of votes it adds; in
+'batched' ingestion mode a burst of votes for the same option shares
+one. Votes removed outside of ingestion (admin deletes) are not
+subtracted; the rebuild commands recompute an aggregate from the votes,
+archived ones included (see voting.archive).
+
+TurnoutBucket: votes per poll, option and minute, for the turnout curve
+(ranked and approval polls have none; their curve is counted from the
+ballots).
+TeamPollTally: votes per team and poll, for team listings and details.
+VoterBitmapSegment: who has voted in each poll (see voting.participation).
+An option's team is fixed when the poll is created; if it is changed by
+hand afterwards, rebuild the team tallies.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMinute
+
+from .archive import votes_for
+from .models import ArchivedVote, Ballot, Option, Poll, TeamPollTally, TurnoutBucket, Vote
+from .participation import record_voters
+
+
+def truncate_minute(moment):
+    return moment.replace(second=0, microsecond=0)
+
+
+def _increment(model, key, amount):
+    """Add amount to model.vote_count for the row identified by key, creating it if needed"""
+    if model.objects.filter(**key).update(vote_count=F('vote_count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(vote_count=amount, **key)
+    except IntegrityError:
+        # Another writer created the row between our update and insert
+        model.objects.filter(**key).update(vote_count=F('vote_count') + amount)
+
+
+def _option_teams(votes):
+    """{option_id: team_id} for the votes' options, reusing options already loaded"""
+    teams = {}
+    missing = set()
+    for vote in votes:
+        if Vote.option.is_cached(vote):
+            teams[vote.option_id] = vote.option.team_id
+        else:
+            missing.add(vote.option_id)
+    missing.difference_update(teams)
+    if missing:
+        teams.update(Option.objects.filter(id__in=missing).values_list('id', 'team_id'))
+    return teams
+
+
+def record_votes(votes):
+    """Fold freshly inserted votes into the aggregates"""
+    buckets = Counter(
+        (vote.poll_id, vote.option_id, truncate_minute(vote.voted_at)) for vote in votes
+    )
+    # Rows are locked in key order, so two batches sharing hot rows queue
+    # behind each other instead of deadlocking
+    for (poll_id, option_id, minute), amount in sorted(buckets.items()):
+        _increment(TurnoutBucket, {'poll_id': poll_id, 'option_id': option_id, 'minute': minute}, amount)
+
+    option_teams = _option_teams(votes)
+    tallies = Counter(
+        (option_teams[vote.option_id], vote.poll_id) for vote in votes
+        if option_teams.get(vote.option_id) is not None
+    )
+    for (team_id, poll_id), amount in sorted(tallies.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        _increment(TeamPollTally, {'team_id': team_id, 'poll_id': poll_id}, amount)
+
+    record_voters(votes)
+
+
+def rebuild_turnout(poll):
+    """Recompute poll's turnout buckets from its votes; returns the number of buckets"""
+    rows = (
+        votes_for(poll)
+        .annotate(minute=TruncMinute('voted_at'))
+        .values('option_id', 'minute')
+        .annotate(vote_count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        TurnoutBucket.objects.filter(poll=poll).delete()
+        buckets = TurnoutBucket.objects.bulk_create(
+            [
+                TurnoutBucket(poll=poll, option_id=row['option_id'], minute=row['minute'], vote_count=row['vote_count'])
+                for row in rows
+            ],
+            batch_size=500,
+        )
+    return len(buckets)
+
+
+def _ballot_turnout(poll):
+    """
+    (minute, option_id, count) rows of a ranked or approval poll's first
+    preferences or approvals, and {minute: ballots cast}.
+    """
+    from .ballots import ballot_options, decode_choices
+
+    options = ballot_options(poll)
+    rows = (
+        Ballot.objects.filter(poll=poll)
+        .annotate(minute=TruncMinute('cast_at'))
+        .values('minute', 'choices')
+        .annotate(n=Count('id'))
+        .order_by()
+        .values_list('minute', 'choices', 'n')
+    )
+    counts = Counter()
+    ballots = Counter()
+    for minute, choices, n in rows:
+        ballots[minute] += n
+        chosen = decode_choices(choices, options)
+        if poll.ballot_type == Poll.BALLOT_RANKED:
+            chosen = chosen[:1]
+        for option in chosen:
+            counts[minute, option.id] += n
+    return [(minute, option_id, n) for (minute, option_id), n in counts.items()], ballots
+
+
+def turnout_series(poll):
+    """
+    Dense per-minute series for charting.
+
+    Returns {'minutes': [...], 'options': [{'id', 'option_text', 'votes': [...]}],
+    'total': [...]}, with a zero for every minute an option got no votes.
+    On ranked and approval polls an option's series counts first
+    preferences or approvals, and 'total' counts ballots.
+    """
+    if poll.uses_ballots():
+        buckets, ballots = _ballot_turnout(poll)
+    else:
+        buckets = list(
+            TurnoutBucket.objects.filter(poll=poll)
+            .order_by('minute')
+            .values_list('minute', 'option_id', 'vote_count')
+        )
+        ballots = None
+    minutes = sorted({minute for minute, _, _ in buckets}.union(ballots or ()))
+    position = {minute: index for index, minute in enumerate(minutes)}
+
+    options = list(poll.options.values('id', 'option_text'))
+    series = {option['id']: [0] * len(minutes) for option in options}
+    total = [0] * len(minutes)
+    for minute, option_id, vote_count in buckets:
+        series[option_id][position[minute]] = vote_count
+        if ballots is None:
+            total[position[minute]] += vote_count
+    for minute, n in (ballots or {}).items():
+        total[position[minute]] = n
+
+    return {
+        'minutes': [minute.isoformat() for minute in minutes],
+        'options': [
+            {'id': str(option['id']), 'option_text': option['option_text'], 'votes': series[option['id']]}
+            for option in options
+        ],
+        'total': total,
+    }
+
+
+def rebuild_team_tallies(teams=None):
+    """Recompute the team tallies (of teams, default all) from the votes; returns the number of rows"""
+    tallies = TeamPollTally.objects.all()
+    if teams is not None:
+        tallies = tallies.filter(team__in=teams)
+
+    counts = Counter()
+    for model in (Vote, ArchivedVote):
+        votes = model.objects.filter(option__team__isnull=False)
+        if teams is not None:
+            votes = votes.filter(option__team__in=teams)
+        rows = (
+            votes.values('option__team_id', 'poll_id')
+            .annotate(vote_count=Count('id'))
+            .order_by()
+            .values_list('option__team_id', 'poll_id', 'vote_count')
+        )
+        for team_id, poll_id, vote_count in rows:
+            counts[team_id, poll_id] += vote_count
+
+    with transaction.atomic():
+        tallies.delete()
+        created = TeamPollTally.objects.bulk_create(
+            [
+                TeamPollTally(team_id=team_id, poll_id=poll_id, vote_count=vote_count)
+                for (team_id, poll_id), vote_count in counts.items()
+            ],
+            batch_size=500,
+        )
+    return len(created)
+
+
+def team_vote_counts(teams):
+    """{team_id: total votes} for teams, in one query; teams without votes map to 0"""
+    team_ids = [team.pk for team in teams]
+    counts = dict.fromkeys(team_ids, 0)
+    counts.update(
+        TeamPollTally.objects.filter(team_id__in=team_ids)
+        .values('team_id')
+        .annotate(total=Sum('vote_count'))
+        .order_by()
+        .values_list('team_id', 'total')
+    )
+    return counts
+
+
+def _team_tallies(team):
+    return TeamPollTally.objects.filter(team=team).select_related('poll').order_by('-poll__start_time')
+
+
+def team_poll_breakdown(team):
+    """team's tallies with their polls, most recent poll first"""
+    return list(_team_tallies(team))
+
+
+async def ateam_poll_breakdown(team):
+    """See team_poll_breakdown()"""
+    return [tally async for tally in _team_tallies(team)]
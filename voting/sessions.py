@@ -0,0 +1,107 @@
+# sessions.py
+"""
+Cache-first session engine.
+
+Session state lives in the shared cache. The database copy is only written
+when the authenticated user of the session changes (login) and is removed
+on logout (flush), so ordinary page views never take the SQLite writer lock.
+Expiry is refreshed lazily, only once the remaining lifetime drops below
+VOTING_SETTINGS['SESSION_REFRESH_THRESHOLD_SECONDS'].
+"""
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.db import router, transaction
+
+logger = logging.getLogger(__name__)
+
+REFRESHED_AT_KEY = '_session_refreshed_at'
+
+
+def get_refresh_threshold():
+    return settings.VOTING_SETTINGS.get(
+        'SESSION_REFRESH_THRESHOLD_SECONDS', settings.SESSION_COOKIE_AGE // 2
+    )
+
+
+class SessionStore(CachedDBStore):
+    """
+    Cached sessions with database write-through on login and logout only.
+    """
+    cache_key_prefix = 'voting.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # Authenticated user id as last written to the database
+        self._persisted_user = None
+        self._renew = False
+
+    def load(self):
+        return self._track_loaded(super().load())
+
+    async def aload(self):
+        return self._track_loaded(await super().aload())
+
+    def _track_loaded(self, data):
+        self._persisted_user = data.get(SESSION_KEY)
+
+        refreshed_at = data.get(REFRESHED_AT_KEY)
+        if refreshed_at is not None:
+            expiry_age = self.get_expiry_age(expiry=data.get('_session_expiry'))
+            remaining = expiry_age - (time.time() - refreshed_at)
+            if remaining < get_refresh_threshold():
+                # Let SessionMiddleware save the session and resend the cookie
+                self._renew = True
+                self.modified = True
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        data[REFRESHED_AT_KEY] = int(time.time())
+        expiry_age = self.get_expiry_age()
+
+        if data.get(SESSION_KEY) != self._persisted_user or self._renew:
+            # Login, or a lazy renewal: keep the database copy valid so the
+            # session survives a cache restart
+            self._write_through(must_create)
+            self._persisted_user = data.get(SESSION_KEY)
+            self._renew = False
+        elif must_create:
+            if not self._cache.add(self.cache_key, data, expiry_age):
+                raise CreateError
+            return
+
+        try:
+            self._cache.set(self.cache_key, data, expiry_age)
+        except Exception:
+            logger.exception("Error saving session to cache (%s)", self._cache)
+
+    async def asave(self, must_create=False):
+        await sync_to_async(self.save)(must_create)
+
+    def cycle_key(self):
+        # The row of the old key is deleted, so the new key has to be written
+        # through on the next save even when the user is unchanged
+        super().cycle_key()
+        self._persisted_user = None
+
+    def _write_through(self, must_create):
+        if must_create:
+            DBStore.save(self, must_create=True)
+            return
+
+        # The row may not exist yet when the anonymous session was cache-only,
+        # so let Model.save() fall back from UPDATE to INSERT
+        obj = self.create_model_instance(self._get_session())
+        using = router.db_for_write(self.model, instance=obj)
+        with transaction.atomic(using=using):
+            obj.save(using=using)
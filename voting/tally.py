@@ -0,0 +1,176 @@
+# tally.py
+"""
+Tallies of ranked-choice and approval polls.
+
+A poll's ballots are read as raw bytes and packed into one uint8 matrix,
+a row per ballot and a column per rank, unused ranks padded with PAD.
+Approval counts are then one bincount over the matrix.
+
+Instant runoff keeps, for every ballot, the rank of its highest-ranked
+option still in the race. Each round counts those first choices with a
+bincount. If nobody has a majority of the ballots still in play, the
+option with the fewest votes is eliminated, and only the ballots that
+were counting for it move down their rankings to their next live
+choice. A round therefore costs time in proportion to the ballots that
+move, and no Python code runs per ballot.
+
+Ties for last place go to the option that did worse in the most recent
+earlier round where they differ, then to the one later on the ballot.
+
+NumPy is imported on first use, so only the processes that tally ranked
+or approval polls pay for it.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+from .ballots import PAD, ballot_options
+from .models import Ballot, Poll
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImproperlyConfigured('NumPy is required to tally ranked-choice and approval polls (pip install numpy)')
+    return numpy
+
+
+def ballot_matrix(ballots, width):
+    """uint8 matrix of the ballot byte strings, one row each, padded to width columns"""
+    np = _numpy()
+    pad = bytes([PAD])
+    packed = b''.join(bytes(choices)[:width].ljust(width, pad) for choices in ballots)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(-1, width)
+
+
+def approval_counts(matrix, n_options):
+    """Approvals per option position"""
+    np = _numpy()
+    return np.bincount(matrix.ravel(), minlength=PAD + 1)[:n_options]
+
+
+class RunoffResult:
+    """Outcome of an instant-runoff count"""
+    __slots__ = ('rounds', 'exhausted', 'eliminated', 'winner')
+
+    def __init__(self):
+        # Votes per option position in each round (0 once eliminated)
+        self.rounds = []
+        # Ballots with no live choice left, per round
+        self.exhausted = []
+        # Option positions in the order they were eliminated
+        self.eliminated = []
+        self.winner = None
+
+
+def instant_runoff(matrix, n_options):
+    """Run IRV rounds over a ballot_matrix(); returns a RunoffResult"""
+    np = _numpy()
+    result = RunoffResult()
+    n_ballots = len(matrix)
+    if n_options == 0:
+        return result
+
+    # Option n_options stands for "no live choice": padding maps to it, it
+    # never becomes active, and an extra column of it ends every ballot
+    width = matrix.shape[1]
+    prefs = np.full((n_ballots, width + 1), n_options, dtype=np.uint8)
+    prefs[:, :width] = np.minimum(matrix, n_options)
+    active = np.ones(n_options + 1, dtype=bool)
+    active[n_options] = False
+
+    # Every option is in the first round, so each ballot counts for its
+    # first choice
+    rank = np.zeros(n_ballots, dtype=np.intp)
+    top = prefs[:, 0].astype(np.intp)
+    counts = np.bincount(top, minlength=n_options + 1)
+
+    while True:
+        result.rounds.append(counts[:n_options].tolist())
+        result.exhausted.append(int(counts[n_options]))
+
+        candidates = np.flatnonzero(active[:n_options])
+        continuing = n_ballots - counts[n_options]
+        leader = candidates[np.argmax(counts[candidates])]
+        if continuing == 0:
+            break
+        if counts[leader] * 2 > continuing or len(candidates) == 1:
+            result.winner = int(leader)
+            break
+
+        loser = _last_place(candidates, counts, result.rounds)
+        active[loser] = False
+        result.eliminated.append(int(loser))
+
+        # Move the loser's ballots down to their next live choice, one rank
+        # at a time for the ones whose next choice is out too
+        moved = np.flatnonzero(top == loser)
+        stepping = moved
+        while len(stepping):
+            rank[stepping] += 1
+            choice = prefs[stepping, rank[stepping]]
+            stepping = stepping[~active[choice] & (choice != n_options)]
+        next_top = prefs[moved, rank[moved]].astype(np.intp)
+        top[moved] = next_top
+        counts[loser] = 0
+        counts += np.bincount(next_top, minlength=n_options + 1)
+
+    return result
+
+
+def _last_place(candidates, counts, rounds):
+    np = _numpy()
+    tied = candidates[counts[candidates] == counts[candidates].min()]
+    for earlier in reversed(rounds[:-1]):
+        if len(tied) == 1:
+            break
+        earlier = np.asarray(earlier)
+        tied = tied[earlier[tied] == earlier[tied].min()]
+    return tied[-1]
+
+
+def tally_ballots(poll):
+    """
+    Tallies of a ranked or approval poll, in the shape of results._tallies,
+    and the number of ballots.
+
+    Ranked tallies carry each option's votes per round under 'rounds';
+    their vote_count is the last round's, and the winner comes first.
+    """
+    options = ballot_options(poll)
+    ballots = Ballot.objects.filter(poll=poll).values_list('choices', flat=True)
+    matrix = ballot_matrix(ballots.iterator(chunk_size=5000), len(options))
+
+    if poll.ballot_type == Poll.BALLOT_APPROVAL:
+        counts = approval_counts(matrix, len(options)).tolist()
+        tallies = [
+            {'option_id': str(option.id), 'option_text': option.option_text, 'vote_count': counts[position]}
+            for position, option in enumerate(options)
+        ]
+        tallies.sort(key=lambda tally: tally['vote_count'], reverse=True)
+        return tallies, len(matrix)
+
+    result = instant_runoff(matrix, len(options))
+    final = result.rounds[-1] if result.rounds else [0] * len(options)
+    # Options still in the race rank above the eliminated ones, which rank
+    # by how long they lasted
+    survived = {position: index for index, position in enumerate(result.eliminated)}
+    order = sorted(
+        range(len(options)),
+        key=lambda position: (
+            position == result.winner,
+            position not in survived,
+            final[position],
+            survived.get(position, 0),
+        ),
+        reverse=True,
+    )
+    tallies = [
+        {
+            'option_id': str(options[position].id),
+            'option_text': options[position].option_text,
+            'vote_count': final[position],
+            'rounds': [round_counts[position] for round_counts in result.rounds],
+        }
+        for position in order
+    ]
+    return tallies, len(matrix)
@@ -1,3 +1,1545 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin import site as admin_site
+from django.contrib.auth import SESSION_KEY, authenticate
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import ingest, metrics, views
+from .admin import estimate_row_count
+from .management.commands._benchmark import HEAVY_MODULES, probe_startup
+from .admission import CRITICAL, LOW, NORMAL, AdmissionController, classify, shed_response
+from .middleware import AdmissionControlMiddleware, MetricsMiddleware, ThrottleMiddleware
+from .otp import OTP_EXPIRED, OTP_INVALID, OTP_VALID, consume_otp, get_otp_ttl, store_otp
+from .polls import PollBuildError, build_poll
+from .querylog import QueryTrace
+from .sessions import REFRESHED_AT_KEY, SessionStore, get_refresh_threshold
+from .archive import archivable_polls, archive_poll
+from .ballots import BallotError, cast_ballot, decode_choices, encode_choices
+from .conditional import dashboard_version, polls_list_version
+from .exports import VOTE_EXPORT_COLUMNS, stream_votes_csv, stream_votes_ndjson
+from .ingest import VOTE_CREATED, VOTE_DUPLICATE, record_vote, write_votes
+from .models import (
+    ArchivedVote, CustomUser, Option, OTPLog, Poll, PollResultSnapshot, Team, TeamPollTally, TurnoutBucket, VoterBitmapSegment,
+    Vote,
+)
+from .participation import (
+    SEGMENT_BITS, assign_missing_ordinals, non_voters, rebuild_voter_bitmap, set_bits, voter_bits, voter_count,
+)
+from .rollups import rebuild_team_tallies, rebuild_turnout
+from .retention import purge, purge_expired
+from .results import close_poll, get_results, reopen_poll
+from .tally import approval_counts, ballot_matrix, instant_runoff, tally_ballots
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+    'throttle': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-throttle'},
+}
+# The test runner turns DEBUG off, and the test process is the only worker
+TEST_VOTING_SETTINGS = {**settings.VOTING_SETTINGS, 'THROTTLE_LOCAL_MEMORY': True}
+
+
+def _histogram_count(histogram, **labels):
+    key = tuple(labels[name] for name in histogram.labelnames)
+    entry = histogram._values.get(key)
+    return entry[2] if entry else 0
+
+
+def _make_poll(created_by, title='Poll', options=(), **fields):
+    """A poll, active for a day from an hour ago unless fields say otherwise, and its options in order"""
+    now = timezone.now()
+    fields = {'start_time': now - timedelta(hours=1), 'end_time': now + timedelta(days=1), 'status': 'active', **fields}
+    poll = Poll.objects.create(title=title, created_by=created_by, **fields)
+    return poll, [Option.objects.create(poll=poll, option_text=text, order=i) for i, text in enumerate(options)]
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(
+            username='metrics_admin', password='pass', user_type='super_admin'
+        )
+        cls.voter = CustomUser.objects.create_user(
+            username='metrics_voter', password='pass', phone_number='+22222000001',
+            is_phone_verified=True,
+        )
+
+    def test_request_is_recorded_by_url_name(self):
+        self.client.force_login(self.voter)
+        before = _histogram_count(metrics.REQUEST_LATENCY, view='teams_list')
+        queries_before = metrics.DB_QUERIES._values.get(('teams_list',), [None, 0.0, 0])[1]
+
+        self.client.get('/teams/')
+
+        self.assertEqual(_histogram_count(metrics.REQUEST_LATENCY, view='teams_list'), before + 1)
+        self.assertGreater(metrics.DB_QUERIES._values[('teams_list',)][1], queries_before)
+        self.assertGreater(
+            _histogram_count(metrics.TEMPLATE_RENDER, view='teams_list', template='teams/teams_list.html'), 0
+        )
+
+    def test_endpoint_is_admin_only(self):
+        self.client.force_login(self.voter)
+        self.assertEqual(self.client.get('/vote-admin/metrics/').status_code, 403)
+
+        self.client.force_login(self.admin)
+        response = self.client.get('/vote-admin/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'# TYPE voting_http_request_duration_seconds histogram', response.content)
+
+    def test_endpoint_accepts_scrape_token(self):
+        with self.settings(VOTING_SETTINGS={'METRICS_TOKEN': 'scrape-secret'}):
+            self.assertEqual(
+                self.client.get('/vote-admin/metrics/', headers={'Authorization': 'Bearer wrong'}).status_code,
+                403,
+            )
+            self.assertEqual(
+                self.client.get('/vote-admin/metrics/', headers={'Authorization': 'Bearer scrape-secret'}).status_code,
+                200,
+            )
+
+    def test_overhead_per_request_is_small(self):
+        """The middleware plus a few counted queries must stay well under a millisecond"""
+        request = RequestFactory().get('/teams/')
+        request.resolver_match = resolve('/teams/')
+        response = HttpResponse()
+
+        def view(request):
+            stats = metrics.current_stats.get()
+            if stats is not None:
+                for _ in range(5):
+                    stats.queries += 1
+                    stats.db_time += 0.0001
+            return response
+
+        middleware = MetricsMiddleware(view)
+        rounds = 2000
+
+        def run(handler):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                handler(request)
+            return time.perf_counter() - start
+
+        # Best of three to keep scheduler noise out of the comparison
+        baseline = min(run(view) for _ in range(3))
+        instrumented = min(run(middleware) for _ in range(3))
+        overhead_per_request = (instrumented - baseline) / rounds
+
+        self.assertLess(overhead_per_request, 0.0002)
+
+
+# Applies settings.LOGGING in a fresh interpreter, with the log files moved
+# to a temporary directory, and prints what one warning wrote to each file
+LOGGING_PROBE = """
+import copy, json, logging, logging.config, os, pathlib, sys, tempfile
+os.environ['DJANGO_SETTINGS_MODULE'] = 'votingapp.settings'
+from django.conf import settings
+
+config = copy.deepcopy(settings.LOGGING)
+log_dir = pathlib.Path(tempfile.mkdtemp())
+for handler in config['handlers'].values():
+    if 'filename' in handler:
+        handler['filename'] = log_dir / pathlib.Path(handler['filename']).name
+logging.config.dictConfig(config)
+logging.getLogger('voting').warning('app line')
+logging.getLogger('voting.queries').warning('{"query": 1}')
+logging.shutdown()
+print(json.dumps({path.name: path.read_text() for path in log_dir.iterdir()}))
+"""
+
+
+class LoggingConfigTests(SimpleTestCase):
+
+    def test_dict_config_accepts_logging_settings(self):
+        result = subprocess.run(
+            [sys.executable, '-c', LOGGING_PROBE],
+            cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        files = json.loads(result.stdout.strip().splitlines()[-1])
+
+        self.assertEqual(json.loads(files['voting_app.log'])['message'], 'app line')
+        self.assertEqual(files['queries.jsonl'], '{"query": 1}\n')
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_heavy_modules_stay_out_of_start_up(self):
+        """A fresh worker serves its first page without ReportLab or requests"""
+        report = probe_startup('/')
+
+        self.assertEqual(report['status'], '200 OK')
+        self.assertEqual([name for name in HEAVY_MODULES if name in report['modules']], [])
+        # Generous bound: catches a heavy import creeping back, not noise
+        self.assertLess(report['boot_ms'] + report['first_request_ms'], 5000)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class UsersPdfTests(TestCase):
+
+    def test_admin_gets_pdf(self):
+        admin = CustomUser.objects.create_user(username='pdf_admin', password='pass', user_type='super_admin')
+        CustomUser.objects.create_user(
+            username='pdf_voter', password='pass', phone_number='+22222000002', full_name='Voter',
+        )
+        self.client.force_login(admin)
+
+        response = self.client.get('/vote-admin/users/print/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class AdminChangelistTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(
+            username='changelist_admin', password='pass', user_type='super_admin'
+        )
+        now = timezone.now()
+        cls.polls = [
+            Poll.objects.create(
+                title=f'Poll {i}', start_time=now, end_time=now + timedelta(hours=1), created_by=cls.admin
+            )
+            for i in range(2)
+        ]
+        cls.options = [Option.objects.create(poll=poll, option_text='A') for poll in cls.polls]
+
+    def add_rows(self, start, count):
+        voters = CustomUser.objects.bulk_create([
+            CustomUser(username=f'voter{i}', phone_number=f'+2222{i:07d}', password='!')
+            for i in range(start, start + count)
+        ])
+        Vote.objects.bulk_create([
+            Vote(poll=self.polls[i % 2], user=voter, option=self.options[i % 2])
+            for i, voter in enumerate(voters)
+        ])
+        OTPLog.objects.bulk_create([
+            OTPLog(phone_number=voter.phone_number, otp_code='123456') for voter in voters
+        ])
+
+    def changelist_queries(self, url):
+        caches['default'].clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.client.force_login(self.admin)
+        urls = [
+            '/admin/voting/vote/',
+            f'/admin/voting/vote/?poll__id__exact={self.polls[0].id}',
+            '/admin/voting/customuser/',
+            '/admin/voting/otplog/',
+        ]
+
+        self.add_rows(0, 10)
+        small = [self.changelist_queries(url) for url in urls]
+        self.add_rows(10, 90)
+        large = [self.changelist_queries(url) for url in urls]
+
+        self.assertEqual(large, small)
+        # The page really did list the 100 votes
+        response = self.client.get('/admin/voting/vote/')
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+
+    def result_count(self, url):
+        return self.client.get(url).context['cl'].result_count
+
+    def test_estimated_count_is_corrected_on_the_last_page(self):
+        self.client.force_login(self.admin)
+        caches['default'].clear()
+        self.add_rows(0, 30)
+        with mock.patch('voting.admin.ESTIMATED_COUNT_THRESHOLD', 5), \
+                mock.patch.object(admin_site._registry[Vote], 'list_per_page', 10):
+            self.assertEqual(self.result_count('/admin/voting/vote/'), 30)
+            Vote.objects.filter(user__username__in=[f'voter{i}' for i in range(10)]).delete()
+
+            # Pages inside the table keep the cached count
+            self.assertEqual(self.result_count('/admin/voting/vote/?p=2'), 30)
+            # The last page comes up empty: the count is taken again and the
+            # real last page is shown
+            response = self.client.get('/admin/voting/vote/?p=3')
+            self.assertEqual(response.context['cl'].result_count, 20)
+            self.assertEqual(response.context['cl'].page_num, 2)
+            self.assertEqual(len(response.context['cl'].result_list), 10)
+
+    def test_estimate_reads_the_analyze_statistics(self):
+        caches['default'].clear()
+        self.add_rows(0, 12)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.add_rows(12, 3)
+
+        self.assertEqual(estimate_row_count(Vote), 12)
+        with mock.patch('voting.admin.ESTIMATED_COUNT_THRESHOLD', 5), \
+                mock.patch.object(admin_site._registry[Vote], 'list_per_page', 5):
+            self.client.force_login(self.admin)
+            self.assertEqual(self.result_count('/admin/voting/vote/'), 12)
+            # More rows follow the page the estimate calls the last
+            response = self.client.get('/admin/voting/vote/?p=3')
+            self.assertEqual(response.context['cl'].result_count, 15)
+            self.assertEqual(len(response.context['cl'].result_list), 5)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class PhoneOrUsernameBackendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # What create_admin_user makes: the phone number is also the username
+        cls.admin = CustomUser.objects.create_user(
+            username='+22236000000', phone_number='+22236000000', password='pass',
+            user_type='super_admin', is_phone_verified=True, is_staff=True,
+        )
+        cls.voter = CustomUser.objects.create_user(
+            phone_number='+22222000003', password='pass', is_phone_verified=True,
+        )
+
+    def test_admin_logs_in_with_phone_number(self):
+        for identifier in ('+22236000000', '36000000', '+222 36 00 00 00'):
+            with self.subTest(identifier=identifier):
+                self.assertEqual(authenticate(username=identifier, password='pass'), self.admin)
+
+    def test_admin_logs_in_to_admin_site(self):
+        response = self.client.post(
+            '/admin/login/?next=/admin/', {'username': '+22236000000', 'password': 'pass'}
+        )
+        self.assertRedirects(response, '/admin/', fetch_redirect_response=False)
+
+    def test_voter_logs_in_with_phone_number(self):
+        self.assertEqual(authenticate(username='22000003', password='pass'), self.voter)
+        self.assertIsNone(authenticate(username='22000003', password='wrong'))
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class ArchiveTests(TestCase):
+
+    def test_vote_times_survive_archive_and_reopen(self):
+        admin = CustomUser.objects.create_user(username='archive_admin', password='pass', user_type='super_admin')
+        voter = CustomUser.objects.create_user(phone_number='+22222000004', password='pass')
+        cast_at = timezone.now() - timedelta(days=200)
+        poll = Poll.objects.create(
+            title='Archived', start_time=cast_at - timedelta(days=1), end_time=cast_at + timedelta(days=1),
+            created_by=admin, status='closed',
+        )
+        option = Option.objects.create(poll=poll, option_text='A')
+        vote = Vote.objects.create(poll=poll, user=voter, option=option)
+        Vote.objects.filter(pk=vote.pk).update(voted_at=cast_at)
+
+        archive_poll(poll)
+        self.assertEqual(ArchivedVote.objects.get(pk=vote.pk).voted_at, cast_at)
+        reopen_poll(poll, timezone.now() + timedelta(days=1))
+
+        self.assertEqual(Vote.objects.get(pk=vote.pk).voted_at, cast_at)
+
+
+class ThrottleBackendTests(SimpleTestCase):
+
+    def test_refuses_non_atomic_cache(self):
+        file_caches = {
+            **TEST_CACHES,
+            'throttle': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/throttle'},
+        }
+        with override_settings(CACHES=file_caches):
+            with self.assertRaises(ImproperlyConfigured):
+                ThrottleMiddleware(lambda request: HttpResponse())
+        with override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS):
+            ThrottleMiddleware(lambda request: HttpResponse())
+
+    def test_refuses_per_process_buckets_with_debug_off(self):
+        with override_settings(CACHES=TEST_CACHES, DEBUG=False):
+            with self.assertRaisesMessage(ImproperlyConfigured, 'VOTING_REDIS_URL'):
+                ThrottleMiddleware(lambda request: HttpResponse())
+        with override_settings(CACHES=TEST_CACHES, DEBUG=True):
+            ThrottleMiddleware(lambda request: HttpResponse())
+        with override_settings(CACHES=TEST_CACHES, DEBUG=False, VOTING_SETTINGS=TEST_VOTING_SETTINGS):
+            ThrottleMiddleware(lambda request: HttpResponse())
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class PhoneKeyTests(TestCase):
+
+    def test_saving_legacy_duplicate_keeps_null_key(self):
+        owner = CustomUser.objects.create_user(phone_number='+22222000005', password='pass')
+        # A legacy row with the same number written another way, left
+        # without a key by migration 0009
+        duplicate = CustomUser.objects.create_user(phone_number='+22222000006', password='pass')
+        CustomUser.objects.filter(pk=duplicate.pk).update(phone_number='22222000005', phone_key=None)
+
+        duplicate = CustomUser.objects.get(pk=duplicate.pk)
+        duplicate.full_name = 'Edited in the admin'
+        duplicate.save()
+        duplicate.refresh_from_db()
+        self.assertIsNone(duplicate.phone_key)
+
+        # Changing the number to one that is taken also leaves it NULL
+        duplicate.phone_number = '+222 22 00 00 05'
+        duplicate.save()
+        self.assertIsNone(duplicate.phone_key)
+
+        duplicate.phone_number = '+22222000007'
+        duplicate.save()
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.phone_key, 22000007)
+        self.assertEqual(CustomUser.objects.get(pk=owner.pk).phone_key, 22000005)
+
+
+class VersionStampTests(TestCase):
+
+    def test_dashboard_version_is_one_query(self):
+        admin = CustomUser.objects.create_user(username='stamp_admin', password='pass', user_type='super_admin')
+        voter = CustomUser.objects.create_user(phone_number='+22222000008', password='pass')
+        now = timezone.now()
+        poll = Poll.objects.create(
+            title='Stamped', start_time=now, end_time=now + timedelta(days=1), created_by=admin, status='active',
+        )
+        option = Option.objects.create(poll=poll, option_text='A')
+        request = RequestFactory().get('/')
+        request.user = voter
+
+        with CaptureQueriesContext(connection) as queries:
+            before = dashboard_version(request)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(before[:2], (1, poll.updated_at))
+        self.assertEqual(before[2:], (0, None) * 4)
+
+        vote = Vote.objects.create(poll=poll, user=voter, option=option)
+        request = RequestFactory().get('/')
+        request.user = voter
+        after = dashboard_version(request)
+        self.assertEqual(after[2:4], (1, vote.voted_at))
+        self.assertEqual(after[6:8], (1, vote.voted_at))
+        self.assertEqual(polls_list_version(request), after[:6])
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class IdempotentVoteTests(TestCase):
+
+    def test_concurrent_duplicates_are_stopped_by_the_database(self):
+        admin = CustomUser.objects.create_user(username='replay_admin', password='pass', user_type='super_admin')
+        voter = CustomUser.objects.create_user(phone_number='+22222000009', password='pass')
+        now = timezone.now()
+        poll = Poll.objects.create(
+            title='Replayed', start_time=now - timedelta(hours=1), end_time=now + timedelta(days=1),
+            created_by=admin, status='active',
+        )
+        option = Option.objects.create(poll=poll, option_text='A')
+        url = reverse('poll_detail', args=[poll.id])
+        form = {'option_id': str(option.id), 'idempotency_key': 'same-form'}
+        first, second = Client(), Client()
+        first.force_login(voter)
+        second.force_login(voter)
+
+        # A FileBasedCache add() is a check then a write, so both copies of
+        # the submission can claim the key
+        shared = caches['shared']
+
+        def racy_add(key, value, timeout=None):
+            shared.set(key, value, timeout)
+            return True
+
+        # The second copy arrives while the first is about to insert its vote
+        responses = []
+        record_vote = views.record_vote
+        calls = []
+
+        def record_vote_racing(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                responses.append(second.post(url, form, HTTP_ACCEPT='application/json'))
+            return record_vote(*args, **kwargs)
+
+        with mock.patch.object(shared, 'add', racy_add), \
+                mock.patch.object(views, 'record_vote', record_vote_racing):
+            responses.append(first.post(url, form, HTTP_ACCEPT='application/json'))
+
+        self.assertEqual([response.json()['outcome'] for response in responses], ['created', 'duplicate'])
+        self.assertEqual(Vote.objects.filter(poll=poll, user=voter).count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class BallotPollAdminTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='ballot_admin', password='pass', user_type='super_admin')
+        cls.poll, cls.options = _make_poll(cls.admin, 'Ranked', ['A', 'B', 'C'], ballot_type=Poll.BALLOT_RANKED)
+        for i, choices in enumerate([b'\x00\x01', b'\x00', b'\x01\x02', b'\x02\x00', b'\x00\x02\x01']):
+            voter = CustomUser.objects.create_user(phone_number=f'+2222210000{i}', full_name=f'Voter {i}', password='pass')
+            cast_ballot(cls.poll, voter, choices)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_vote_details_list_ballots(self):
+        response = self.client.get(reverse('poll_vote_details', args=[self.poll.id]))
+
+        self.assertEqual(response.context['total_votes'], 5)
+        self.assertEqual(len(response.context['page_obj']), 5)
+        self.assertContains(response, 'A &gt; C &gt; B')
+
+    def test_export_lists_ballots(self):
+        response = self.client.get(reverse('poll_votes_export', args=[self.poll.id]))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(lines), 6)
+        self.assertIn('Voter 2,+22222100002,B > C,', lines[3])
+
+    def test_turnout_counts_ballots_and_first_preferences(self):
+        data = self.client.get(reverse('poll_turnout', args=[self.poll.id])).json()
+
+        self.assertEqual(sum(data['total']), 5)
+        self.assertEqual([sum(option['votes']) for option in data['options']], [3, 1, 1])
+
+    def test_admin_dashboard_counts_ballots(self):
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_votes'], 5)
+
+    def test_ballot_polls_are_not_archived(self):
+        Poll.objects.filter(pk=self.poll.pk).update(status='closed', end_time=timezone.now() - timedelta(days=400))
+        self.poll.refresh_from_db()
+
+        self.assertNotIn(self.poll, archivable_polls())
+        with self.assertRaises(ValueError):
+            archive_poll(self.poll)
+
+
+def _runoff(*groups, n_options):
+    """instant_runoff() over (copies, ranking) groups of identical ballots"""
+    ballots = [bytes(ranking) for copies, ranking in groups for _ in range(copies)]
+    return instant_runoff(ballot_matrix(ballots, n_options), n_options)
+
+
+class TallyTests(SimpleTestCase):
+
+    def test_runoff_transfers_the_eliminated_options_ballots(self):
+        result = _runoff((4, [0, 1]), (3, [1, 2]), (2, [2, 1]), n_options=3)
+
+        self.assertEqual(result.rounds, [[4, 3, 2], [4, 5, 0]])
+        self.assertEqual(result.eliminated, [2])
+        self.assertEqual(result.winner, 1)
+
+    def test_exhausted_ballots_leave_the_majority_threshold(self):
+        result = _runoff((4, [0]), (3, [1]), (2, [2]), n_options=3)
+
+        self.assertEqual(result.exhausted, [0, 2])
+        # 4 of the 7 ballots still in play is a majority
+        self.assertEqual(result.winner, 0)
+
+    def test_last_place_ties_go_to_the_worse_earlier_round(self):
+        result = _runoff((5, [0]), (3, [1, 0]), (4, [2]), (1, [3, 1]), n_options=4)
+
+        # B and C tie at 4 in round two; B had fewer votes in round one
+        self.assertEqual(result.rounds[1], [5, 4, 4, 0])
+        self.assertEqual(result.eliminated, [3, 1])
+        self.assertEqual(result.rounds[2], [8, 0, 4, 0])
+        self.assertEqual(result.exhausted[2], 1)
+        self.assertEqual(result.winner, 0)
+
+    def test_first_round_ties_go_to_the_later_option(self):
+        result = _runoff((2, [0]), (1, [1, 0]), (1, [2, 0]), n_options=3)
+        self.assertEqual(result.eliminated, [2])
+
+    def test_no_ballots_has_no_winner(self):
+        result = _runoff(n_options=3)
+
+        self.assertEqual(result.rounds, [[0, 0, 0]])
+        self.assertIsNone(result.winner)
+
+    def test_approval_counts(self):
+        matrix = ballot_matrix([b'\x00\x02', b'\x00', b'\x01\x02', b'\x02'], 3)
+        self.assertEqual(approval_counts(matrix, 3).tolist(), [2, 1, 3])
+
+
+class BallotEncodingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.options = [Option(option_text=text) for text in 'ABC']
+        self.a, self.b, self.c = (str(option.id) for option in self.options)
+
+    def test_ranked_choices_keep_their_order_and_skip_blank_ranks(self):
+        choices = encode_choices(Poll.BALLOT_RANKED, [self.c, '', self.a], self.options)
+
+        self.assertEqual(choices, b'\x02\x00')
+        self.assertEqual(decode_choices(choices, self.options), [self.options[2], self.options[0]])
+
+    def test_approvals_are_sorted(self):
+        self.assertEqual(encode_choices(Poll.BALLOT_APPROVAL, [self.c, self.a], self.options), b'\x00\x02')
+
+    def test_rejected_rankings(self):
+        for option_ids in ([self.a, self.b, self.a], [self.a, 'not-an-option'], ['', '']):
+            with self.subTest(option_ids=option_ids), self.assertRaises(BallotError):
+                encode_choices(Poll.BALLOT_RANKED, option_ids, self.options)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class CastBallotTests(TestCase):
+
+    def test_second_ballot_of_a_voter_is_a_duplicate(self):
+        admin = CustomUser.objects.create_user(username='cast_admin', password='pass', user_type='super_admin')
+        voter = CustomUser.objects.create_user(phone_number='+22222200000', password='pass')
+        poll, _ = _make_poll(admin, 'Approval', ['A', 'B'], ballot_type=Poll.BALLOT_APPROVAL)
+
+        self.assertEqual(cast_ballot(poll, voter, b'\x00\x01'), VOTE_CREATED)
+        self.assertEqual(cast_ballot(poll, voter, b'\x01'), VOTE_DUPLICATE)
+        self.assertEqual(poll.ballots.get().choices, b'\x00\x01')
+
+    def test_tally_puts_the_runoff_winner_first(self):
+        admin = CustomUser.objects.create_user(username='tally_admin', password='pass', user_type='super_admin')
+        poll, _ = _make_poll(admin, 'Ranked', ['A', 'B', 'C'], ballot_type=Poll.BALLOT_RANKED)
+        for i, ranking in enumerate([[0, 1]] * 4 + [[1, 2]] * 3 + [[2, 1]] * 2):
+            voter = CustomUser.objects.create_user(phone_number=f'+2222230000{i}', password='pass')
+            cast_ballot(poll, voter, bytes(ranking))
+
+        tallies, count = tally_ballots(poll)
+
+        self.assertEqual(count, 9)
+        self.assertEqual(
+            [(tally['option_text'], tally['vote_count'], tally['rounds']) for tally in tallies],
+            [('B', 5, [3, 5]), ('A', 4, [4, 4]), ('C', 0, [2, 0])],
+        )
+
+
+def _voters(count, prefix='+22224'):
+    """count verified members, numbered from prefix"""
+    return [
+        CustomUser.objects.create_user(phone_number=f'{prefix}{i:06d}', password='pass', is_phone_verified=True)
+        for i in range(count)
+    ]
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class ResultSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(username='results_admin', password='pass', user_type='super_admin')
+        self.poll, self.options = _make_poll(self.admin, 'Snapshot', ['A', 'B'])
+        self.voters = _voters(4)
+        for voter, option in zip(self.voters, [0, 0, 1]):
+            Vote.objects.create(poll=self.poll, user=voter, option=self.options[option])
+
+    def _counts(self, results):
+        return [(row['option']['option_text'], row['vote_count']) for row in results['options_with_results']]
+
+    def test_results_are_frozen_after_close(self):
+        close_poll(self.poll)
+        frozen = get_results(self.poll)
+
+        # A late vote and a new member change neither the tallies nor the rate
+        Vote.objects.create(poll=self.poll, user=self.voters[3], option=self.options[1])
+        _voters(1, prefix='+22225')
+        self.poll.refresh_from_db()
+        results = get_results(self.poll)
+
+        self.assertEqual(results, frozen)
+        self.assertEqual(self._counts(results), [('A', 2), ('B', 1)])
+        self.assertEqual(results['participation_rate'], 75.0)
+        self.assertEqual(self.poll.get_total_votes(), 3)
+
+    def test_reopen_drops_the_snapshot_and_the_next_close_recounts(self):
+        close_poll(self.poll)
+        reopen_poll(self.poll, timezone.now() + timedelta(days=1))
+        self.assertFalse(PollResultSnapshot.objects.filter(poll=self.poll).exists())
+
+        Vote.objects.create(poll=self.poll, user=self.voters[3], option=self.options[1])
+        snapshot = close_poll(self.poll)
+
+        self.assertEqual(snapshot.total_votes, 4)
+        self.assertEqual(self._counts(get_results(self.poll)), [('A', 2), ('B', 2)])
+
+    def test_closed_poll_without_snapshot_gets_one_on_first_read(self):
+        Poll.objects.filter(pk=self.poll.pk).update(status='closed')
+        self.poll.refresh_from_db()
+
+        self.assertEqual(get_results(self.poll)['total_votes'], 3)
+        self.assertTrue(PollResultSnapshot.objects.filter(poll=self.poll).exists())
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class PollCommandTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(username='command_admin', password='pass', user_type='super_admin')
+
+    def _call(self, *args, **options):
+        out = StringIO()
+        call_command(*args, stdout=out, **options)
+        return out.getvalue()
+
+    def test_update_poll_status_activates_and_closes(self):
+        now = timezone.now()
+        due, _ = _make_poll(self.admin, 'Due', status='scheduled')
+        over, _ = _make_poll(self.admin, 'Over', start_time=now - timedelta(days=2), end_time=now - timedelta(days=1))
+
+        self.assertIn('Successfully updated 2 polls', self._call('update_poll_status'))
+        due.refresh_from_db()
+        over.refresh_from_db()
+        self.assertEqual((due.status, over.status), ('active', 'closed'))
+        self.assertTrue(PollResultSnapshot.objects.filter(poll=over).exists())
+
+    def test_export_poll_results(self):
+        poll, options = _make_poll(self.admin, 'Exported', ['A', 'B'])
+        Vote.objects.create(poll=poll, user=_voters(1)[0], option=options[1])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.csv')
+            self._call('export_poll_results', str(poll.id), output=path)
+            with open(path, encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+
+        self.assertEqual(rows[1:3], [['Exported', 'B', '1', '100.00%'], ['Exported', 'A', '0', '0.00%']])
+        self.assertEqual(rows[-1], ['Total Votes', '', '1', '100.00%'])
+
+    def test_create_admin_user(self):
+        self._call('create_admin_user', '+22226000000', 'secret', type='super_admin')
+        admin = CustomUser.objects.get(phone_number='+22226000000')
+
+        self.assertEqual((admin.user_type, admin.is_staff), ('super_admin', True))
+        self.assertTrue(admin.check_password('secret'))
+        with self.assertRaises(CommandError):
+            self._call('create_admin_user', '+22226000000', 'secret')
+
+    def test_cleanup_old_otps(self):
+        old = OTPLog.objects.create(phone_number='+22226000001', otp_code='123456')
+        OTPLog.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(hours=30))
+        recent = OTPLog.objects.create(phone_number='+22226000001', otp_code='654321')
+
+        self.assertIn('deleted 1 old OTP logs', self._call('cleanup_old_otps'))
+        self.assertEqual(list(OTPLog.objects.values_list('pk', flat=True)), [recent.pk])
+
+    @mock.patch('voting.management.commands.send_poll_notifications.send_sms_notification', return_value=True)
+    def test_send_poll_notifications_reaches_non_voters(self, send_sms):
+        now = timezone.now()
+        poll, options = _make_poll(self.admin, 'Closing', ['A'], end_time=now + timedelta(minutes=30))
+        voted, waiting = _voters(2)
+        record_vote(poll, voted, options[0])
+
+        self.assertIn('sent 1 notifications', self._call('send_poll_notifications', closing=True))
+        send_sms.assert_called_once()
+        self.assertEqual(send_sms.call_args.args[0], waiting.phone_number)
+
+
+class SetBitsTests(SimpleTestCase):
+
+    def test_sets_new_bits_and_grows_the_bitmap(self):
+        bits = bytearray()
+
+        self.assertEqual(set_bits(bits, [0, 9, 9, 17]), 3)
+        self.assertEqual(bits, bytearray([0b1, 0b10, 0b10]))
+        self.assertEqual(set_bits(bits, [9, 1]), 1)
+        self.assertEqual(bits, bytearray([0b11, 0b10, 0b10]))
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class VoterBitmapTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_user(username='bitmap_admin', password='pass', user_type='super_admin')
+        self.poll, self.options = _make_poll(self.admin, 'Bitmap', ['A'])
+
+    def test_assign_missing_ordinals_numbers_bulk_created_users_in_order(self):
+        last = CustomUser.objects.order_by('-ordinal').values_list('ordinal', flat=True)[0]
+        users = CustomUser.objects.bulk_create(
+            [CustomUser(username=f'bulk-{i}', phone_number=f'+2222700000{i}') for i in range(5)]
+        )
+        queryset = CustomUser.objects.filter(id__in=[user.id for user in users])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(assign_missing_ordinals(queryset, chunk_size=2), 5)
+        # One read of the pending ids, then three queries per chunk of two
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 1 + 3 * 3)
+        self.assertEqual(
+            list(queryset.order_by('created_at', 'id').values_list('ordinal', flat=True)),
+            list(range(last + 1, last + 6)),
+        )
+        self.assertEqual(assign_missing_ordinals(queryset), 0)
+
+    def test_votes_set_bits_in_their_own_segments(self):
+        near, far = _voters(2)
+        CustomUser.objects.filter(pk=far.pk).update(ordinal=SEGMENT_BITS * 3 + 5)
+        far.refresh_from_db()
+
+        record_vote(self.poll, near, self.options[0])
+        record_vote(self.poll, far, self.options[0])
+
+        segments = VoterBitmapSegment.objects.filter(poll=self.poll).order_by('segment')
+        self.assertEqual([(row.segment, row.voter_count) for row in segments], [(near.ordinal // SEGMENT_BITS, 1), (3, 1)])
+        self.assertTrue(all(len(row.bits) <= SEGMENT_BITS // 8 for row in segments))
+        self.assertEqual(voter_count(self.poll), 2)
+        self.assertEqual(list(non_voters(self.poll, CustomUser.objects.filter(pk__in=[near.pk, far.pk]))), [])
+        self.assertEqual(len(voter_bits(self.poll)), far.ordinal // 8 + 1)
+
+    def test_rebuild_recounts_from_the_votes(self):
+        voters = _voters(3)
+        CustomUser.objects.filter(pk=voters[2].pk).update(ordinal=SEGMENT_BITS + 1)
+        for voter in voters:
+            Vote.objects.create(poll=self.poll, user=voter, option=self.options[0])
+        self.assertEqual(voter_count(self.poll), 0)
+
+        self.assertEqual(rebuild_voter_bitmap(self.poll), 3)
+        self.assertEqual(voter_count(self.poll), 3)
+        self.assertEqual(VoterBitmapSegment.objects.filter(poll=self.poll).count(), 2)
+        # Rebuilding again replaces the segments rather than adding to them
+        rebuild_voter_bitmap(self.poll)
+        self.assertEqual(voter_count(self.poll), 3)
+
+
+class VoterBitmapMigrationTests(TransactionTestCase):
+
+    def _migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('voting', target)])
+        return executor.loader.project_state([('voting', target)]).apps
+
+    def test_backfill_numbers_users_and_builds_bitmaps(self):
+        apps = self._migrate('0009_customuser_phone_key')
+        try:
+            HistoricalUser = apps.get_model('voting', 'CustomUser')
+            admin = HistoricalUser.objects.create(username='migration_admin', user_type='super_admin')
+            now = timezone.now()
+            poll = apps.get_model('voting', 'Poll').objects.create(
+                title='Before bitmaps', start_time=now, end_time=now + timedelta(days=1), created_by=admin,
+            )
+            option = apps.get_model('voting', 'Option').objects.create(poll=poll, option_text='A')
+            voters = [HistoricalUser.objects.create(username=f'migration-{i}') for i in range(3)]
+            for voter in voters[:2]:
+                apps.get_model('voting', 'Vote').objects.create(poll=poll, user=voter, option=option)
+
+            apps = self._migrate('0010_voter_bitmap')
+            ordinals = dict(apps.get_model('voting', 'CustomUser').objects.values_list('username', 'ordinal'))
+            self.assertEqual(
+                [ordinals[name] for name in ['migration_admin', 'migration-0', 'migration-1', 'migration-2']],
+                [1, 2, 3, 4],
+            )
+            bitmap = apps.get_model('voting', 'PollVoterBitmap').objects.get(poll_id=poll.pk)
+            self.assertEqual((bytes(bitmap.bits), bitmap.voter_count), (bytes([0b1100]), 2))
+
+            self._migrate('0012_voter_bitmap_segments')
+            self.assertEqual(voter_count(Poll.objects.get(pk=poll.pk)), 2)
+            self.assertEqual(voter_bits(Poll.objects.get(pk=poll.pk)), bytes([0b1100]))
+        finally:
+            executor = MigrationExecutor(connection)
+            executor.migrate(executor.loader.graph.leaf_nodes('voting'))
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class TurnoutRollupTests(TestCase):
+
+    def _buckets(self, poll):
+        return sorted(TurnoutBucket.objects.filter(poll=poll).values_list('option__option_text', 'minute', 'vote_count'))
+
+    def test_buckets_match_a_recount_of_direct_batched_and_archived_votes(self):
+        admin = CustomUser.objects.create_user(username='turnout_admin', password='pass', user_type='super_admin')
+        poll, (a, b) = _make_poll(admin, 'Turnout', ['A', 'B'])
+        voters = _voters(8)
+        start = timezone.now().replace(second=30, microsecond=0) - timedelta(minutes=10)
+
+        # Direct votes over three minutes
+        for minute, (voter, option) in enumerate(zip(voters[:3], [a, a, b])):
+            with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=minute // 2)):
+                self.assertEqual(record_vote(poll, voter, option, mode='direct'), VOTE_CREATED)
+        # A batch with a duplicate inside it and one of an earlier voter
+        batch = [Vote(poll=poll, user=voter, option=option) for voter, option in zip(voters[3:], [a, b, b, a, a])]
+        batch += [Vote(poll=poll, user=voters[3], option=b), Vote(poll=poll, user=voters[0], option=b)]
+        with mock.patch('django.utils.timezone.now', return_value=start + timedelta(minutes=5)):
+            outcomes = write_votes(batch)
+        self.assertEqual(outcomes.count(VOTE_CREATED), 5)
+
+        maintained = self._buckets(poll)
+        self.assertEqual([count for _, _, count in maintained], [2, 3, 1, 2])
+        rebuild_turnout(poll)
+        self.assertEqual(self._buckets(poll), maintained)
+
+        # The recount reads the archive once the votes have moved there
+        Poll.objects.filter(pk=poll.pk).update(status='closed')
+        poll.refresh_from_db()
+        archive_poll(poll)
+        self.assertEqual(Vote.objects.filter(poll=poll).count(), 0)
+        rebuild_turnout(poll)
+        self.assertEqual(self._buckets(poll), maintained)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class TeamTallyRollupTests(TestCase):
+
+    def _tallies(self):
+        return sorted(TeamPollTally.objects.values_list('team__name', 'poll__title', 'vote_count'))
+
+    def test_tallies_match_a_recount_of_direct_batched_and_archived_votes(self):
+        admin = CustomUser.objects.create_user(username='tally_admin', password='pass', user_type='super_admin')
+        red = Team.objects.create(name='Red', created_by=admin)
+        blue = Team.objects.create(name='Blue', created_by=admin)
+        first, (red_1, blue_1, independent) = _make_poll(admin, 'First', ['Red', 'Blue', 'Independent'])
+        second, (red_2, blue_2) = _make_poll(admin, 'Second', ['Red', 'Blue'])
+        Option.objects.filter(pk__in=[red_1.pk, red_2.pk]).update(team=red)
+        Option.objects.filter(pk__in=[blue_1.pk, blue_2.pk]).update(team=blue)
+        for option in (red_1, blue_1, red_2, blue_2):
+            option.refresh_from_db()
+        voters = _voters(6)
+
+        for voter, option in zip(voters[:3], [red_1, blue_1, independent]):
+            self.assertEqual(record_vote(first, voter, option, mode='direct'), VOTE_CREATED)
+        # A batch across both polls, with an in-batch duplicate and a repeat of a direct vote
+        batch = [Vote(poll=first, user=voter, option=red_1) for voter in voters[3:]]
+        batch += [Vote(poll=second, user=voter, option=option) for voter, option in zip(voters, [red_2, red_2, blue_2])]
+        batch += [Vote(poll=second, user=voters[0], option=blue_2), Vote(poll=first, user=voters[0], option=blue_1)]
+        self.assertEqual(write_votes(batch).count(VOTE_CREATED), 6)
+
+        maintained = self._tallies()
+        self.assertEqual(maintained, [
+            ('Blue', 'First', 1), ('Blue', 'Second', 1), ('Red', 'First', 4), ('Red', 'Second', 2),
+        ])
+        self.assertEqual(rebuild_team_tallies(), 4)
+        self.assertEqual(self._tallies(), maintained)
+
+        # The recount reads the archive once the votes have moved there
+        Poll.objects.filter(pk=first.pk).update(status='closed')
+        first.refresh_from_db()
+        archive_poll(first)
+        self.assertEqual(Vote.objects.filter(poll=first).count(), 0)
+        rebuild_team_tallies([red])
+        self.assertEqual(self._tallies(), maintained)
+        self.assertEqual(red.get_vote_count(), 6)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class WriteVotesTests(TestCase):
+
+    def setUp(self):
+        admin = CustomUser.objects.create_user(username='batch_admin', password='pass', user_type='super_admin')
+        self.poll, (self.a, self.b) = _make_poll(admin, 'Batch', ['A', 'B'])
+        self.voters = _voters(3)
+
+    def test_first_vote_of_a_pair_in_the_batch_wins(self):
+        first, second, third = self.voters
+        outcomes = write_votes([
+            Vote(poll=self.poll, user=first, option=self.a),
+            Vote(poll=self.poll, user=second, option=self.b),
+            Vote(poll=self.poll, user=first, option=self.b),
+        ])
+        self.assertEqual(outcomes, [VOTE_CREATED, VOTE_CREATED, VOTE_DUPLICATE])
+        self.assertEqual(Vote.objects.get(poll=self.poll, user=first).option, self.a)
+
+        # Pairs that already have a row are skipped
+        outcomes = write_votes([
+            Vote(poll=self.poll, user=second, option=self.a),
+            Vote(poll=self.poll, user=third, option=self.a),
+        ])
+        self.assertEqual(outcomes, [VOTE_DUPLICATE, VOTE_CREATED])
+        self.assertEqual(voter_count(self.poll), 3)
+
+    def test_a_pair_inserted_after_the_check_falls_back_to_one_savepoint_per_vote(self):
+        first, second, third = self.voters
+        record_vote(self.poll, second, self.b, mode='direct')
+        # The existing-pairs check misses the vote, as if it were inserted
+        # by another process right after it
+        with mock.patch.object(ingest.Vote.objects, 'filter', return_value=Vote.objects.none()):
+            outcomes = write_votes([
+                Vote(poll=self.poll, user=first, option=self.a),
+                Vote(poll=self.poll, user=second, option=self.a),
+                Vote(poll=self.poll, user=third, option=self.a),
+            ])
+        self.assertEqual(outcomes, [VOTE_CREATED, VOTE_DUPLICATE, VOTE_CREATED])
+        self.assertEqual(Vote.objects.filter(poll=self.poll).count(), 3)
+        self.assertEqual(Vote.objects.get(poll=self.poll, user=second).option, self.b)
+        self.assertEqual(voter_count(self.poll), 3)
+        self.assertEqual(
+            dict(TurnoutBucket.objects.filter(poll=self.poll).values_list('option__option_text', 'vote_count')),
+            {'A': 2, 'B': 1},
+        )
+
+
+class VoteBatcherTests(SimpleTestCase):
+
+    def _batcher(self):
+        # No writer thread: the test drains the queue itself
+        batcher = ingest.VoteBatcher(window_ms=1, timeout=0.01)
+        batcher._ensure_started = lambda: None
+        return batcher
+
+    def test_a_vote_that_timed_out_before_its_batch_began_is_dropped(self):
+        batcher = self._batcher()
+        with self.assertRaisesMessage(ingest.VoteIngestionTimeout, 'has been dropped'):
+            batcher.submit(Vote())
+        with mock.patch.object(ingest, 'write_votes') as write:
+            self.assertEqual(batcher._claim(batcher._collect()), [])
+        write.assert_not_called()
+
+    def test_only_the_votes_still_waiting_are_written(self):
+        batcher = self._batcher()
+        waiting, given_up = ingest.PendingVote(Vote()), ingest.PendingVote(Vote())
+        given_up.state = ingest.PendingVote.CANCELLED
+        batcher._queue.put(given_up)
+        batcher._queue.put(waiting)
+        self.assertEqual(batcher._claim(batcher._collect()), [waiting])
+        self.assertEqual(waiting.state, ingest.PendingVote.CLAIMED)
+
+    def test_a_vote_already_being_written_is_not_cancelled(self):
+        batcher = self._batcher()
+
+        def claim_then_stall(pending):
+            # The writer takes the vote, then the batch outlives the timeout
+            ingest.queue.Queue.put(batcher._queue, pending)
+            batcher._claim(batcher._collect())
+
+        with mock.patch.object(batcher._queue, 'put', side_effect=claim_then_stall):
+            with self.assertRaisesMessage(ingest.VoteIngestionTimeout, 'did not commit in time'):
+                batcher.submit(Vote())
+
+
+class QueryTraceTests(SimpleTestCase):
+
+    def test_every_reported_shape_has_an_origin(self):
+        for threshold in (0, 1, 2, 3):
+            trace = QueryTrace(slow_ms=1000, repeat_threshold=threshold)
+            for _ in range(3):
+                trace.record('SELECT * FROM voting_poll WHERE id = %s', 0.001)
+            trace.record('SELECT * FROM voting_option', 0.001)
+
+            findings = list(trace.findings())
+            expected = {'SELECT * FROM voting_poll WHERE id = %s': 3}
+            if threshold <= 1:
+                expected['SELECT * FROM voting_option'] = 1
+            self.assertEqual({finding['sql']: finding['count'] for finding in findings}, expected)
+            for finding in findings:
+                self.assertTrue(finding['code'].startswith('voting/tests.py:'), finding)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class SessionStoreTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.user = CustomUser.objects.create_user(phone_number='+22225000001', password='pass')
+
+    def _logged_in(self):
+        session = SessionStore()
+        session[SESSION_KEY] = str(self.user.pk)
+        session.create()
+        return session.session_key
+
+    def test_anonymous_session_stays_in_the_cache(self):
+        session = SessionStore()
+        session['cart'] = 1
+        session.create()
+        with self.assertNumQueries(0):
+            session = SessionStore(session.session_key)
+            session['cart'] = 2
+            session.save()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(SessionStore(session.session_key)['cart'], 2)
+
+    def test_unchanged_user_is_not_written_again(self):
+        key = self._logged_in()
+        stored = Session.objects.get(session_key=key).expire_date
+
+        session = SessionStore(key)
+        session['language'] = 'ar'
+        with self.assertNumQueries(0):
+            session.save()
+        self.assertEqual(Session.objects.get(session_key=key).expire_date, stored)
+
+    def test_login_and_logout_write_through(self):
+        session = SessionStore()
+        session.create()
+        session = SessionStore(session.session_key)
+        session[SESSION_KEY] = str(self.user.pk)
+        session.save()
+        self.assertEqual(Session.objects.get(session_key=session.session_key).get_decoded()[SESSION_KEY], str(self.user.pk))
+
+        # The database copy survives a cache restart
+        caches['shared'].clear()
+        self.assertEqual(SessionStore(session.session_key)[SESSION_KEY], str(self.user.pk))
+
+        key = session.session_key
+        session.flush()
+        self.assertFalse(Session.objects.filter(session_key=key).exists())
+
+    def test_cycled_key_is_written_through(self):
+        session = SessionStore(self._logged_in())
+        old_key = session.session_key
+        session.cycle_key()
+        # As SessionMiddleware does at the end of the login request
+        session.save()
+
+        self.assertFalse(Session.objects.filter(session_key=old_key).exists())
+        self.assertTrue(Session.objects.filter(session_key=session.session_key).exists())
+
+    def test_session_close_to_expiry_is_renewed_in_the_database(self):
+        key = self._logged_in()
+        cache = caches['shared']
+        cache_key = SessionStore(key).cache_key
+        data = cache.get(cache_key)
+        data[REFRESHED_AT_KEY] -= settings.SESSION_COOKIE_AGE - get_refresh_threshold() + 60
+        cache.set(cache_key, data)
+        Session.objects.filter(session_key=key).update(expire_date=timezone.now() + timedelta(minutes=1))
+
+        session = SessionStore(key)
+        session.load()
+        self.assertTrue(session.modified)
+        session.save()
+
+        expire_date = Session.objects.get(session_key=key).expire_date
+        self.assertGreater(expire_date, timezone.now() + timedelta(seconds=settings.SESSION_COOKIE_AGE - 60))
+        # Renewed once: the next save stays in the cache
+        session = SessionStore(key)
+        session.load()
+        self.assertFalse(session.modified)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class ConsumeOtpTests(TestCase):
+    phone = '+22226000001'
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def test_code_works_once(self):
+        store_otp(self.phone, '123456')
+        self.assertEqual(consume_otp(self.phone, '123456'), OTP_VALID)
+        self.assertEqual(consume_otp(self.phone, '123456'), OTP_EXPIRED)
+        self.assertEqual(OTPLog.objects.filter(phone_number=self.phone).count(), 1)
+
+    def test_wrong_code_leaves_the_pending_one(self):
+        store_otp(self.phone, '123456')
+        self.assertEqual(consume_otp(self.phone, '654321'), OTP_INVALID)
+        self.assertEqual(consume_otp(self.phone, '123456'), OTP_VALID)
+
+    def test_resent_code_replaces_the_earlier_one(self):
+        store_otp(self.phone, '123456')
+        store_otp(self.phone, '222222')
+        self.assertEqual(consume_otp(self.phone, '123456'), OTP_INVALID)
+        self.assertEqual(consume_otp(self.phone, '222222'), OTP_VALID)
+
+    def test_code_expires(self):
+        store_otp(self.phone, '123456')
+        later = time.time() + get_otp_ttl() + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(consume_otp(self.phone, '123456'), OTP_EXPIRED)
+
+    def test_only_one_of_two_racing_checks_is_valid_on_the_file_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            file_caches = {
+                **TEST_CACHES,
+                'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': cache_dir},
+            }
+            with override_settings(CACHES=file_caches):
+                store_otp(self.phone, '123456')
+                cache = caches['shared']
+                get = cache.get
+                outcomes = []
+
+                def get_then_race(key, *args, **kwargs):
+                    # The other request reads the code and consumes it
+                    # between this request's get() and delete()
+                    value = get(key, *args, **kwargs)
+                    if not outcomes:
+                        outcomes.append(None)
+                        with mock.patch.object(cache, 'get', get):
+                            outcomes.append(consume_otp(self.phone, '123456'))
+                    return value
+
+                with mock.patch.object(cache, 'get', get_then_race):
+                    outcomes.append(consume_otp(self.phone, '123456'))
+
+        self.assertEqual(outcomes[1:], [OTP_VALID, OTP_EXPIRED])
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class BuildPollTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(username='build_admin', password='pass', user_type='super_admin')
+        cls.teams = [Team.objects.create(name=f'Team {i}', created_by=cls.admin) for i in range(3)]
+        cls.retired = Team.objects.create(name='Retired', created_by=cls.admin, is_active=False)
+
+    def _build(self, **fields):
+        now = timezone.now()
+        return build_poll(
+            title='Election', start_time=now, end_time=now + timedelta(days=1), created_by=self.admin, **fields
+        )
+
+    def test_team_ballot_keeps_the_admins_order_in_three_queries(self):
+        team_ids = [self.teams[2].pk, self.teams[0].pk, str(self.teams[2].pk), self.teams[1].pk]
+        with CaptureQueriesContext(connection) as queries:
+            poll = self._build(team_ids=team_ids)
+        statements = [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 3)
+        self.assertEqual(
+            list(poll.options.order_by('order').values_list('team__name', 'order')),
+            [('Team 2', 0), ('Team 0', 1), ('Team 1', 2)],
+        )
+
+    def test_missing_inactive_or_malformed_teams_are_rejected(self):
+        for team_ids in (
+            [self.teams[0].pk, self.retired.pk],
+            [self.teams[0].pk, '00000000-0000-0000-0000-000000000000'],
+            [self.teams[0].pk, 'not-a-uuid'],
+            [self.teams[0].pk, self.teams[0].pk],
+        ):
+            with self.subTest(team_ids=team_ids), self.assertRaises(PollBuildError):
+                self._build(team_ids=team_ids)
+        self.assertFalse(Poll.objects.exists())
+
+    def test_invalid_definitions_are_rejected(self):
+        for fields in (
+            {'option_texts': ['Only one', '  ']},
+            {'option_texts': ['A', 'B'], 'team_ids': [self.teams[0].pk, self.teams[1].pk]},
+            {},
+            {'option_texts': ['A', 'B'], 'ballot_type': 'borda'},
+        ):
+            with self.subTest(fields=fields), self.assertRaises(PollBuildError):
+                self._build(**fields)
+        self.assertFalse(Poll.objects.exists())
+
+    def test_failed_option_insert_rolls_back_the_poll(self):
+        with mock.patch.object(Option.objects, 'bulk_create', side_effect=IntegrityError('bad option')):
+            with self.assertRaises(IntegrityError):
+                self._build(option_texts=['A', 'B'])
+        self.assertFalse(Poll.objects.exists())
+
+    def _command(self, template, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as handle:
+            handle.write(template if isinstance(template, str) else json.dumps(template))
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('create_poll', handle.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_create_poll_command(self):
+        out = self._command(
+            {'title': 'From template', 'teams': 'active', 'duration_hours': 2, 'ballot_type': 'ranked'},
+            '--created-by', 'build_admin', '--start', '2030-01-01T09:00:00',
+        )
+        poll = Poll.objects.get()
+        self.assertIn('with 3 options', out)
+        self.assertEqual(poll.ballot_type, Poll.BALLOT_RANKED)
+        self.assertEqual(poll.end_time - poll.start_time, timedelta(hours=2))
+
+    def test_create_poll_command_errors(self):
+        voter = CustomUser.objects.create_user(phone_number='+22227000001', password='pass')
+        valid = {'title': 'T', 'options': ['A', 'B'], 'duration_hours': 1}
+        for template, args, message in (
+            ('{not json', ['--created-by', 'build_admin'], 'Cannot read template'),
+            (valid, ['--created-by', 'nobody'], 'not found'),
+            (valid, ['--created-by', voter.username], 'not allowed'),
+            (valid, ['--created-by', 'build_admin', '--start', 'tomorrow'], 'ISO date'),
+            ({'title': 'T', 'options': ['A', 'B']}, ['--created-by', 'build_admin'], 'end_time or duration_hours'),
+            ({**valid, 'options': ['A']}, ['--created-by', 'build_admin'], 'At least 2 options'),
+            ({**valid, 'options': None, 'teams': [str(self.retired.pk), str(self.teams[0].pk)]},
+             ['--created-by', 'build_admin'], 'no longer exist'),
+        ):
+            with self.subTest(message=message), self.assertRaisesMessage(CommandError, message):
+                self._command(template, *args)
+        self.assertFalse(Poll.objects.exists())
+
+
+@override_settings(
+    CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False,
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ImportMembersTests(TestCase):
+    roster = (
+        'phone_number,full_name,password\n'
+        '22228000001,Already registered,\n'
+        '+222 28 00 00 02,Alpha,secret1\n'
+        '0022228000002,Alpha again,\n'
+        '12,Bad number,\n'
+        '28000003,Beta,\n'
+        '+22228000004,Gamma,secret2\n'
+    )
+
+    def setUp(self):
+        self.existing = CustomUser.objects.create_user(phone_number='+22228000001', password='pass')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as handle:
+            handle.write(self.roster)
+        self.addCleanup(os.remove, handle.name)
+        self.path = handle.name
+
+    def _import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_members', self.path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def _imported(self):
+        return [
+            (user.phone_number, user.full_name, user.ordinal, user.has_usable_password(),
+             user.check_password('secret1') or user.check_password('secret2') or user.check_password('welcome'))
+            for user in CustomUser.objects.exclude(pk=self.existing.pk).order_by('ordinal')
+        ]
+
+    def test_dedupes_against_members_and_the_roster_and_numbers_the_new_ones(self):
+        out, err = self._import('--workers', '1', '--batch-size', '2')
+
+        self.assertIn('Read 6 rows: 1 invalid, 2 already registered or repeated', out)
+        self.assertIn('Created 3 members', out)
+        self.assertIn("Line 5: invalid phone number '12'", err)
+        first = self.existing.ordinal
+        self.assertEqual(self._imported(), [
+            ('+22228000002', 'Alpha', first + 1, True, True),
+            ('+22228000003', 'Beta', first + 2, False, False),
+            ('+22228000004', 'Gamma', first + 3, True, True),
+        ])
+        self.assertEqual(
+            list(CustomUser.objects.exclude(pk=self.existing.pk).values_list('phone_key', flat=True).order_by('ordinal')),
+            [28000002, 28000003, 28000004],
+        )
+
+        # A second run finds everyone registered
+        out, _ = self._import('--workers', '1')
+        self.assertIn('Created 0 members', out)
+
+    def test_same_members_with_one_or_several_hashing_processes(self):
+        results = []
+        for workers in ('1', '3'):
+            with transaction.atomic():
+                self._import('--workers', workers, '--batch-size', '2', '--default-password', 'welcome')
+                results.append(self._imported())
+                transaction.set_rollback(True)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([has_password for _, _, _, has_password, _ in results[0]], [True, True, True])
+        self.assertTrue(all(matches for *_, matches in results[0]))
+
+    def test_dry_run_creates_nothing(self):
+        out, _ = self._import('--dry-run', '--workers', '1')
+        self.assertIn('Would create 3 members', out)
+        self.assertEqual(CustomUser.objects.count(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+@mock.patch('voting.retention.time.sleep')
+class RetentionTests(TestCase):
+
+    def _otp_logs(self, ages_in_hours):
+        logs = OTPLog.objects.bulk_create([
+            OTPLog(phone_number='+22229000001', otp_code='123456') for _ in ages_in_hours
+        ])
+        now = timezone.now()
+        for log, age in zip(logs, ages_in_hours):
+            OTPLog.objects.filter(pk=log.pk).update(created_at=now - timedelta(hours=age))
+        return [log.pk for log in logs]
+
+    def _expired(self):
+        return OTPLog.objects.filter(created_at__lt=timezone.now() - timedelta(hours=24))
+
+    def test_batches_delete_only_expired_rows_across_gaps(self, sleep):
+        pks = self._otp_logs([30, 1, 30, 30, 2, 30, 30, 30, 3, 30])
+        # A gap in the key sequence
+        OTPLog.objects.filter(pk=pks[3]).delete()
+
+        report = purge('otp_logs', self._expired(), batch_size=3, pause=0)
+
+        # 6 expired rows: ranges of 3, 3, then an empty read
+        self.assertEqual((report.rows, report.batches), (6, 2))
+        self.assertEqual(sorted(OTPLog.objects.values_list('pk', flat=True)), [pks[1], pks[4], pks[8]])
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_short_last_batch_ends_the_walk(self, sleep):
+        self._otp_logs([30] * 5)
+        with CaptureQueriesContext(connection) as queries:
+            report = purge('otp_logs', self._expired(), batch_size=3, pause=0)
+        self.assertEqual((report.rows, report.batches), (5, 2))
+        self.assertEqual(sleep.call_count, 1)
+        reads = [q for q in queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(reads), 2)
+
+    def test_empty_table(self, sleep):
+        report = purge('otp_logs', self._expired(), batch_size=3, pause=0)
+        self.assertEqual((report.rows, report.batches, report.lock_seconds), (0, 0, 0.0))
+        sleep.assert_not_called()
+
+    def test_purge_expired_removes_old_logs_and_expired_sessions(self, sleep):
+        self._otp_logs([30, 1])
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(session_key=f'{key:032d}', session_data='', expire_date=now + timedelta(days=offset))
+            for key, offset in enumerate([-1, 1, -2, -3, 2])
+        ])
+
+        reports = purge_expired(batch_size=2, pause=0)
+
+        self.assertEqual([(report.name, report.rows) for report in reports], [('otp_logs', 1), ('sessions', 3)])
+        self.assertEqual(OTPLog.objects.count(), 1)
+        self.assertEqual(sorted(Session.objects.values_list('session_key', flat=True)), [f'{1:032d}', f'{4:032d}'])
+
+    def test_commands(self, sleep):
+        self._otp_logs([30, 5, 1])
+        out = StringIO()
+        call_command('cleanup_old_otps', '--hours', '4', stdout=out)
+        self.assertIn('deleted 2 old OTP logs (older than 4 hours)', out.getvalue())
+
+        out = StringIO()
+        call_command('purge_expired', '--hours', '0', '--nice', '0', stdout=out)
+        self.assertIn('otp_logs: 1 rows in 1 batches', out.getvalue())
+        self.assertIn('Purge complete', out.getvalue())
+        self.assertFalse(OTPLog.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, VOTING_SETTINGS=TEST_VOTING_SETTINGS, SECURE_SSL_REDIRECT=False)
+class VoteStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        admin = CustomUser.objects.create_user(username='stream_admin', password='pass', user_type='super_admin')
+        cls.poll, (cls.a, cls.b) = _make_poll(admin, 'Stream', ['أ', 'B'])
+        cls.voters = _voters(4, prefix='+22230')
+        CustomUser.objects.filter(pk=cls.voters[0].pk).update(full_name='محمد')
+        for i, voter in enumerate(cls.voters):
+            record_vote(cls.poll, voter, cls.a if i % 2 == 0 else cls.b, ip_address='10.0.0.1' if i else None)
+
+    def _votes(self, count):
+        return Vote.objects.filter(poll=self.poll, user__in=self.voters[:count])
+
+    def test_csv_has_one_bom_and_header_then_a_piece_per_chunk(self):
+        for count, pieces in ((0, 1), (3, 2), (4, 3)):
+            with self.subTest(count=count):
+                chunks = list(stream_votes_csv(self._votes(count), chunk_size=3))
+                self.assertEqual(len(chunks), pieces)
+                self.assertTrue(chunks[0].startswith('\ufeff'))
+                self.assertNotIn('\ufeff', ''.join(chunks[1:]))
+
+                rows = list(csv.reader(StringIO(''.join(chunks)[1:])))
+                self.assertEqual(rows[0], VOTE_EXPORT_COLUMNS)
+                self.assertEqual(len(rows), count + 1)
+        self.assertEqual(rows[1][:3], ['محمد', self.voters[0].phone_number, 'أ'])
+        self.assertEqual(rows[1][4], '')
+        self.assertEqual([row[1] for row in rows[1:]], [voter.phone_number for voter in self.voters])
+
+    def test_ndjson_is_one_object_per_line_split_on_whole_lines(self):
+        for count, pieces in ((0, 0), (3, 1), (4, 2)):
+            with self.subTest(count=count):
+                chunks = list(stream_votes_ndjson(self._votes(count), chunk_size=3))
+                self.assertEqual(len(chunks), pieces)
+                for chunk in chunks:
+                    self.assertTrue(chunk.endswith('\n'))
+                lines = ''.join(chunks).splitlines()
+                self.assertEqual(len(lines), count)
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(list(records[0]), VOTE_EXPORT_COLUMNS)
+        self.assertEqual(records[0]['full_name'], 'محمد')
+        self.assertIsNone(records[0]['ip_address'])
+        self.assertIn('محمد', chunks[0])
+        self.assertEqual(records[3]['option'], 'B')
+
+
+class AdmissionTests(SimpleTestCase):
+    factory = RequestFactory()
+    poll_url = '/poll/00000000-0000-0000-0000-000000000001/'
+
+    def test_classify(self):
+        for method, path, priority in (
+            ('post', '/', CRITICAL),
+            ('post', '/verify-otp/', CRITICAL),
+            ('post', self.poll_url, CRITICAL),
+            ('get', '/', NORMAL),
+            ('get', self.poll_url, NORMAL),
+            ('get', '/no-such-page/', NORMAL),
+            ('get', '/vote-admin/dashboard/', LOW),
+            ('get', f'/vote-admin{self.poll_url}vote-details/export/', LOW),
+            ('get', '/admin/voting/vote/', LOW),
+        ):
+            with self.subTest(method=method, path=path):
+                self.assertEqual(classify(getattr(self.factory, method)(path)), priority)
+
+    def test_lower_priorities_leave_the_last_slots_free(self):
+        controller = AdmissionController(max_in_flight=4, normal_share=0.75, low_share=0.25)
+        self.assertEqual(controller.limits, {CRITICAL: 4, NORMAL: 3, LOW: 1})
+
+        self.assertTrue(controller.try_acquire(LOW))
+        self.assertFalse(controller.try_acquire(LOW))
+        self.assertTrue(controller.try_acquire(NORMAL))
+        self.assertTrue(controller.try_acquire(NORMAL))
+        self.assertFalse(controller.try_acquire(NORMAL))
+        self.assertTrue(controller.try_acquire(CRITICAL))
+        self.assertFalse(controller.try_acquire(CRITICAL))
+
+        controller.release()
+        self.assertFalse(controller.try_acquire(NORMAL))
+        self.assertTrue(controller.try_acquire(CRITICAL))
+
+    def test_shed_response(self):
+        for method, headers, retries_itself in (
+            ('get', {}, True),
+            ('post', {}, False),
+            ('post', {'HTTP_ACCEPT': 'application/json'}, False),
+        ):
+            with self.subTest(method=method, headers=headers):
+                response = shed_response(getattr(self.factory, method)('/', **headers), CRITICAL, 2)
+                self.assertEqual(response.status_code, 503)
+                self.assertIn(int(response['Retry-After']), range(2, 5))
+                self.assertEqual(response['Cache-Control'], 'no-store')
+                self.assertEqual('location.reload' in response.content.decode(), retries_itself)
+        self.assertEqual(json.loads(response.content)['retry_after'], int(response['Retry-After']))
+
+    def _middleware(self, view):
+        limits = {**TEST_VOTING_SETTINGS, 'ADMISSION_MAX_IN_FLIGHT': 2, 'ADMISSION_LOW_SHARE': 0.5}
+        with override_settings(VOTING_SETTINGS=limits):
+            return AdmissionControlMiddleware(view)
+
+    def test_requests_beyond_the_limit_are_shed(self):
+        responses = []
+
+        def view(request):
+            # A second request arrives while this one is in flight
+            if not responses:
+                responses.append(None)
+                responses.append(middleware(self.factory.get('/vote-admin/dashboard/')))
+                responses.append(middleware(self.factory.post('/')))
+            return HttpResponse()
+
+        middleware = self._middleware(view)
+        self.assertEqual(middleware(self.factory.get('/vote-admin/dashboard/')).status_code, 200)
+        self.assertEqual([response.status_code for response in responses[1:]], [503, 200])
+        self.assertIn('Retry-After', responses[1])
+        self.assertEqual(middleware.controller.in_flight, 0)
+
+    def test_slot_is_released_when_the_view_raises(self):
+        def view(request):
+            raise RuntimeError('view failed')
+
+        middleware = self._middleware(view)
+        for _ in range(3):
+            with self.assertRaises(RuntimeError):
+                middleware(self.factory.get('/'))
+        self.assertEqual(middleware.controller.in_flight, 0)
+
+    def test_streamed_response_holds_its_slot_until_closed(self):
+        middleware = self._middleware(lambda request: StreamingHttpResponse(iter(['a', 'b'])))
+        response = middleware(self.factory.get('/vote-admin/dashboard/'))
+        self.assertEqual(middleware.controller.in_flight, 1)
+        # The low-priority share is used up until the export is closed
+        self.assertEqual(middleware(self.factory.get('/vote-admin/dashboard/')).status_code, 503)
+
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+        response.close()
+        self.assertEqual(middleware.controller.in_flight, 0)
@@ -0,0 +1,241 @@
+# throttle.py
+"""
+Per-IP and per-account request throttling.
+
+VOTING_SETTINGS['THROTTLE_RATES'] declares, per URL name, the rate each
+client IP and each account may hit that view at, e.g.
+
+    'login': {'methods': ['POST'], 'ip': '20/m', 'account': '5/m'},
+
+Every (view, scope, identity) has a token bucket of `limit` tokens that
+refills continuously over the period. The bucket lives in the 'throttle'
+cache in its sliding-window form: the tokens spent in the current and
+previous period are two counters, the previous one draining linearly as
+the period advances, so a check is one incr() plus one get() whatever the
+traffic.
+
+That only holds on a backend whose incr() and add() are atomic and O(1):
+Redis or Memcached, shared by every worker, or local memory, which is
+atomic but private to each process. ThrottleMiddleware refuses to start
+on any other backend; the file-based cache, for one, increments with a
+get and a set that race between workers and lists its directory on
+every write. With DEBUG off it also refuses local memory, under which
+N worker processes let N times the rate through, unless
+VOTING_SETTINGS['THROTTLE_LOCAL_MEMORY'] says a single process serves
+the site.
+
+The account of a request is the logged-in user, or else the phone number
+or username it is trying to use (login, registration and OTP forms), so
+an attacker can't dodge the account limit by never logging in.
+ThrottleMiddleware applies the rules and adds X-RateLimit-* headers.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import PyLibMCCache, PyMemcacheCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, JsonResponse
+
+from .metrics import THROTTLED
+from .utils import phone_key, wants_json
+
+KEY_PREFIX = 'voting.throttle:'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+SCOPES = ('ip', 'account')
+CACHE_ALIAS = 'throttle'
+# Backends whose incr() and add() are atomic and don't scan the cache
+ATOMIC_BACKENDS = (RedisCache, PyMemcacheCache, PyLibMCCache, LocMemCache)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def check_cache_backend():
+    """Raise ImproperlyConfigured unless the bucket cache is an atomic backend shared by the workers"""
+    cache = _cache()
+    if not isinstance(cache, ATOMIC_BACKENDS):
+        raise ImproperlyConfigured(
+            f"CACHES[{CACHE_ALIAS!r}] uses {type(cache).__name__}, whose incr() is not atomic; "
+            'throttling needs Redis, Memcached or local memory'
+        )
+    if (
+        isinstance(cache, LocMemCache)
+        and not settings.DEBUG
+        and not settings.VOTING_SETTINGS.get('THROTTLE_LOCAL_MEMORY', False)
+    ):
+        raise ImproperlyConfigured(
+            f"CACHES[{CACHE_ALIAS!r}] is local memory, so every worker process throttles on its own "
+            'buckets; set VOTING_REDIS_URL, or VOTING_THROTTLE_LOCAL_MEMORY=1 if one process serves the site'
+        )
+
+
+def parse_rate(rate):
+    """'20/m' -> (20, 60)"""
+    try:
+        count, period = rate.split('/')
+        return int(count), PERIODS[period.strip()[0]]
+    except (AttributeError, ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f"Invalid throttle rate {rate!r}, expected e.g. '20/m'")
+
+
+class ThrottleRule:
+    """Limits of one view: {scope: (limit, period seconds)} for the listed methods"""
+    __slots__ = ('view', 'methods', 'limits')
+
+    def __init__(self, view, methods, limits):
+        self.view = view
+        self.methods = methods
+        self.limits = limits
+
+    def applies_to(self, request):
+        return self.methods is None or request.method in self.methods
+
+
+def get_throttle_rules():
+    """THROTTLE_RATES parsed into {URL name: ThrottleRule}"""
+    rules = {}
+    for view, spec in settings.VOTING_SETTINGS.get('THROTTLE_RATES', {}).items():
+        methods = spec.get('methods')
+        limits = {scope: parse_rate(spec[scope]) for scope in SCOPES if spec.get(scope)}
+        rules[view] = ThrottleRule(view, frozenset(methods) if methods else None, limits)
+    return rules
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def account_identity(request):
+    """The account request acts as or for, or None if it names none"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+
+    claimed = None
+    if request.method == 'POST':
+        claimed = request.POST.get('login_identifier') or request.POST.get('phone_number')
+    if not claimed and hasattr(request, 'session'):
+        claimed = request.session.get('registration_phone')
+    if not claimed:
+        return None
+
+    key = phone_key(claimed)
+    if key is not None:
+        return f'phone:{key}'
+    # Usernames are case-insensitive at login; hash to bound the key length
+    return 'name:' + hashlib.sha256(claimed.strip().lower().encode()).hexdigest()[:32]
+
+
+class BucketState:
+    """Outcome of taking one token from a bucket"""
+    __slots__ = ('allowed', 'limit', 'remaining', 'reset', 'retry_after')
+
+    def __init__(self, allowed, limit, remaining, reset, retry_after):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+
+def take_token(bucket, limit, period, now=None):
+    """
+    Take a token from bucket; returns a BucketState.
+
+    A refused request still spends its token, so a client that keeps
+    hammering stays throttled until it slows down below the rate.
+    """
+    cache = _cache()
+    now = time.time() if now is None else now
+    window = int(now // period)
+    current_key = f'{KEY_PREFIX}{bucket}:{window}'
+
+    try:
+        used = cache.incr(current_key)
+    except ValueError:
+        # First request of the window; add() is atomic, so if another
+        # worker created the counter first we increment theirs
+        if cache.add(current_key, 1, period * 2):
+            used = 1
+        else:
+            used = cache.incr(current_key)
+    previous = cache.get(f'{KEY_PREFIX}{bucket}:{window - 1}', 0)
+
+    elapsed = now - window * period
+    carried = previous * (1 - elapsed / period)
+    level = used + carried
+    reset = math.ceil(period - elapsed)
+
+    if level <= limit:
+        return BucketState(True, limit, int(limit - level), reset, 0)
+
+    # The carried-over tokens drain at previous/period per second; if they
+    # can't cover the excess, the client waits for the next window
+    excess = level - limit
+    if excess <= carried:
+        retry_after = excess * period / previous
+    else:
+        retry_after = period - elapsed
+    return BucketState(False, limit, 0, reset, max(1, math.ceil(retry_after)))
+
+
+def check(rule, request):
+    """
+    Take a token from each of rule's buckets for request.
+
+    Returns (scope, BucketState) of the bucket that refused the request, or
+    of the one with the fewest tokens left when all allowed it; None when
+    no bucket applies.
+    """
+    tightest = None
+    for scope, (limit, period) in rule.limits.items():
+        identity = client_ip(request) if scope == 'ip' else account_identity(request)
+        if identity is None:
+            continue
+        state = take_token(f'{rule.view}:{scope}:{identity}', limit, period)
+        if not state.allowed:
+            return scope, state
+        if tightest is None or state.remaining < tightest[1].remaining:
+            tightest = scope, state
+    return tightest
+
+
+THROTTLED_PAGE = """<!DOCTYPE html>
+<html lang="ar" dir="rtl">
+<head><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
+<title>محاولات كثيرة</title></head>
+<body style="font-family: sans-serif; text-align: center; padding: 3rem 1rem;">
+<h1>محاولات كثيرة</h1>
+<p>يرجى الانتظار {retry_after} ثانية ثم المحاولة مرة أخرى.</p>
+<p><a href="javascript:history.back()">رجوع</a></p>
+</body>
+</html>
+"""
+
+
+def set_rate_limit_headers(response, state):
+    response['X-RateLimit-Limit'] = str(state.limit)
+    response['X-RateLimit-Remaining'] = str(state.remaining)
+    response['X-RateLimit-Reset'] = str(state.reset)
+    if not state.allowed:
+        response['Retry-After'] = str(state.retry_after)
+
+
+def throttled_response(request, rule, scope, state):
+    """429 for a request refused by rule's scope bucket"""
+    THROTTLED.inc(view=rule.view, scope=scope)
+    if wants_json(request):
+        response = JsonResponse(
+            {'success': False, 'message': 'Too many requests. Please wait.', 'retry_after': state.retry_after},
+            status=429,
+        )
+    else:
+        response = HttpResponse(THROTTLED_PAGE.format(retry_after=state.retry_after), status=429)
+    response['Cache-Control'] = 'no-store'
+    return response
@@ -1,6 +1,11 @@
 # urls.py (app level)
+from django.conf import settings
 from django.urls import path
 from . import views
+from . import async_views
+
+# Under ASGI the read-heavy pages are served by native async views
+read_views = async_views if settings.VOTING_SETTINGS.get('ASYNC_VIEWS') else views
 
 urlpatterns = [
     # Authentication URLs
@@ -10,28 +15,31 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
 
     # User Dashboard URLs
-    path('dashboard/', views.dashboard_view, name='dashboard'),
+    path('dashboard/', read_views.dashboard_view, name='dashboard'),
     path('poll/<uuid:poll_id>/', views.poll_detail_view, name='poll_detail'),
-    path('poll/<uuid:poll_id>/results/', views.poll_results_view, name='poll_results'),
+    path('poll/<uuid:poll_id>/results/', read_views.poll_results_view, name='poll_results'),
+    path('poll/<uuid:poll_id>/turnout/', views.poll_turnout_view, name='poll_turnout'),
 
     # Admin URLs
     path('vote-admin/dashboard/', views.admin_dashboard_view, name='admin_dashboard'),
     path('vote-admin/create-poll/', views.create_poll_view, name='create_poll'),
     path('vote-admin/polls/', views.poll_management_view, name='poll_management'),
     path('vote-admin/poll/<uuid:poll_id>/update-status/', views.update_poll_status_view, name='update_poll_status'),
+    path('vote-admin/metrics/', views.metrics_view, name='metrics'),
 
     # NEW: User Management URLs
     path('vote-admin/users/', views.registered_users_view, name='registered_users'),
     path('vote-admin/users/print/', views.print_users_pdf, name='print_users_pdf'),
 
     # NEW: Team Management URLs
-    path('teams/', views.teams_view, name='teams_list'),
-    path('teams/<uuid:team_id>/', views.team_detail_view, name='team_detail'),
+    path('teams/', read_views.teams_view, name='teams_list'),
+    path('teams/<uuid:team_id>/', read_views.team_detail_view, name='team_detail'),
     path('vote-admin/teams/', views.team_management_view, name='team_management'),
     path('vote-admin/teams/create/', views.create_team_view, name='create_team'),
     path('vote-admin/teams/<uuid:team_id>/edit/', views.edit_team_view, name='edit_team'),
      path('resend-verification/', views.resend_verification_view, name='resend_verification'),
     # AJAX URLs
-    path('ajax/resend-otp/', views.resend_otp_view, name='resend_otp'),
+    path('ajax/resend-otp/', read_views.resend_otp_view, name='resend_otp'),
     path('vote-admin/poll/<uuid:poll_id>/vote-details/', views.poll_vote_details_view, name='poll_vote_details'),
+    path('vote-admin/poll/<uuid:poll_id>/vote-details/export/', views.poll_votes_export_view, name='poll_votes_export'),
 ]
\ No newline at end of file
@@ -1,15 +1,40 @@
 # utils.py
-import requests
+# requests is imported inside the senders: it adds ~50ms to every worker's
+# start-up and is only needed when an SMS actually goes out
 from django.conf import settings
+from functools import lru_cache
 import logging
 import random
+import time
+
+from .metrics import SMS_LATENCY
 
 logger = logging.getLogger(__name__)
 
+
+def _timed_post(provider, *args, **kwargs):
+    """requests.post() that records the provider round trip in SMS_LATENCY"""
+    import requests
+
+    outcome = 'error'
+    start = time.perf_counter()
+    try:
+        response = requests.post(*args, **kwargs)
+        outcome = str(response.status_code)
+        return response
+    except requests.exceptions.Timeout:
+        outcome = 'timeout'
+        raise
+    finally:
+        SMS_LATENCY.observe(time.perf_counter() - start, provider=provider, outcome=outcome)
+
+
 def send_sms_otp(phone_number, otp_code=None):
     """
     Send OTP via SMS using Chinguisoft SMS Validation API
     """
+    import requests
+
     try:
         # Get configuration from settings
         validation_key = getattr(settings, 'CHINGUISOFT_VALIDATION_KEY', 'ciSPuRWNvl4HUyUP')
@@ -27,7 +52,7 @@ def send_sms_otp(phone_number, otp_code=None):
         # Format phone number for Mauritanian format (remove country code if present)
         formatted_phone = format_mauritanian_phone(phone_number)
         if not formatted_phone:
-            logger.error(f"Invalid phone number format: {phone_number}")
+            logger.error("Invalid phone number format: %s", phone_number)
             return False, "Invalid phone number format"
         
         # Chinguisoft API endpoint
@@ -47,24 +72,24 @@ def send_sms_otp(phone_number, otp_code=None):
         }
         
         # Make the API call
-        response = requests.post(api_url, json=payload, headers=headers, timeout=15)
+        response = _timed_post('chinguisoft', api_url, json=payload, headers=headers, timeout=15)
         
         # Handle different response codes
         if response.status_code == 200:
             response_data = response.json()
             balance = response_data.get('balance', 'Unknown')
-            logger.info(f"OTP sent successfully to {phone_number}. Balance: {balance}")
+            logger.info("OTP sent successfully to %s. Balance: %s", phone_number, balance)
             return True, otp_code
             
         elif response.status_code == 422:
             # Validation error
             errors = response.json().get('errors', {})
-            logger.error(f"Validation error for {phone_number}: {errors}")
+            logger.error("Validation error for %s: %s", phone_number, errors)
             return False, "Invalid phone number or parameters"
             
         elif response.status_code == 429:
             # Too many requests
-            logger.error(f"Rate limited for {phone_number}")
+            logger.error("Rate limited for %s", phone_number)
             return False, "Too many requests, please try again later"
             
         elif response.status_code == 401:
@@ -76,7 +101,7 @@ def send_sms_otp(phone_number, otp_code=None):
             # Payment required
             response_data = response.json()
             balance = response_data.get('balance', 0)
-            logger.error(f"Insufficient balance: {balance}")
+            logger.error("Insufficient balance: %s", balance)
             return False, "SMS service balance insufficient"
             
         elif response.status_code == 503:
@@ -85,20 +110,29 @@ def send_sms_otp(phone_number, otp_code=None):
             return False, "SMS service temporarily unavailable"
             
         else:
-            logger.error(f"Unexpected response from Chinguisoft: {response.status_code} - {response.text}")
+            logger.error("Unexpected response from Chinguisoft: %s - %s", response.status_code, response.text)
             return False, "SMS service error"
     
     except requests.exceptions.Timeout:
-        logger.error(f"Timeout sending OTP to {phone_number}")
+        logger.error("Timeout sending OTP to %s", phone_number)
         return False, "SMS service timeout"
     except requests.exceptions.RequestException as e:
-        logger.error(f"Request error sending OTP to {phone_number}: {str(e)}")
+        logger.error("Request error sending OTP to %s: %s", phone_number, e)
         return False, "Network error"
     except Exception as e:
-        logger.error(f"Unexpected error sending OTP to {phone_number}: {str(e)}")
+        logger.exception("Unexpected error sending OTP to %s", phone_number)
         return False, "Unexpected error"
 
 
+def wants_json(request):
+    """Whether request comes from a script that expects a JSON body"""
+    return (
+        request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        or 'application/json' in request.headers.get('Accept', '')
+        or request.content_type == 'application/json'
+    )
+
+
 def format_mauritanian_phone(phone_number):
     """
     Format phone number for Mauritanian SMS API
@@ -129,6 +163,26 @@ def format_mauritanian_phone(phone_number):
     return None
 
 
+@lru_cache(maxsize=4096)
+def phone_key(phone_number):
+    """
+    Canonical numeric key of a phone number: its 8-digit national number
+    as an int, or None if it isn't a valid Mauritanian number.
+
+    Memoized, since login, registration and OTP resend normalize the same
+    few numbers over and over. Stored in CustomUser.phone_key.
+    """
+    if not phone_number:
+        return None
+    formatted_phone = format_mauritanian_phone(phone_number)
+    return int(formatted_phone) if formatted_phone else None
+
+
+def canonical_phone_number(key):
+    """The +222XXXXXXXX form stored in phone_number for a phone_key"""
+    return f"+222{key}"
+
+
 def send_sms_notification(phone_number, message):
     """
     Send general SMS notifications
@@ -149,17 +203,17 @@ def send_sms_notification(phone_number, message):
             'Authorization': f'Bearer {api_key}'
         }
         
-        response = requests.post(api_url, json=payload, headers=headers, timeout=10)
+        response = _timed_post('notification', api_url, json=payload, headers=headers, timeout=10)
         
         if response.status_code == 200:
-            logger.info(f"Notification sent successfully to {phone_number}")
+            logger.info("Notification sent successfully to %s", phone_number)
             return True
         else:
-            logger.error(f"Failed to send notification to {phone_number}")
+            logger.error("Failed to send notification to %s", phone_number)
             return False
     
     except Exception as e:
-        logger.error(f"Error sending notification to {phone_number}: {str(e)}")
+        logger.error("Error sending notification to %s: %s", phone_number, e)
         return False
 
 
@@ -187,11 +241,11 @@ def send_otp_twilio(phone_number, otp_code):
             to=phone_number
         )
         
-        logger.info(f"OTP sent via Twilio to {phone_number}, SID: {message.sid}")
+        logger.info("OTP sent via Twilio to %s, SID: %s", phone_number, message.sid)
         return True
     
     except Exception as e:
-        logger.error(f"Twilio SMS error: {str(e)}")
+        logger.error("Twilio SMS error: %s", e)
         return False
 
 
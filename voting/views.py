@@ -4,54 +4,51 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, QueryDict, StreamingHttpResponse
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
 from django.db.models import Count, Q
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views.generic import View
 import random
 import json
+import logging
+import uuid
 from datetime import timedelta
-from django.db.models import Count, Q
-from django.core.paginator import Paginator
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from io import BytesIO
 
-from .models import CustomUser, Poll, Option, Vote, OTPLog, Team  # Add Team import
-
-from .models import CustomUser, Poll, Option, Vote, OTPLog
-from .utils import send_sms_otp  # You'll need to implement this with your SMS API
+from .models import CustomUser, Poll, Option, Vote, OTPLog, Team, Ballot
+from .utils import send_sms_otp, phone_key, canonical_phone_number, wants_json  # You'll need to implement this with your SMS API
+from .ingest import record_vote, VOTE_CREATED, VOTE_DUPLICATE, VoteIngestionTimeout
+from .idempotency import PENDING, IdempotencyKeyReused, submission_for
+from .otp import store_otp, consume_otp, OTP_EXPIRED, OTP_INVALID
+from .metrics import render_prometheus
+from .results import close_poll, reopen_poll, get_results
+from .archive import archived_vote_total, votes_for
+from .participation import voter_count
+from .exports import build_users_pdf, stream_votes_csv, stream_votes_ndjson
+from .polls import PollBuildError, build_poll
+from .ballots import (
+    BallotError, ballot_count_subquery, ballot_options, cast_ballot, decode_choices, describe_choices, encode_choices,
+)
+from .rollups import team_poll_breakdown, team_vote_counts, turnout_series
+from .backends import LOGIN_INVALID_PHONE, LOGIN_PHONE_NOT_VERIFIED, LOGIN_USE_PHONE
+from .conditional import (
+    conditional_page, poll_results_etag, team_detail_etag, team_detail_last_modified,
+    teams_list_etag, teams_list_last_modified, poll_management_etag, dashboard_etag,
+)
+
+logger = logging.getLogger(__name__)
 
 
 # ==================== Authentication Views ====================
 
-# Add these imports to your existing views.py
-from django.db.models import Count, Q
-from django.core.paginator import Paginator
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from io import BytesIO
-
-from .models import CustomUser, Poll, Option, Vote, OTPLog, Team  # Add Team import
-
 # Update the register_view to include full_name
 def register_view(request):
     """User registration with phone number and full name"""
-    if request.user.is_admin():
-        messages.info(request, 'تم توجيهك إلى صفحة النتائج')
-        return redirect('poll_results', poll_id=poll.id)
     if request.user.is_authenticated:
         if request.user.is_admin():
             return redirect('admin_dashboard')
@@ -66,53 +63,49 @@ def register_view(request):
             return render(request, 'registration/register.html')
 
         # Format phone number for Mauritania (normalize to 8 digits)
-        from .utils import format_mauritanian_phone
-        formatted_phone = format_mauritanian_phone(phone_number)
+        key = phone_key(phone_number)
 
-        if not formatted_phone:
+        if key is None:
             messages.error(request, 'يرجى إدخال رقم هاتف  صحيح (8 أرقام تبدأ بـ 2 أو 3 أو 4)')
             return render(request, 'registration/register.html')
 
         # Store the formatted number with +222 prefix for consistency
-        full_phone_number = f"+222{formatted_phone}"
+        formatted_phone = str(key)
+        full_phone_number = canonical_phone_number(key)
 
         # Check if user already exists
-        if CustomUser.objects.filter(phone_number=full_phone_number).exists():
+        if CustomUser.objects.filter(phone_key=key).exists():
             messages.error(request, 'رقم الهاتف مسجل بالفعل')
             return render(request, 'registration/register.html')
 
+        # Send OTP via SMS using Chinguisoft API before creating the account,
+        # so a failed send does not cost an insert and a delete
+        success, otp_or_error = send_sms_otp(full_phone_number)
+
+        if not success:
+            messages.error(request, f'فشل في إرسال رمز التحقق: {otp_or_error}')
+            return render(request, 'registration/register.html')
+
         # Create user (not verified yet)
         try:
-            user = CustomUser.objects.create_user(
+            CustomUser.objects.create_user(
                 phone_number=full_phone_number,
                 username=full_phone_number,
                 full_name=full_name,  # NEW: Add full name
                 user_type='user',
                 is_phone_verified=False,
-                otp_created_at=timezone.now()
             )
-        except Exception as e:
+        except Exception:
+            logger.exception('Could not create account after sending OTP')
             messages.error(request, 'خطأ في إنشاء الحساب')
             return render(request, 'registration/register.html')
 
-        # Send OTP via SMS using Chinguisoft API
-        success, otp_or_error = send_sms_otp(full_phone_number)
-
-        if success:
-            # Store the OTP code returned by Chinguisoft
-            user.otp_code = otp_or_error
-            user.save()
-
-            # Log OTP request
-            OTPLog.objects.create(phone_number=full_phone_number, otp_code=otp_or_error)
+        # Keep the OTP code returned by Chinguisoft in the OTP store
+        store_otp(full_phone_number, otp_or_error)
 
-            request.session['registration_phone'] = full_phone_number
-            messages.success(request, f'تم إرسال رمز التحقق إلى {formatted_phone}')
-            return redirect('verify_otp')
-        else:
-            user.delete()  # Clean up if SMS fails
-            messages.error(request, f'فشل في إرسال رمز التحقق: {otp_or_error}')
-            return render(request, 'registration/register.html')
+        request.session['registration_phone'] = full_phone_number
+        messages.success(request, f'تم إرسال رمز التحقق إلى {formatted_phone}')
+        return redirect('verify_otp')
 
     return render(request, 'registration/register.html')
 
@@ -189,74 +182,18 @@ def print_users_pdf(request):
         messages.error(request, 'ليس لديك صلاحية للوصول')
         return redirect('dashboard')
 
-    # Create the HttpResponse object with PDF headers
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="registered_users.pdf"'
-
-    # Create the PDF object
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-
-    # Container for 'story' elements
-    story = []
-
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        spaceAfter=30,
-        alignment=1,  # Center alignment
-    )
+    users = CustomUser.objects.filter(user_type='user').only(
+        'full_name', 'phone_number', 'created_at', 'is_phone_verified'
+    ).order_by('full_name')
 
-    # Add title
-    title = Paragraph("قائمة المستخدمين المسجلين - النادي الثقافي لشباب لبير", title_style)
-    story.append(title)
-    story.append(Spacer(1, 12))
-
-    # Get users data
-    users = CustomUser.objects.filter(user_type='user').order_by('full_name')
-
-    # Create table data
-    data = [['#', 'الاسم الكامل', 'رقم الهاتف', 'تاريخ التسجيل', 'مؤكد']]
-
-    for i, user in enumerate(users, 1):
-        data.append([
-            str(i),
-            user.full_name or 'غير محدد',
-            user.phone_number or 'غير محدد',
-            user.created_at.strftime('%Y-%m-%d'),
-            'نعم' if user.is_phone_verified else 'لا'
-        ])
-
-    # Create table
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-
-    story.append(table)
-
-    # Build PDF
-    doc.build(story)
-
-    # Get the value of the BytesIO buffer and write it to the response
-    pdf = buffer.getvalue()
-    buffer.close()
-    response.write(pdf)
+    response = HttpResponse(build_users_pdf(users), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="registered_users.pdf"'
 
     return response
 
 # NEW: Teams management view
 @login_required
+@conditional_page(etag_func=teams_list_etag, last_modified_func=teams_list_last_modified)
 def teams_view(request):
     """View all registered teams - Public view"""
     teams = Team.objects.filter(is_active=True).order_by('created_at')
@@ -300,6 +237,10 @@ def team_management_view(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    vote_counts = team_vote_counts(page_obj)
+    for team in page_obj:
+        team.vote_count = vote_counts[team.pk]
+
     context = {
         'page_obj': page_obj,
         'search_query': search_query,
@@ -382,12 +323,16 @@ def edit_team_view(request, team_id):
 
 # NEW: Team detail view
 @login_required
+@conditional_page(etag_func=team_detail_etag, last_modified_func=team_detail_last_modified)
 def team_detail_view(request, team_id):
     """View team details"""
-    team = get_object_or_404(Team, id=team_id)
+    team = get_object_or_404(Team.objects.prefetch_related('options__poll'), id=team_id)
+    poll_tallies = team_poll_breakdown(team)
 
     context = {
         'team': team,
+        'team_vote_count': sum(tally.vote_count for tally in poll_tallies),
+        'poll_tallies': poll_tallies,
         'can_edit': request.user.can_create_polls(),
     }
 
@@ -414,40 +359,47 @@ def verify_otp_view(request):
             messages.error(request, 'كلمات المرور غير متطابقة')
             return render(request, 'registration/verify_otp.html', {'phone_number': phone_number})
 
-        try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+        # Check and consume the OTP in one step (expires after OTP_EXPIRY_MINUTES)
+        otp_status = consume_otp(phone_number, otp_code)
 
-            # Check OTP validity (5 minutes expiry)
-            if user.otp_created_at and timezone.now() - user.otp_created_at > timedelta(minutes=5):
-                messages.error(request, 'انتهت صلاحية رمز التحقق. يرجى طلب رمز جديد.')
-                return render(request, 'registration/verify_otp.html', {'phone_number': phone_number})
+        if otp_status == OTP_EXPIRED:
+            messages.error(request, 'انتهت صلاحية رمز التحقق. يرجى طلب رمز جديد.')
+            return render(request, 'registration/verify_otp.html', {'phone_number': phone_number})
 
-            if user.otp_code == otp_code:
-                user.is_phone_verified = True
-                user.set_password(password)
-                user.otp_code = None
-                user.otp_created_at = None
-                user.save()
+        if otp_status == OTP_INVALID:
+            messages.error(request, 'رمز التحقق غير صحيح')
+            return render(request, 'registration/verify_otp.html', {'phone_number': phone_number})
 
-                # Mark OTP as used
-                OTPLog.objects.filter(phone_number=phone_number, otp_code=otp_code).update(is_used=True)
+        try:
+            user = CustomUser.objects.get(phone_key=phone_key(phone_number))
+        except CustomUser.DoesNotExist:
+            messages.error(request, 'المستخدم غير موجود')
+            return redirect('register')
 
-                login(request, user)
+        # The only write to the user row in the whole OTP flow
+        user.is_phone_verified = True
+        user.set_password(password)
+        user.save(update_fields=['is_phone_verified', 'password'])
 
-                # FIXED: Use pop() instead of del to avoid KeyError
-                request.session.pop('registration_phone', None)
+        # Mark OTP as used
+        OTPLog.objects.filter(phone_number=phone_number, otp_code=otp_code).update(is_used=True)
 
-                messages.success(request, 'تم التسجيل بنجاح!')
-                return redirect('dashboard')
-            else:
-                messages.error(request, 'رمز التحقق غير صحيح')
+        login(request, user)
 
-        except CustomUser.DoesNotExist:
-            messages.error(request, 'المستخدم غير موجود')
-            return redirect('register')
+        # FIXED: Use pop() instead of del to avoid KeyError
+        request.session.pop('registration_phone', None)
+
+        messages.success(request, 'تم التسجيل بنجاح!')
+        return redirect('dashboard')
 
     return render(request, 'registration/verify_otp.html', {'phone_number': phone_number})
 
+LOGIN_FAILURE_MESSAGES = {
+    LOGIN_INVALID_PHONE: 'رقم هاتف غير صحيح',
+    LOGIN_PHONE_NOT_VERIFIED: 'رقم الهاتف غير مؤكد',
+    LOGIN_USE_PHONE: 'استخدم رقم الهاتف لتسجيل الدخول كمستخدم عادي',
+}
+
 def login_view(request):
     """User login with phone number/username and password"""
     if request.user.is_authenticated:
@@ -463,40 +415,9 @@ def login_view(request):
             messages.error(request, 'جميع الحقول مطلوبة')
             return render(request, 'registration/login.html')
 
-        user = None
-
-        # Try to determine if it's a phone number or username
-        if login_identifier.isdigit() and len(login_identifier) == 8:
-            # It's a phone number - format it for regular users
-            from .utils import format_mauritanian_phone
-            formatted_phone = format_mauritanian_phone(login_identifier)
-            print(formatted_phone)
-            if formatted_phone:
-                full_phone_number = f"+222{formatted_phone}"
-                print(full_phone_number)
-                try:
-                    user_obj = CustomUser.objects.get(phone_number=full_phone_number, user_type='user')
-                    if not user_obj.is_phone_verified:
-                        messages.error(request, 'رقم الهاتف غير مؤكد')
-                        return render(request, 'registration/login.html')
-
-                    user = authenticate(request, username=full_phone_number, password=password)
-                except CustomUser.DoesNotExist:
-                    pass
-            else:
-                messages.error(request, 'رقم هاتف غير صحيح')
-                return render(request, 'registration/login.html')
-        else:
-            # It's a username - for admin users
-            try:
-                user_obj = CustomUser.objects.get(username=login_identifier)
-                if user_obj.is_admin():
-                    user = authenticate(request, username=login_identifier, password=password)
-                else:
-                    messages.error(request, 'استخدم رقم الهاتف لتسجيل الدخول كمستخدم عادي')
-                    return render(request, 'registration/login.html')
-            except CustomUser.DoesNotExist:
-                pass
+        # Phone/username resolution and the verified/admin checks happen in
+        # PhoneOrUsernameBackend with a single lookup
+        user = authenticate(request, username=login_identifier, password=password)
 
         if user:
             login(request, user)
@@ -509,7 +430,8 @@ def login_view(request):
             else:
                 return redirect('dashboard')  # Normal users go to user dashboard
         else:
-            messages.error(request, 'بيانات الدخول غير صحيحة')
+            failure = getattr(request, 'login_failure', None)
+            messages.error(request, LOGIN_FAILURE_MESSAGES.get(failure, 'بيانات الدخول غير صحيحة'))
 
     return render(request, 'registration/login.html')
 
@@ -524,6 +446,7 @@ def logout_view(request):
 
 # Update dashboard_view to handle all user types properly
 @login_required
+@conditional_page(etag_func=dashboard_etag)
 def dashboard_view(request):
     """User dashboard - redirect admins to their appropriate pages"""
     # Super admins go to admin dashboard
@@ -541,6 +464,8 @@ def dashboard_view(request):
         start_time__lte=now,
         end_time__gte=now,
         status='active'
+    ).annotate(
+        total_votes=Count('votes') + Coalesce(ballot_count_subquery(), 0)
     ).order_by('-created_at')
 
     # Get upcoming polls
@@ -550,7 +475,9 @@ def dashboard_view(request):
     ).order_by('start_time')
 
     # Get user's voted polls
-    voted_poll_ids = Vote.objects.filter(user=request.user).values_list('poll_id', flat=True)
+    voted_poll_ids = Vote.objects.filter(user=request.user).order_by().values_list('poll_id', flat=True).union(
+        Ballot.objects.filter(user=request.user).order_by().values_list('poll_id', flat=True)
+    )
 
     context = {
         'active_polls': active_polls,
@@ -569,61 +496,35 @@ def dashboard_view(request):
 from django.templatetags.static import static # Add this import at the top of the file
 
 @login_required
+@conditional_page(etag_func=poll_results_etag)
 def poll_results_view(request, poll_id):
     """Poll results view - ONLY for admins"""
-    poll = get_object_or_404(Poll, id=poll_id)
+    poll = get_object_or_404(Poll.objects.select_related('result_snapshot'), id=poll_id)
 
     if not request.user.is_admin():
         messages.error(request, 'فقط المسؤولون يمكنهم عرض النتائج')
         return redirect('dashboard')
 
-    user_vote = Vote.objects.filter(poll=poll, user=request.user).first() if request.user.user_type == 'user' else None
-
-    total_votes = poll.get_total_votes()
-    options_with_results = []
-
-    for option in poll.options.all():
-        vote_count = option.get_vote_count()
-        percentage = option.get_vote_percentage(total_votes)
-        options_with_results.append({
-            'option': option,
-            'vote_count': vote_count,
-            'percentage': percentage
-        })
-
-    sorted_options_with_results = sorted(
-        options_with_results,
-        key=lambda item: item['vote_count'],
-        reverse=True
-    )
-
-    # NEW: Get the absolute URL for the logo for printing
-    logo_url = request.build_absolute_uri(static('club-logo.png'))
-     # NEW: Calculate additional statistics
-    total_registered_users = CustomUser.objects.filter(user_type='user', is_phone_verified=True).count()
-    unique_voters = Vote.objects.filter(poll=poll).values('user').distinct().count()
-    participation_rate = round((unique_voters / total_registered_users * 100) if total_registered_users > 0 else 0, 1)
-    valid_votes = total_votes  # All votes in your system are valid
-    invalid_votes = 0  # Add logic here if you track invalid votes
-    # Calculate neutral votes
-    neutral_votes = Vote.objects.filter(poll=poll, option__option_text='حيادي').count()
     context = {
         'poll': poll,
-        'total_votes': total_votes,
-        'options_with_results': sorted_options_with_results,
-        'user_vote': user_vote,
-        'logo_url': logo_url, # NEW: Pass the logo URL to the template
-         'total_registered_users': total_registered_users,
-    'unique_voters': unique_voters,
-    'participation_rate': participation_rate,
-    'valid_votes': valid_votes,
-    'invalid_votes': invalid_votes,
-      'neutral_votes': neutral_votes,  # NEW
+        'user_vote': None,
+        'logo_url': request.build_absolute_uri(static('club-logo.png')),
+        **get_results(poll),
     }
 
     return render(request, 'polls/poll_results.html', context)
 
 
+@login_required
+def poll_turnout_view(request, poll_id):
+    """Votes per minute and per option for the turnout chart - admins only"""
+    if not request.user.is_admin():
+        return JsonResponse({'success': False, 'message': 'Access denied'}, status=403)
+
+    poll = get_object_or_404(Poll, id=poll_id)
+    return JsonResponse({'success': True, **turnout_series(poll)})
+
+
 @login_required
 def poll_vote_details_view(request, poll_id):
     """View detailed vote information - SUPER ADMIN ONLY"""
@@ -633,8 +534,11 @@ def poll_vote_details_view(request, poll_id):
 
     poll = get_object_or_404(Poll, id=poll_id)
 
-    # Get all votes with user info
-    votes = Vote.objects.filter(poll=poll).select_related('user', 'option').order_by('-voted_at')
+    # Get all votes with user info, from the archive for long-closed polls
+    if poll.uses_ballots():
+        votes = Ballot.objects.filter(poll=poll).select_related('user').order_by('-cast_at')
+    else:
+        votes = votes_for(poll).select_related('user', 'option').order_by('-voted_at')
 
     # Search functionality
     search_query = request.GET.get('search', '')
@@ -648,20 +552,130 @@ def poll_vote_details_view(request, poll_id):
     paginator = Paginator(votes, 50)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    if poll.uses_ballots():
+        options = ballot_options(poll)
+        for ballot in page_obj:
+            ballot.choice_text = describe_choices(poll.ballot_type, ballot.choices, options)
 
     context = {
         'poll': poll,
         'page_obj': page_obj,
         'search_query': search_query,
-        'total_votes': votes.count(),
+        # One vote per voter, so the bitmap's count stands in for COUNT(*)
+        'total_votes': paginator.count if search_query else voter_count(poll),
     }
 
     return render(request, 'admin/poll_vote_details.html', context)
 
+
+VOTE_EXPORT_FORMATS = {
+    'csv': (stream_votes_csv, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson': (stream_votes_ndjson, 'application/x-ndjson; charset=utf-8', 'ndjson'),
+}
+
+
+@login_required
+def poll_votes_export_view(request, poll_id):
+    """Stream every vote of a poll as CSV or NDJSON - SUPER ADMIN ONLY"""
+    if not request.user.is_super_admin():
+        return HttpResponseForbidden('Access denied')
+
+    poll = get_object_or_404(Poll, id=poll_id)
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in VOTE_EXPORT_FORMATS:
+        return HttpResponse('Unknown format', status=400)
+
+    stream, content_type, extension = VOTE_EXPORT_FORMATS[export_format]
+    logger.info('Votes of poll %s exported as %s by %s', poll.id, export_format, request.user.username)
+
+    votes = Ballot.objects.filter(poll=poll) if poll.uses_ballots() else votes_for(poll)
+    response = StreamingHttpResponse(stream(votes), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="poll-{poll.id}-votes.{extension}"'
+    return response
+
+VOTE_OUTCOME_MESSAGES = {
+    VOTE_CREATED: (messages.SUCCESS, 'تم تسجيل صوتك بنجاح!'),
+    VOTE_DUPLICATE: (messages.INFO, 'لقد قمت بالتصويت مسبقاً في هذا الاستطلاع'),
+}
+
+
+def _vote_data(request):
+    """The submitted vote fields, from the form or from a JSON body"""
+    if request.content_type != 'application/json':
+        return request.POST
+    data = QueryDict(mutable=True)
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        return data
+    if isinstance(body, dict):
+        for name, value in body.items():
+            data.setlist(name, [str(item) for item in value] if isinstance(value, list) else [str(value)])
+    return data
+
+
+def _vote_choices(poll, data):
+    """The option ids a vote submission chose, in ballot order"""
+    if poll.ballot_type == Poll.BALLOT_RANKED:
+        return data.getlist('ranking')
+    if poll.ballot_type == Poll.BALLOT_APPROVAL:
+        return sorted(data.getlist('option_ids'))
+    return [data.get('option_id', '')]
+
+
+def _vote_outcome_response(request, outcome, level, message, status=200, replayed=False):
+    if wants_json(request):
+        response = JsonResponse(
+            {'success': True, 'outcome': outcome, 'message': message, 'replayed': replayed},
+            status=status,
+        )
+    else:
+        messages.add_message(request, level, message)
+        response = redirect('dashboard')
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _vote_recorded(request, outcome, submission):
+    """Respond to a recorded (or duplicate) vote and store the outcome under its key"""
+    level, message = VOTE_OUTCOME_MESSAGES[outcome]
+    if submission is not None:
+        submission.finish(outcome, level, message)
+    status = 201 if outcome == VOTE_CREATED else 200
+    return _vote_outcome_response(request, outcome, level, message, status=status)
+
+
+def _vote_replayed(request, record):
+    """Answer a retried submission from the record of the first one"""
+    if record['state'] == PENDING:
+        message = 'جاري تسجيل صوتك، يرجى الانتظار'
+        if wants_json(request):
+            response = JsonResponse({'success': False, 'message': message, 'retry_after': 1}, status=409)
+            response['Retry-After'] = '1'
+            return response
+        messages.info(request, message)
+        return redirect('dashboard')
+    return _vote_outcome_response(
+        request, record['outcome'], record['level'], record['message'], replayed=True
+    )
+
+
+def _vote_rejected(message, status=400):
+    """JSON answer to a vote submission that was not recorded"""
+    return JsonResponse({'success': False, 'message': message}, status=status)
+
+
 # Update the poll_detail_view to remove results redirect for normal users
 @login_required
 def poll_detail_view(request, poll_id):
-    """Poll detail and voting - NORMAL USERS ONLY"""
+    """
+    Poll detail and voting - NORMAL USERS ONLY
+
+    Submissions may carry an idempotency key (see voting.idempotency); a
+    retried submission gets the first one's outcome without touching the
+    votes. Scripts that ask for JSON get JSON answers.
+    """
     poll = get_object_or_404(Poll, id=poll_id)
 
     # NEW: Redirect admins to results page instead
@@ -669,47 +683,127 @@ def poll_detail_view(request, poll_id):
         messages.info(request, 'تم توجيهك إلى صفحة النتائج')
         return redirect('poll_results', poll_id=poll.id)
 
+    data, submission = None, None
+    if request.method == 'POST':
+        data = _vote_data(request)
+        try:
+            submission = submission_for(request, poll, data, _vote_choices(poll, data))
+            record = submission.claim() if submission is not None else None
+        except IdempotencyKeyReused:
+            message = 'تم استخدام هذا النموذج لاختيار مختلف، يرجى إعادة تحميل الصفحة'
+            if wants_json(request):
+                return _vote_rejected(message, status=422)
+            messages.error(request, message)
+            return redirect('poll_detail', poll_id=poll.id)
+        if record is not None:
+            return _vote_replayed(request, record)
+
+    try:
+        if poll.uses_ballots():
+            return _ballot_poll_detail(request, poll, data, submission)
+        return _single_choice_poll_detail(request, poll, data, submission)
+    finally:
+        # Submissions that ended without a recorded outcome may be retried
+        if submission is not None:
+            submission.release()
+
+
+def _single_choice_poll_detail(request, poll, data, submission):
     # Check if user already voted
     user_vote = Vote.objects.filter(poll=poll, user=request.user).first()
 
-    if request.method == 'POST' and not user_vote:
-        option_id = request.POST.get('option_id')
+    if request.method == 'POST' and user_vote:
+        return _vote_recorded(request, VOTE_DUPLICATE, submission)
+
+    if request.method == 'POST':
+        option_id = data.get('option_id')
 
         if not option_id:
+            if wants_json(request):
+                return _vote_rejected('الرجاء اختيار خيار')
             messages.error(request, 'الرجاء اختيار خيار')
-            return render(request, 'polls/poll_detail.html', {'poll': poll})
+            return render(request, 'polls/poll_detail.html', {'poll': poll, 'idempotency_key': uuid.uuid4().hex})
 
         # Check if poll is still active
         if not poll.is_active():
+            if wants_json(request):
+                return _vote_rejected('هذا الاستطلاع لم يعد نشطاً', status=409)
             messages.error(request, 'هذا الاستطلاع لم يعد نشطاً')
             return redirect('dashboard')
 
         try:
             option = Option.objects.get(id=option_id, poll=poll)
 
-            # Create vote
-            Vote.objects.create(
-                poll=poll,
-                user=request.user,
-                option=option,
+            # Create vote (directly or through the batched writer)
+            outcome = record_vote(
+                poll,
+                request.user,
+                option,
                 ip_address=request.META.get('REMOTE_ADDR')
             )
+            return _vote_recorded(request, outcome, submission)
 
-            messages.success(request, 'تم تسجيل صوتك بنجاح!')
-            return redirect('dashboard')
-
-        except Option.DoesNotExist:
+        except (Option.DoesNotExist, ValidationError):
+            if wants_json(request):
+                return _vote_rejected('الخيار المحدد غير صحيح')
             messages.error(request, 'الخيار المحدد غير صحيح')
+        except VoteIngestionTimeout:
+            logger.error('Vote ingestion timed out for poll %s', poll.id)
+            if wants_json(request):
+                response = _vote_rejected('تعذر تسجيل صوتك حالياً، يرجى المحاولة مرة أخرى', status=503)
+                response['Retry-After'] = '2'
+                return response
+            messages.error(request, 'تعذر تسجيل صوتك حالياً، يرجى المحاولة مرة أخرى')
 
     context = {
         'poll': poll,
         'user_vote': user_vote,
         'can_vote': poll.is_active() and not user_vote,
         'can_view_results': False,  # Normal users can't see results
+        # Fixed for this rendering of the form, so resubmitting it is a replay
+        'idempotency_key': uuid.uuid4().hex,
     }
 
     return render(request, 'polls/poll_detail.html', context)
 
+
+def _ballot_poll_detail(request, poll, data, submission):
+    """poll_detail_view for ranked-choice and approval polls"""
+    options = ballot_options(poll)
+    user_ballot = Ballot.objects.filter(poll=poll, user=request.user).first()
+
+    if request.method == 'POST' and user_ballot:
+        return _vote_recorded(request, VOTE_DUPLICATE, submission)
+
+    if request.method == 'POST':
+        if not poll.is_active():
+            if wants_json(request):
+                return _vote_rejected('هذا الاستطلاع لم يعد نشطاً', status=409)
+            messages.error(request, 'هذا الاستطلاع لم يعد نشطاً')
+            return redirect('dashboard')
+
+        try:
+            choices = encode_choices(poll.ballot_type, _vote_choices(poll, data), options)
+        except BallotError as e:
+            if wants_json(request):
+                return _vote_rejected(str(e))
+            messages.error(request, str(e))
+        else:
+            outcome = cast_ballot(poll, request.user, choices, ip_address=request.META.get('REMOTE_ADDR'))
+            return _vote_recorded(request, outcome, submission)
+
+    context = {
+        'poll': poll,
+        'options': options,
+        'ranks': range(1, len(options) + 1),
+        'user_ballot': user_ballot,
+        'ballot_choices': decode_choices(user_ballot.choices, options) if user_ballot else [],
+        'can_vote': poll.is_active() and not user_ballot,
+        'can_view_results': False,
+        'idempotency_key': uuid.uuid4().hex,
+    }
+    return render(request, 'polls/poll_ballot.html', context)
+
 # ==================== Admin Views ====================
 
 # Update admin_dashboard_view to restrict to super_admin only
@@ -724,14 +818,15 @@ def admin_dashboard_view(request):
     total_users = CustomUser.objects.filter(user_type='user').count()
     total_polls = Poll.objects.count()
     active_polls = Poll.objects.filter(status='active').count()
-    total_votes = Vote.objects.count()
+    # Ballot polls are never archived, so their ballots are all still live
+    total_votes = Vote.objects.count() + Ballot.objects.count() + archived_vote_total()
 
     # Calculate verified users percentage
     verified_users_count = CustomUser.objects.filter(user_type='user', is_phone_verified=True).count()
     verified_users = round((verified_users_count / total_users * 100) if total_users > 0 else 0)
 
     # Recent polls (limit to 10)
-    recent_polls = Poll.objects.all().order_by('-created_at')[:10]
+    recent_polls = Poll.objects.select_related('result_snapshot').order_by('-created_at')[:10]
 
     context = {
         'total_users': total_users,
@@ -772,69 +867,27 @@ def create_poll_view(request):
             poll_status = 'scheduled'
             success_message = 'Poll scheduled successfully!'
 
-        if not all([title, start_time, end_time]):
-            messages.error(request, 'Title, start/end times are required')
-            context = {'available_teams': available_teams}
-            return render(request, 'admin/create_poll.html', context)
-
         try:
-            # Create poll
-            poll = Poll.objects.create(
+            build_poll(
                 title=title,
                 description=description,
                 start_time=start_time,
                 end_time=end_time,
                 created_by=request.user,
-                status=poll_status
+                status=poll_status,
+                team_ids=request.POST.getlist('selected_teams') if poll_type == 'team' else None,
+                option_texts=request.POST.getlist('options') if poll_type != 'team' else None,
+                ballot_type=request.POST.get('ballot_type', Poll.BALLOT_SINGLE),
             )
-
-            if poll_type == 'team':
-                # Create options based on selected teams
-                selected_teams = request.POST.getlist('selected_teams')
-
-                if len(selected_teams) < 2:
-                    poll.delete()
-                    messages.error(request, 'يجب اختيار فريقين على الأقل للتصويت')
-                    context = {'available_teams': available_teams}
-                    return render(request, 'admin/create_poll.html', context)
-
-                for i, team_id in enumerate(selected_teams):
-                    try:
-                        team = Team.objects.get(id=team_id, is_active=True)
-                        Option.objects.create(
-                            poll=poll,
-                            option_text=team.name,
-                            team=team,
-                            order=i
-                        )
-                    except Team.DoesNotExist:
-                        continue
-
-            else:
-                # Create custom options (existing functionality)
-                options = request.POST.getlist('options')
-
-                if len(options) < 2:
-                    poll.delete()
-                    messages.error(request, 'At least 2 options are required')
-                    context = {'available_teams': available_teams}
-                    return render(request, 'admin/create_poll.html', context)
-
-                for i, option_text in enumerate(options):
-                    if option_text.strip():
-                        Option.objects.create(
-                            poll=poll,
-                            option_text=option_text.strip(),
-                            order=i
-                        )
-
             messages.success(request, success_message)
             return redirect('poll_management')
 
+        except PollBuildError as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f'Error creating poll: {str(e)}')
 
-    context = {'available_teams': available_teams}
+    context = {'available_teams': available_teams, 'ballot_choices': Poll.BALLOT_CHOICES}
     return render(request, 'admin/create_poll.html', context)
 # views.py (add this new view in the Admin Views section)
 
@@ -857,29 +910,29 @@ def update_poll_status_view(request, poll_id):
                 if poll.start_time > timezone.now():
                     poll.start_time = timezone.now()
                 poll.save()
+                logger.info('Poll %s published by %s', poll.id, request.user.username)
                 messages.success(request, f"Poll '{poll.title}' has been published.")
 
         elif action == 'close':
             # Close an active poll immediately
             if poll.status == 'active':
-                poll.status = 'closed'
-                # Optional: update end time to now
-                poll.end_time = timezone.now()
-                poll.save()
+                # Freezes the final results in a PollResultSnapshot
+                close_poll(poll, end_time=timezone.now())
+                logger.info('Poll %s closed by %s', poll.id, request.user.username)
                 messages.success(request, f"Poll '{poll.title}' has been closed.")
 
         elif action == 'reopen':
             # Re-open a closed poll
             if poll.status == 'closed':
-                poll.status = 'active'
                 # You MUST set a new end date
-                poll.end_time = timezone.now() + timedelta(days=1) # e.g., reopen for 1 day
-                poll.save()
+                reopen_poll(poll, end_time=timezone.now() + timedelta(days=1)) # e.g., reopen for 1 day
+                logger.info('Poll %s reopened by %s', poll.id, request.user.username)
                 messages.warning(request, f"Poll '{poll.title}' has been reopened and will close in 24 hours.")
 
     return redirect('poll_management')
 
 @login_required
+@conditional_page(etag_func=poll_management_etag)
 def poll_management_view(request):
     """Manage polls - Landing page for view_admin users"""
     if not request.user.is_admin():
@@ -895,7 +948,7 @@ def poll_management_view(request):
     status_filter = request.GET.get('status', '')
     sort_by = request.GET.get('sort', '-created_at')
 
-    polls = Poll.objects.all()
+    polls = Poll.objects.select_related('result_snapshot')
 
     if search_query:
         polls = polls.filter(
@@ -920,6 +973,18 @@ def poll_management_view(request):
 
     return render(request, 'admin/poll_management.html', context)
 
+
+def metrics_view(request):
+    """Prometheus scrape endpoint - admins, or a scraper holding METRICS_TOKEN"""
+    token = settings.VOTING_SETTINGS.get('METRICS_TOKEN')
+    authorization = request.headers.get('Authorization', '')
+    has_token = bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+
+    if not has_token and not (request.user.is_authenticated and request.user.is_admin()):
+        return HttpResponseForbidden('Access denied')
+
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # ==================== AJAX Views ====================
 
 @csrf_exempt
@@ -940,23 +1005,15 @@ def resend_otp_view(request):
         if recent_otps >= 3:
             return JsonResponse({'success': False, 'message': 'Too many OTP requests. Please wait.'})
 
+        if not CustomUser.objects.filter(phone_key=phone_key(phone_number)).exists():
+            return JsonResponse({'success': False, 'message': 'User not found'})
+
         # Generate new OTP using Chinguisoft
         success, otp_or_error = send_sms_otp(phone_number)
 
         if success:
-            try:
-                user = CustomUser.objects.get(phone_number=phone_number)
-                user.otp_code = otp_or_error
-                user.otp_created_at = timezone.now()
-                user.save()
-
-                # Log OTP request
-                OTPLog.objects.create(phone_number=phone_number, otp_code=otp_or_error)
-
-                return JsonResponse({'success': True, 'message': 'OTP sent successfully'})
-
-            except CustomUser.DoesNotExist:
-                return JsonResponse({'success': False, 'message': 'User not found'})
+            store_otp(phone_number, otp_or_error)
+            return JsonResponse({'success': True, 'message': 'OTP sent successfully'})
         else:
             return JsonResponse({'success': False, 'message': f'Failed to send OTP: {otp_or_error}'})
 
@@ -977,18 +1034,18 @@ def resend_verification_view(request):
             return render(request, 'registration/resend_verification.html')
 
         # Format phone number
-        from .utils import format_mauritanian_phone
-        formatted_phone = format_mauritanian_phone(phone_number)
+        key = phone_key(phone_number)
 
-        if not formatted_phone:
+        if key is None:
             messages.error(request, 'يرجى إدخال رقم هاتف موريتاني صحيح')
             return render(request, 'registration/resend_verification.html')
 
-        full_phone_number = f"+222{formatted_phone}"
+        formatted_phone = str(key)
+        full_phone_number = canonical_phone_number(key)
 
         try:
             # Check if user exists and is not verified
-            user = CustomUser.objects.get(phone_number=full_phone_number, user_type='user')
+            user = CustomUser.objects.get(phone_key=key, user_type='user')
 
             if user.is_phone_verified:
                 messages.info(request, 'هذا الرقم مؤكد بالفعل. يمكنك تسجيل الدخول')
@@ -1008,11 +1065,7 @@ def resend_verification_view(request):
             success, otp_or_error = send_sms_otp(full_phone_number)
 
             if success:
-                user.otp_code = otp_or_error
-                user.otp_created_at = timezone.now()
-                user.save()
-
-                OTPLog.objects.create(phone_number=full_phone_number, otp_code=otp_or_error)
+                store_otp(full_phone_number, otp_or_error)
 
                 request.session['registration_phone'] = full_phone_number
                 messages.success(request, f'تم إرسال رمز التحقق إلى {formatted_phone}')
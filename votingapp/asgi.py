@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'votingapp.settings')
+# Route the read-heavy pages to the native async views
+os.environ.setdefault('VOTING_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -43,10 +43,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'voting.middleware.MetricsMiddleware',
+    'voting.middleware.AdmissionControlMiddleware',
+    'voting.middleware.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'voting.middleware.ThrottleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -55,7 +59,7 @@ ROOT_URLCONF = 'votingapp.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'voting.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,6 +89,11 @@ DATABASES = {
 # Custom User Model
 AUTH_USER_MODEL = 'voting.CustomUser'  # Replace 'voting_app' with your app name
 
+# Phone number login for regular users, username login for admins
+AUTHENTICATION_BACKENDS = [
+    'voting.backends.PhoneOrUsernameBackend',
+]
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -151,8 +160,12 @@ SMS_SENDER_ID = 'VotingApp'
 # TWILIO_PHONE_NUMBER = '+1234567890'
 
 # Session Configuration
+# Sessions live in the shared cache and are only written to the database on
+# login/logout (see voting/sessions.py); expiry is renewed lazily
+SESSION_ENGINE = 'voting.sessions'
+SESSION_CACHE_ALIAS = 'shared'
 SESSION_COOKIE_AGE = 86400  # 24 hours
-SESSION_SAVE_EVERY_REQUEST = True
+SESSION_SAVE_EVERY_REQUEST = False
 
 # Message Framework
 from django.contrib.messages import constants as messages
@@ -165,14 +178,37 @@ MESSAGE_TAGS = {
 }
 
 # Logging Configuration
+# Handlers named 'app' and 'queries' only enqueue records; a background
+# thread per handler writes them as JSON lines to size-rotated files. They
+# are built with '()' rather than 'class': from Python 3.12 on, dictConfig
+# treats any QueueHandler 'class' as the stdlib one and rejects these options
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'voting.log.JsonFormatter',
+        },
+        'message_only': {
+            'format': '%(message)s',
+        },
+    },
     'handlers': {
-        'file': {
+        'app': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            '()': 'voting.log.QueueLogHandler',
             'filename': BASE_DIR / 'logs/voting_app.log',
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 5,
+            'formatter': 'json',
+        },
+        'queries': {
+            'level': 'WARNING',
+            '()': 'voting.log.QueueLogHandler',
+            'filename': BASE_DIR / 'logs/queries.jsonl',
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 2,
+            'formatter': 'message_only',
         },
         'console': {
             'level': 'DEBUG',
@@ -180,10 +216,15 @@ LOGGING = {
         },
     },
     'loggers': {
-        'voting_app': {
-            'handlers': ['file', 'console'],
+        'voting': {
+            'handlers': ['app', 'console'] if DEBUG else ['app'],
             'level': 'INFO',
-            'propagate': True,
+            'propagate': False,
+        },
+        'voting.queries': {
+            'handlers': ['queries'],
+            'level': 'WARNING',
+            'propagate': False,
         },
     },
 }
@@ -192,11 +233,32 @@ LOGGING = {
 os.makedirs(BASE_DIR / 'logs', exist_ok=True)
 
 # Cache Configuration (for rate limiting)
+# 'shared' is visible to every worker process; swap it for Redis/Memcached
+# when the deployment has one
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
-    }
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Token buckets of voting/throttle.py; needs atomic incr()/add(). Set
+    # VOTING_REDIS_URL whenever more than one worker process serves the
+    # site, otherwise every process throttles on its own buckets; with
+    # DEBUG off the local memory fallback needs VOTING_THROTTLE_LOCAL_MEMORY=1
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['VOTING_REDIS_URL'],
+        'KEY_PREFIX': 'voting',
+    } if os.environ.get('VOTING_REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+    },
 }
 
 # Security Settings (for production)
@@ -217,6 +279,52 @@ VOTING_SETTINGS = {
     'MAX_OTP_REQUESTS_PER_HOUR': 5,
     'VOTE_RESULTS_VISIBLE_AFTER_VOTING': True,
     'ALLOW_POLL_RESULTS_BEFORE_END': False,  # Set to True if you want users to see live results
+    'SESSION_REFRESH_THRESHOLD_SECONDS': 43200,  # Renew session expiry when less than 12h remain
+    'VOTE_INGESTION_MODE': 'direct',  # 'batched' groups concurrent votes into one transaction
+    'VOTE_BATCH_WINDOW_MS': 10,
+    'VOTE_BATCH_MAX_SIZE': 500,
+    'VOTE_BATCH_TIMEOUT_SECONDS': 10,
+    # Idempotency keys of vote submissions (voting/idempotency.py): how long a
+    # retry gets the stored outcome, and how long a running submission holds its key
+    'IDEMPOTENCY_TTL_SECONDS': 86400,
+    'IDEMPOTENCY_PENDING_SECONDS': 30,
+    # Serve the read-heavy pages with voting/async_views.py (set by asgi.py)
+    'ASYNC_VIEWS': os.environ.get('VOTING_ASYNC_VIEWS') == '1',
+    # Bearer token that lets a Prometheus scraper read /vote-admin/metrics/
+    'METRICS_TOKEN': os.environ.get('VOTING_METRICS_TOKEN'),
+    # Slow/repeated query log (logs/queries.jsonl); trace every request in DEBUG
+    'QUERY_INSPECTOR_SAMPLE_RATE': 1.0 if DEBUG else 0.01,
+    'SLOW_QUERY_MS': 100,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    # Move votes of polls closed longer than this to ArchivedVote (archive_votes)
+    'ARCHIVE_AFTER_DAYS': 90,
+    'ARCHIVE_CHUNK_SIZE': 500,
+    # purge_expired: OTP log retention and the batching of its deletes
+    'OTP_LOG_RETENTION_HOURS': 24,
+    'PURGE_BATCH_SIZE': 500,
+    'PURGE_PAUSE_SECONDS': 0.1,
+    # Admission control: requests in flight per worker (0 disables), the share
+    # of it open to normal and to low-priority (admin listing/PDF) requests,
+    # and the base Retry-After of a 503
+    'ADMISSION_MAX_IN_FLIGHT': 32,
+    'ADMISSION_NORMAL_SHARE': 0.75,
+    'ADMISSION_LOW_SHARE': 0.25,
+    'ADMISSION_RETRY_AFTER_SECONDS': 2,
+    # Allow the throttle's local memory cache with DEBUG off (one worker process only)
+    'THROTTLE_LOCAL_MEMORY': os.environ.get('VOTING_THROTTLE_LOCAL_MEMORY') == '1',
+    # Per-view token buckets in the shared cache (voting/throttle.py): requests
+    # per client IP and per account, limited to `methods` when given. IP rates
+    # stay loose because mobile carriers put many members behind one address
+    'THROTTLE_RATES': {
+        'login': {'methods': ['POST'], 'ip': '120/m', 'account': '10/m'},
+        'register': {'methods': ['POST'], 'ip': '30/m', 'account': '5/m'},
+        'verify_otp': {'methods': ['POST'], 'ip': '120/m', 'account': '10/m'},
+        'resend_otp': {'methods': ['POST'], 'ip': '30/m', 'account': '3/m'},
+        'resend_verification': {'methods': ['POST'], 'ip': '30/m', 'account': '3/m'},
+        'poll_detail': {'ip': '600/m', 'account': '30/m'},
+        'poll_results': {'ip': '600/m', 'account': '60/m'},
+        'poll_turnout': {'ip': '600/m', 'account': '60/m'},
+    },
 }
 
 LOGIN_URL = '/'